@@ -0,0 +1,59 @@
+'''
+Re-extracts the Dirac points of every Dirac-tracking run from the raw sweeps (utils.extract_dirac) and
+writes <run>.dirac.csv next to each run file, all files of all folders share one pool of worker processes.
+
+The recorded DIRAC_V_* values are the live argmin(|I|) on the gate grid; the tables here add a sub-grid
+parabola fit, optional smoothing, the forward / reverse midpoint and the hysteresis. Runs recorded before
+the reverse Dirac point was fixed in the GUI (the 2026-02 and 2026-03-02 folders store the reverse point
+without the half-sweep offset) get the correct reverse values this way.
+
+    python reextract_dirac.py                                   # every folder in DATA_DIR
+    python reextract_dirac.py "../data_pcb_smu/2026-03-18 w1d06 dirac-tracking pyrene-capped pos-neg-ctrl" --smooth 3
+    python reextract_dirac.py --chunk-rows 10000                # files read in chunks, for recordings larger than memory
+'''
+
+import glob
+import os
+import time
+
+import utils
+
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+DATA_DIR = "../data_pcb_smu" # relative to this script
+PROCESSES = None              # worker processes, None uses one per CPU core
+SMOOTH = utils.DIRAC_OPTIONS["smooth"]
+FIT_POINTS = utils.DIRAC_OPTIONS["fit_points"]
+CHUNK_ROWS = None             # lines per chunk, None reads every file at once
+
+
+def reextract(folders, processes=PROCESSES, smooth=SMOOTH, fit_points=FIT_POINTS, chunk_rows=CHUNK_ROWS):
+    paths = [path for folder in folders for path in utils.dirac_tracking_files(folder)]
+    if not paths:
+        print("No Dirac-tracking files found")
+        return []
+    print(f"Re-extracting {len(paths)} files from {len(folders)} folders")
+    start = time.time()
+    outputs = utils.reextract_files(paths, processes, chunk_rows=chunk_rows, smooth=smooth, fit_points=fit_points)
+    written = [output for output in outputs if output is not None]
+    print(f"Wrote {len(written)} Dirac tables in {time.time() - start:.1f} s")
+    return written
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Re-extract Dirac points of Dirac-tracking runs")
+    parser.add_argument("folders", nargs="*", help="experiment folders, all folders of DATA_DIR by default")
+    parser.add_argument("--processes", type=int, default=PROCESSES, help="worker processes, 1 runs in this process")
+    parser.add_argument("--smooth", type=int, default=SMOOTH, help="moving average of |I| in points, 1 = none")
+    parser.add_argument("--fit-points", type=int, default=FIT_POINTS, help="points of the sub-grid parabola fit, 0 = grid minimum")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="read files this many lines at a time")
+    args = parser.parse_args()
+
+    folders = [os.path.abspath(folder) for folder in args.folders] # before the chdir, relative to the caller
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    folders = folders or sorted(folder for folder in glob.glob(os.path.join(DATA_DIR, "*")) if os.path.isdir(folder))
+    reextract(folders, args.processes, args.smooth, args.fit_points, args.chunk_rows)
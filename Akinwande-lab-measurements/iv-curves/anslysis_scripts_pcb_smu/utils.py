@@ -0,0 +1,958 @@
+'''
+Readers for the pcb_smu Dirac-tracking CSVs (smu-16-diractracking-code-live-plot-v1.py).
+
+A Dirac-tracking file interleaves two kinds of rows under one header:
+    sample rows: SWEEP_IDX, POINT, TIME, V_GATE, I_CH0..15               (forward then reverse half-sweep)
+    Dirac rows:  20 empty cells, DIRAC_SWEEP_IDX, DIRAC_V_FWD_CH0..15, DIRAC_V_REV_CH0..15
+                 (written when a sweep is complete, right after its last sample row)
+
+The notebooks read the whole file with pd.read_csv and filter it. DiracTrackingFile instead scans the
+file once, keeps a byte-offset index of every sweep and Dirac row (cached with data_cache, so the scan
+happens once per file version), and then seeks straight to the rows it is asked for:
+
+    import utils
+    run = utils.DiracTrackingFile("../data_pcb_smu/<folder>/analyte1-w1d06-1a.csv")
+    dirac_rows = run.dirac_rows()             # like df[df["DIRAC_SWEEP_IDX"].notna()], with TIME_FROM_PREV
+    sweep_df = run.sweep(3)                   # like df[df["SWEEP_IDX"] == 3]
+    last_df = run.last_complete_sweep()       # the last sweep that got its Dirac row
+
+For whole-file work parse_dirac_tracking reads everything in one pass into two typed arrays instead of
+one 53-column DataFrame that is mostly NaN (load_dirac_tracking is the same through the data_cache):
+
+    samples, dirac = utils.load_dirac_tracking(path)
+    samples["sweep"], samples["t"], samples["vg"], samples["currents"]     # currents: (rows, 16), A
+    dirac["sweep"], dirac["t"], dirac["fwd"], dirac["rev"]                 # t: TIME of the row before
+
+ExperimentFolder opens a whole run folder (files named like the protocol runner saves them) and keeps a
+summary of every file in the data_cache, so re-opening a folder does not parse anything:
+
+    experiment = utils.ExperimentFolder("../data_pcb_smu/2026-03-18 w1d06 dirac-tracking pyrene-capped pos-neg-ctrl")
+    experiment.summary                                   # one row per file: step, conc_molar, n_sweeps, final Dirac points, ...
+    fwd_dps_analyte, rev_dps_analyte = experiment.final_dirac("analyte")   # (files, channels), as in the notebook
+
+The live Dirac points are argmin(|I|) on the gate grid of every half-sweep. extract_dirac recomputes them
+offline from the raw sweeps (smoothing, sub-grid parabola fit, forward / reverse midpoint and hysteresis),
+vectorized over all sweeps and channels; reextract_folder does it for every file of a folder:
+
+    vg, currents, sweep_ids, times = utils.sweep_array(samples, dirac)   # (sweeps, 2, points), (sweeps, 2, channels, points)
+    dirac_points = utils.extract_dirac(vg, currents, smooth=5, fit_points=7)
+    utils.reextract_folder(folder)     # writes <run>.dirac.csv next to every run file
+
+Time-sweep recordings (POINT_IDX, TIME, V_GATE, I_CH0..15, DI/DT0..15) are processed in chunks of rows by
+DriftEngine, memory stays bounded however long the recording is:
+
+    stats = utils.drift_summary(path, window_seconds=300)     # per channel drift, cached per file version
+    for block in utils.stream_drift(path, window_seconds=300): # per-sample traces, chunk by chunk
+        plt.plot(block["t"], block["didt_smooth"][:, ch])
+
+For recordings larger than memory every log format is read through iter_blocks, chunk_rows rows at a time in one
+common block shape (samples blocks: sweep_idx, point, t, vg, currents; Dirac blocks: sweep_idx, t, fwd, rev), and
+the Dirac, drift and noise analyses run on it incrementally, so peak memory is set by the chunk size:
+
+    for block in utils.iter_blocks(path, chunk_rows=10_000): ...
+    utils.reextract_file(path, chunk_rows=10_000)              # stream_dirac, same table as the in-memory version
+    noise = utils.noise_summary(path, window_seconds=300)     # per channel noise around the moving average
+'''
+
+import io
+import itertools
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+# data_cache.py lives at the repository root
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", ".."))
+try:
+    import data_cache
+except ImportError:
+    data_cache = None
+
+
+# index of a Dirac-tracking file, one row per sweep:
+#   sweep_idx, first byte and end byte of its sample rows, number of sample rows,
+#   first and end byte of its Dirac row (-1 if the sweep has none), first byte of the row before the Dirac row
+INDEX_COLUMNS = ["sweep_idx", "start", "end", "n_rows", "dirac_start", "dirac_end", "prev_start"]
+
+
+def build_sweep_index(path):
+    '''
+    One streaming pass over a Dirac-tracking CSV, returns the index (int64 array, columns INDEX_COLUMNS).
+    A last line without newline (file still being written) is left out.
+    '''
+    index = []
+    with open(path, "rb") as f:
+        offset = len(f.readline()) # header
+        prev_start = -1
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            if line.startswith(b","):
+                # Dirac row, belongs to the sweep right before it
+                if not index or index[-1][4] != -1:
+                    index.append([-1, offset, offset, 0, -1, -1, -1])
+                index[-1][4:7] = [offset, offset + len(line), prev_start]
+            else:
+                sweep_idx = int(line[:line.index(b",")])
+                if not index or index[-1][0] != sweep_idx or index[-1][4] != -1:
+                    index.append([sweep_idx, offset, offset, 0, -1, -1, -1])
+                index[-1][2] = offset + len(line)
+                index[-1][3] += 1
+            prev_start = offset
+            offset += len(line)
+    return np.array(index, dtype=np.int64).reshape(-1, len(INDEX_COLUMNS))
+
+
+def sweep_index(path):
+    '''build_sweep_index through the data_cache, rebuilt only when the file changes'''
+    if data_cache is None:
+        return build_sweep_index(path)
+    return data_cache.cached_array(path, build_sweep_index, "pcb_smu.build_sweep_index", mmap=False)
+
+
+def sample_dtype(num_channels=16):
+    return np.dtype([("sweep", np.int32), ("point", np.int32), ("t", np.float64), ("vg", np.float64),
+                     ("currents", np.float64, (num_channels,))])
+
+
+def dirac_dtype(num_channels=16):
+    return np.dtype([("sweep", np.int32), ("t", np.float64), ("fwd", np.float64, (num_channels,)),
+                     ("rev", np.float64, (num_channels,))])
+
+
+def parse_dirac_tracking(path):
+    '''
+    Reads a Dirac-tracking CSV in one pass
+
+    Returns:
+        samples: structured array, one record per sample row, fields sweep, point, t, vg, currents (rows, channels)
+        dirac: structured array, one record per Dirac row, fields sweep, fwd, rev (rows, channels) and t, the TIME
+               of the row before it (NaN if that is not a sample row), as TIME_FROM_PREV in the notebooks
+    A last line without newline (file still being written) is left out.
+    '''
+    with open(path, "rb") as f:
+        header = f.readline().decode().strip().split(",")
+        lines = f.read().split(b"\n")[:-1] # the last piece is empty, or a partly written line
+    return parse_dirac_lines(lines, header.index("DIRAC_SWEEP_IDX"))
+
+
+def parse_dirac_lines(lines, num_sample_columns, prev_t=np.nan):
+    '''
+    parse_dirac_tracking of some lines of a Dirac-tracking file (without newlines), for reading a file in pieces
+
+    num_sample_columns: columns of the sample rows (the header position of DIRAC_SWEEP_IDX)
+    prev_t: TIME of the line before lines[0] if that is a sample row, NaN otherwise (header, Dirac row)
+    '''
+    num_channels = num_sample_columns - 4
+    is_dirac = np.array([line[:1] == b"," for line in lines], dtype=bool)
+    sample_lines = [line for line, dirac_line in zip(lines, is_dirac) if not dirac_line]
+    values = np.loadtxt(sample_lines, delimiter=",", ndmin=2) if sample_lines else np.empty((0, num_sample_columns))
+    samples = np.empty(len(values), dtype=sample_dtype(num_channels))
+    samples["sweep"] = values[:, 0]
+    samples["point"] = values[:, 1]
+    samples["t"] = values[:, 2]
+    samples["vg"] = values[:, 3]
+    samples["currents"] = values[:, 4:]
+
+    # Dirac rows are rare (one per sweep) and can have empty cells, parsed one by one
+    dirac_idx = np.flatnonzero(is_dirac)
+    dirac = np.empty(len(dirac_idx), dtype=dirac_dtype(num_channels))
+    for i, line_idx in enumerate(dirac_idx):
+        fields = [float(x) if x else np.nan for x in lines[line_idx].rstrip(b"\r").split(b",")[num_sample_columns:]]
+        dirac[i]["sweep"] = fields[0]
+        dirac[i]["fwd"] = fields[1:1 + num_channels]
+        dirac[i]["rev"] = fields[1 + num_channels:1 + 2 * num_channels]
+
+    # time from the previous row: the sample row just before, NaN if it is a Dirac row
+    sample_pos = np.cumsum(~is_dirac) - 1 # position in samples of the latest sample row at every line
+    prev_line = dirac_idx - 1
+    prev_is_sample = (prev_line >= 0) & ~is_dirac[prev_line]
+    dirac["t"] = np.nan
+    dirac["t"][prev_is_sample] = samples["t"][sample_pos[prev_line[prev_is_sample]]]
+    dirac["t"][prev_line < 0] = prev_t
+    return samples, dirac
+
+
+def load_dirac_tracking(path):
+    '''parse_dirac_tracking through the data_cache: parsed once per file version, later calls return read-only memory maps'''
+    if data_cache is None or not data_cache.ENABLED:
+        return parse_dirac_tracking(path)
+    parsed = {}
+
+    def part(name):
+        def parser(path):
+            if not parsed:
+                parsed["samples"], parsed["dirac"] = parse_dirac_tracking(path) # one pass fills both entries
+            return parsed[name]
+        return parser
+    samples = data_cache.cached_array(path, part("samples"), "pcb_smu.parse_dirac_tracking.samples")
+    dirac = data_cache.cached_array(path, part("dirac"), "pcb_smu.parse_dirac_tracking.dirac")
+    return samples, dirac
+
+
+class DiracTrackingFile():
+    def __init__(self, path):
+        '''
+        Indexed reader of one Dirac-tracking CSV, see the module docstring
+
+        Parameters:
+            path: path of the CSV
+        '''
+        self.path = path
+        with open(path) as f:
+            self.columns = f.readline().strip().split(",")
+        self.num_sample_columns = self.columns.index("DIRAC_SWEEP_IDX")
+        self.sample_columns = self.columns[:self.num_sample_columns]
+        self.dirac_columns = self.columns[self.num_sample_columns:]
+        self.index = sweep_index(path)
+
+    @property
+    def sweeps(self):
+        '''Sweep indices that have sample rows'''
+        return self.index[self.index[:, 3] > 0, 0]
+
+    @property
+    def complete_sweeps(self):
+        '''Sweep indices that have both sample rows and a Dirac row'''
+        return self.index[(self.index[:, 3] > 0) & (self.index[:, 4] >= 0), 0]
+
+    def read_bytes(self, f, start, end):
+        f.seek(start)
+        return f.read(end - start)
+
+    def dirac_rows(self):
+        '''
+        All Dirac rows as a DataFrame with the columns DIRAC_SWEEP_IDX, DIRAC_V_FWD_CH*, DIRAC_V_REV_CH* and
+        TIME_FROM_PREV (TIME of the row before, the end of the sweep), as built in the notebooks
+        '''
+        rows = self.index[self.index[:, 4] >= 0]
+        values = np.full((len(rows), len(self.dirac_columns)), np.nan)
+        times = np.full(len(rows), np.nan)
+        with open(self.path, "rb") as f:
+            for i, (sweep_idx, start, end, n_rows, dirac_start, dirac_end, prev_start) in enumerate(rows):
+                fields = self.read_bytes(f, dirac_start, dirac_end).rstrip(b"\r\n").split(b",")[self.num_sample_columns:]
+                values[i] = [float(x) if x else np.nan for x in fields]
+                if prev_start >= 0:
+                    prev_fields = self.read_bytes(f, prev_start, dirac_start).split(b",")
+                    times[i] = float(prev_fields[2]) if prev_fields[2] else np.nan
+        df = pd.DataFrame(values, columns=self.dirac_columns)
+        df["TIME_FROM_PREV"] = times
+        return df
+
+    def sweep(self, sweep_idx):
+        '''Sample rows of one sweep as a DataFrame (columns SWEEP_IDX, POINT, TIME, V_GATE, I_CH*), forward then reverse'''
+        rows = self.index[(self.index[:, 0] == sweep_idx) & (self.index[:, 3] > 0)]
+        if not len(rows):
+            raise KeyError(f"{self.path} has no sweep {sweep_idx}")
+        with open(self.path, "rb") as f:
+            data = b"".join(self.read_bytes(f, start, end) for start, end in rows[:, 1:3])
+        values = np.loadtxt(io.BytesIO(data), delimiter=",", ndmin=2)
+        return pd.DataFrame(values, columns=self.sample_columns)
+
+    def last_complete_sweep(self):
+        '''The last sweep that has a Dirac row, i.e. was not cut off by stopping the run'''
+        complete = self.complete_sweeps
+        if not len(complete):
+            raise KeyError(f"{self.path} has no complete sweep")
+        return self.sweep(complete[-1])
+
+
+# -----------------------------
+# Experiment folders
+# -----------------------------
+# "<step><index>-<device>-<label>.csv", e.g. analyte3-w1d06-10f.csv, func2-w2d12-pbase-oligo.csv,
+# timesweep-w2d12-well2.csv; the protocol runner appends -2, -3, ... to reruns of a phase
+# (no "." in the label, so derived tables such as analyte3-w1d06-10f.dirac.csv are not taken for runs)
+FILE_PATTERN = re.compile(r"(?P<step>[A-Za-z]+)(?P<index>\d*)-(?P<device>w\d+d\d+)-(?P<label>[^.]+?)(?:-(?P<rerun>\d+))?\.csv$")
+CONC_PATTERN = re.compile(r"(?P<value>\d+(?:\.\d+)?)(?P<prefix>[afpnum])M?$")
+PREFIX_EXPONENTS = {"a": -18, "f": -15, "p": -12, "n": -9, "u": -6, "m": -3}
+
+
+def parse_filename(filename):
+    '''
+    Fields of a run file name as a dict (step, index, device, label, rerun, conc_molar), None if it does not follow the convention.
+    index is None for steps without a number (e.g. timesweep), conc_molar is None if the label is not a concentration (1a = 1 aM).
+    '''
+    match = FILE_PATTERN.match(filename)
+    if not match:
+        return None
+    conc = CONC_PATTERN.match(match["label"])
+    return {
+        "step": match["step"],
+        "index": int(match["index"]) if match["index"] else None,
+        "device": match["device"],
+        "label": match["label"],
+        "rerun": int(match["rerun"]) if match["rerun"] else 1,
+        "conc_molar": float(conc["value"]) * 10.0 ** PREFIX_EXPONENTS[conc["prefix"]] if conc else None,
+    }
+
+
+def summary_dtype(num_channels=16):
+    return np.dtype([("n_sweeps", np.int32), ("duration", np.float64), ("fwd", np.float64, (num_channels,)),
+                     ("rev", np.float64, (num_channels,))])
+
+
+def summarize_dirac_tracking(path):
+    '''
+    Summary of one Dirac-tracking file as a one-record structured array:
+    n_sweeps (Dirac rows), duration (s, first to last sample), fwd / rev (the last Dirac row, NaN if there is none)
+    '''
+    samples, dirac = parse_dirac_tracking(path)
+    num_channels = samples.dtype["currents"].shape[0]
+    summary = np.zeros(1, dtype=summary_dtype(num_channels))
+    summary["n_sweeps"] = len(dirac)
+    summary["duration"] = samples["t"][-1] - samples["t"][0] if len(samples) else 0
+    summary["fwd"] = dirac["fwd"][-1] if len(dirac) else np.nan
+    summary["rev"] = dirac["rev"][-1] if len(dirac) else np.nan
+    return summary
+
+
+def file_summary(path):
+    '''summarize_dirac_tracking through the data_cache, module level so process pools can run it'''
+    if data_cache is None:
+        return summarize_dirac_tracking(path)
+    return data_cache.cached_array(path, summarize_dirac_tracking, "pcb_smu.summarize_dirac_tracking", mmap=False)
+
+
+def is_cached_summary(path):
+    if data_cache is None or not data_cache.ENABLED:
+        return False
+    key = data_cache.cache_key(path, "pcb_smu.summarize_dirac_tracking", {})
+    return os.path.exists(os.path.join(data_cache.CACHE_DIR, key + ".npy"))
+
+
+def is_dirac_tracking(path):
+    with open(path) as f:
+        return "DIRAC_SWEEP_IDX" in f.readline().split(",")
+
+
+class ExperimentFolder():
+    def __init__(self, folder, processes=None):
+        '''
+        All runs of one experiment folder (e.g. "2026-03-18 w1d06 dirac-tracking pyrene-capped pos-neg-ctrl").
+        Dirac-tracking files are summarized in parallel worker processes, summaries are cached per file version.
+
+        Parameters:
+            folder: path of the folder
+            processes: number of worker processes for files without a cached summary, 1 parses in this process
+        '''
+        self.folder = folder
+        self.files = [] # parse_filename dicts plus filename and path, sorted by step, index and rerun
+        for filename in sorted(os.listdir(folder)):
+            fields = parse_filename(filename)
+            path = os.path.join(folder, filename)
+            if fields is None or not os.path.isfile(path):
+                if filename.endswith(".csv") and not filename.endswith(DIRAC_TABLE_SUFFIX):
+                    print("Skipped filename", filename)
+                continue
+            self.files.append({"filename": filename, "path": path, **fields})
+        self.files.sort(key=lambda file: (file["step"], file["index"] or 0, file["rerun"]))
+        self.summary = self.load_summaries(processes)
+
+    def load_summaries(self, processes=None):
+        '''
+        One row per Dirac-tracking file: filename, step, index, device, label, rerun, conc_molar, n_sweeps,
+        duration_s, DIRAC_V_FWD_CH*, DIRAC_V_REV_CH* (the last Dirac point of every channel)
+        '''
+        paths = [file["path"] for file in self.files if is_dirac_tracking(file["path"])]
+        to_parse = [path for path in paths if not is_cached_summary(path)]
+        if len(to_parse) > 1 and processes != 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=processes or min(len(to_parse), os.cpu_count() or 1)) as pool:
+                parsed = dict(zip(to_parse, pool.map(file_summary, to_parse)))
+        else:
+            parsed = {}
+
+        rows = []
+        for file in self.files:
+            if file["path"] not in paths:
+                continue
+            summary = parsed.get(file["path"])
+            summary = (summary if summary is not None else file_summary(file["path"]))[0]
+            row = {key: file[key] for key in ("filename", "step", "index", "device", "label", "rerun", "conc_molar")}
+            row.update(n_sweeps=int(summary["n_sweeps"]), duration_s=float(summary["duration"]))
+            row.update({f"DIRAC_V_FWD_CH{ch}": v for ch, v in enumerate(summary["fwd"])})
+            row.update({f"DIRAC_V_REV_CH{ch}": v for ch, v in enumerate(summary["rev"])})
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def step_files(self, step):
+        '''Summary rows of one step type ("analyte", "func", ...), in measurement order'''
+        return self.summary[self.summary["step"] == step]
+
+    def final_dirac(self, step, channels=None):
+        '''
+        Last Dirac point of every file of a step, like fwd_dps_analyte / rev_dps_analyte in the analyte-detection notebook
+
+        Returns:
+            fwd, rev: arrays x: file (in order), y: channel
+        Parameters:
+            step: "analyte", "func", ...
+            channels: channels to return, all by default
+        '''
+        rows = self.step_files(step)
+        fwd = rows.filter(like="DIRAC_V_FWD_CH").to_numpy()
+        rev = rows.filter(like="DIRAC_V_REV_CH").to_numpy()
+        if channels is not None:
+            fwd, rev = fwd[:, channels], rev[:, channels]
+        return fwd, rev
+
+    def run(self, filename):
+        '''DiracTrackingFile of one file of the folder'''
+        return DiracTrackingFile(os.path.join(self.folder, filename))
+
+
+# -----------------------------
+# Offline Dirac extraction
+# -----------------------------
+DIRAC_OPTIONS = {"smooth": 1, "fit_points": 5} # default extract_dirac settings of reextract_file / reextract_folder
+DIRAC_TABLE_SUFFIX = ".dirac.csv"
+
+
+def sweep_array(samples, dirac=None):
+    '''
+    Every sweep of a parsed Dirac-tracking file as dense arrays, the first half of a sweep's rows is the forward,
+    the second half the reverse half-sweep (as in the live DiracExtractor). Shorter half-sweeps are NaN padded.
+
+    Returns:
+        vg: gate voltages, shape (sweeps, 2, points), x: sweep, y: direction (0 fwd, 1 rev), z: point in measurement order
+        currents: shape (sweeps, 2, channels, points)
+        sweep_ids: SWEEP_IDX of every sweep
+        times: TIME of the last sample of every sweep
+    Parameters:
+        samples, dirac: from parse_dirac_tracking / load_dirac_tracking. If dirac is given only sweeps with a
+                        Dirac row (completed sweeps) are kept, otherwise all
+    '''
+    keep = np.isin(samples["sweep"], dirac["sweep"]) if dirac is not None else np.ones(len(samples), dtype=bool)
+    samples = samples[keep]
+    sweep_ids, first, counts = np.unique(samples["sweep"], return_index=True, return_counts=True)
+    num_channels = samples.dtype["currents"].shape[0]
+    num_points = int((counts - counts // 2).max()) if len(counts) else 0
+
+    group = np.repeat(np.arange(len(sweep_ids)), counts)
+    position = np.arange(len(samples)) - np.repeat(first, counts) # row within its sweep
+    half = (counts // 2)[group]
+    direction = (position >= half).astype(int)
+    point = position - half * direction
+
+    vg = np.full((len(sweep_ids), 2, num_points), np.nan)
+    currents = np.full((len(sweep_ids), 2, num_channels, num_points), np.nan)
+    vg[group, direction, point] = samples["vg"]
+    currents[group, direction, :, point] = samples["currents"]
+    times = samples["t"][first + counts - 1] if len(counts) else np.empty(0)
+    return vg, currents, sweep_ids, times
+
+
+def moving_average(y, window):
+    '''Centered moving average along the last axis ignoring NaN, windows are cut at the ends, NaN stays NaN'''
+    if window <= 1:
+        return y
+    pad = window // 2
+    valid = np.isfinite(y)
+    widths = [(0, 0)] * (y.ndim - 1) + [(pad + 1, pad)]
+    sums = np.cumsum(np.pad(np.where(valid, y, 0), widths), axis=-1)
+    counts = np.cumsum(np.pad(valid, widths), axis=-1)
+    window = 2 * pad + 1
+    with np.errstate(all="ignore"):
+        averaged = (sums[..., window:] - sums[..., :-window]) / (counts[..., window:] - counts[..., :-window])
+    return np.where(valid, averaged, np.nan)
+
+
+def parabola_vertex(x, y, center):
+    '''
+    Vertex of least-squares parabolas through the points of x, y (last axis, NaN points left out), batched.
+    NaN where fewer than 3 points or the parabola opens downward. x is shifted by center for conditioning.
+    '''
+    valid = np.isfinite(x) & np.isfinite(y)
+    dx = np.where(valid, x - center[..., None], 0)
+    y = np.where(valid, y, 0)
+    moments = [np.sum(valid * dx**k, axis=-1) for k in range(5)]
+    M = np.stack([np.stack(moments[i:i+3], axis=-1) for i in range(3)], axis=-2) # normal equations, (..., 3, 3)
+    rhs = np.stack([np.sum(y * dx**k, axis=-1) for k in range(3)], axis=-1)
+    enough = valid.sum(axis=-1) >= 3
+    M[~enough] = np.eye(3) # keeps solve defined, those fits are dropped below
+    with np.errstate(all="ignore"):
+        c0, c1, c2 = np.moveaxis(np.linalg.solve(M, rhs[..., None])[..., 0], -1, 0) # y = c0 + c1 dx + c2 dx^2
+        vertex = center - c1 / (2 * c2)
+    return np.where(enough & (c2 > 0), vertex, np.nan)
+
+
+def extract_dirac(vg, currents, smooth=1, fit_points=5):
+    '''
+    Dirac points (gate voltage of minimum |I|) of every sweep, direction and channel at once
+
+    Returns:
+        dict of arrays (sweeps, channels):
+            fwd, rev: Dirac point of the forward / reverse half-sweep
+            mid: (fwd + rev) / 2, the Dirac point with the sweep direction hysteresis averaged out
+            hysteresis: rev - fwd
+            fwd_grid, rev_grid: the plain argmin(|I|) on the gate grid, what the live extractor records
+    Parameters:
+        vg, currents: from sweep_array
+        smooth: points of the moving average applied to |I| before searching the minimum, 1 = none
+        fit_points: points around the minimum a parabola is fitted to for a sub-grid Dirac point,
+                    below 3 the grid minimum is returned. Falls back to the grid minimum where the fit fails
+                    and is limited to the span of the fitted points.
+    '''
+    abs_i = moving_average(np.abs(currents), smooth) # (sweeps, 2, channels, points)
+    vg = np.broadcast_to(vg[:, :, None, :], abs_i.shape)
+    has_data = np.isfinite(abs_i).any(axis=-1)
+    idx = np.where(np.isfinite(abs_i), abs_i, np.inf).argmin(axis=-1)
+    grid = np.where(has_data, np.take_along_axis(vg, idx[..., None], axis=-1)[..., 0], np.nan)
+
+    dirac = grid
+    if fit_points >= 3:
+        offsets = np.arange(fit_points) - fit_points // 2
+        window = np.clip(idx[..., None] + offsets, 0, abs_i.shape[-1] - 1)
+        inside = (idx[..., None] + offsets >= 0) & (idx[..., None] + offsets < abs_i.shape[-1])
+        x = np.where(inside, np.take_along_axis(vg, window, axis=-1), np.nan)
+        y = np.where(inside, np.take_along_axis(abs_i, window, axis=-1), np.nan)
+        vertex = parabola_vertex(x, y, grid)
+        with np.errstate(all="ignore"):
+            in_span = (vertex >= np.nanmin(x, axis=-1)) & (vertex <= np.nanmax(x, axis=-1))
+        dirac = np.where(in_span, vertex, grid)
+
+    fwd, rev = dirac[:, 0], dirac[:, 1]
+    return {"fwd": fwd, "rev": rev, "mid": (fwd + rev) / 2, "hysteresis": rev - fwd,
+            "fwd_grid": grid[:, 0], "rev_grid": grid[:, 1]}
+
+
+def dirac_table_path(path):
+    return os.path.splitext(path)[0] + DIRAC_TABLE_SUFFIX
+
+
+def reextract_file(path, chunk_rows=None, **options):
+    '''
+    Re-extracts the Dirac points of every completed sweep of one Dirac-tracking file and writes them to
+    <run>.dirac.csv next to it: SWEEP_IDX, TIME, DIRAC_V_FWD_CH*, DIRAC_V_REV_CH*, DIRAC_V_MID_CH*, HYSTERESIS_CH*
+    (TIME is the end of the sweep, like TIME_FROM_PREV). Returns the path of the table.
+
+    chunk_rows: read the file chunk_rows lines at a time (stream_dirac), for recordings too large to load at once
+    options: extract_dirac settings, DIRAC_OPTIONS by default
+    '''
+    options = {**DIRAC_OPTIONS, **options}
+    if chunk_rows is None:
+        samples, dirac = load_dirac_tracking(path)
+        vg, currents, sweep_ids, times = sweep_array(samples, dirac)
+        blocks = [{"sweep_ids": sweep_ids, "times": times, **extract_dirac(vg, currents, **options)}]
+    else:
+        blocks = stream_dirac(path, chunk_rows, **options)
+
+    with open(path, errors="replace") as f:
+        num_channels = f.readline().strip().split(",").index("DIRAC_SWEEP_IDX") - 4
+    names = [("DIRAC_V_FWD_CH", "fwd"), ("DIRAC_V_REV_CH", "rev"), ("DIRAC_V_MID_CH", "mid"), ("HYSTERESIS_CH", "hysteresis")]
+    header = ["SWEEP_IDX", "TIME"] + [f"{prefix}{ch}" for prefix, _ in names for ch in range(num_channels)]
+    output = dirac_table_path(path)
+    with open(output, "w") as f:
+        f.write(",".join(header) + "\n")
+        for block in blocks: # the table is written as the sweeps come, only one block is in memory
+            table = np.column_stack([block["sweep_ids"], block["times"]] + [block[key] for _, key in names])
+            np.savetxt(f, table, delimiter=",", fmt="%.10g")
+    return output
+
+
+def dirac_tracking_files(folder):
+    '''Paths of the Dirac-tracking runs in a folder (derived .dirac.csv tables left out), sorted by name'''
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+            if name.endswith(".csv") and not name.endswith(DIRAC_TABLE_SUFFIX) and is_dirac_tracking(os.path.join(folder, name))]
+
+
+def reextract_files(paths, processes=None, **options):
+    '''
+    reextract_file for many files (e.g. every run of many folders) in one pool of worker processes
+
+    Returns:
+        list of the written tables, None for files that could not be read (the error is printed)
+    Parameters:
+        paths: Dirac-tracking CSVs
+        processes: number of worker processes, 1 runs everything in this process
+        options: extract_dirac settings
+    '''
+    import functools
+
+    worker = functools.partial(reextract_file_or_none, **options)
+    if processes == 1 or len(paths) <= 1:
+        return [worker(path) for path in paths]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=processes or min(len(paths), os.cpu_count() or 1)) as pool:
+        return list(pool.map(worker, paths, chunksize=max(1, len(paths) // (8 * (os.cpu_count() or 1)))))
+
+
+def reextract_file_or_none(path, **options):
+    try:
+        return reextract_file(path, **options)
+    except (OSError, ValueError) as e:
+        print(f"Could not re-extract {path}: {e}")
+        return None
+
+
+def reextract_folder(folder, processes=None, **options):
+    '''reextract_files for every Dirac-tracking run of a folder'''
+    return reextract_files(dirac_tracking_files(folder), processes, **options)
+
+
+# -----------------------------
+# Streaming drift analysis
+# -----------------------------
+CHUNK_ROWS = 10_000 # rows per chunk of the streaming readers, ~3 MB of values for a 16-channel time sweep
+
+
+def iter_csv_chunks(path, chunk_rows=CHUNK_ROWS):
+    '''
+    Reads a CSV with only numeric rows (time sweeps, single voltage sweeps) chunk_rows rows at a time
+
+    Returns:
+        generator of (columns, values), columns the header names, values a 2D array (rows, columns).
+        A last line without newline (file still being written) is left out.
+    '''
+    with open(path) as f:
+        columns = f.readline().strip().split(",")
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if lines and not lines[-1].endswith("\n"):
+                lines.pop()
+            if not lines:
+                return
+            yield columns, np.loadtxt(lines, delimiter=",", ndmin=2)
+
+
+def mean_sample_interval(path, column="TIME"):
+    '''
+    Mean interval of a CSV's time column, (last - first) / (rows - 1) like np.mean(np.diff(df.TIME)), without parsing
+    the file: the first and last rows are read directly, the rows are counted in 1 MB blocks. 1 for files with less than two rows.
+    '''
+    with open(path, "rb") as f:
+        columns = f.readline().decode().strip().split(",")
+        first = f.readline()
+        rows = 1 + sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 20), b""))
+        # the last complete line, a trailing partial line (file still being written) is not counted
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        f.seek(max(0, end - (1 << 16)))
+        tail = f.read()
+    if not first.endswith(b"\n") or rows < 2:
+        return 1
+    last = tail[:tail.rindex(b"\n")].rsplit(b"\n", 1)[-1]
+    index = columns.index(column)
+    return (float(last.split(b",")[index]) - float(first.split(b",")[index])) / (rows - 1)
+
+
+LOG_FORMATS = {"SWEEP_IDX": "dirac_tracking", "POINT_IDX": "time_sweep", "POINT": "voltage_sweep"} # first header column -> format
+
+
+def log_format(path):
+    '''Format of a pcb_smu log from its header: "dirac_tracking", "time_sweep", "voltage_sweep", None for other files'''
+    with open(path, errors="replace") as f:
+        return LOG_FORMATS.get(f.readline().split(",", 1)[0].strip())
+
+
+def iter_dirac_tracking_chunks(path, chunk_rows=CHUNK_ROWS):
+    '''
+    parse_dirac_tracking chunk_rows lines at a time, generator of (samples, dirac) structured arrays.
+    TIME_FROM_PREV of a Dirac row at the start of a chunk is carried over from the chunk before.
+    '''
+    with open(path, "rb") as f:
+        num_sample_columns = f.readline().decode().strip().split(",").index("DIRAC_SWEEP_IDX")
+        prev_t = np.nan
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if lines and not lines[-1].endswith(b"\n"):
+                lines.pop()
+            if not lines:
+                return
+            lines = [line[:-1] for line in lines]
+            samples, dirac = parse_dirac_lines(lines, num_sample_columns, prev_t)
+            prev_t = np.nan if lines[-1][:1] == b"," else samples["t"][-1]
+            yield samples, dirac
+
+
+def iter_blocks(path, chunk_rows=CHUNK_ROWS):
+    '''
+    Reads any pcb_smu log (Dirac tracking, time sweep, single voltage sweep) chunk_rows rows at a time, peak memory
+    is set by chunk_rows and not by the length of the recording. Every format gives the same blocks (dicts with the
+    fields of smu_pipeline.Block):
+        kind="samples": sweep_idx, point, t, vg (n,) and currents (n, channels) in the units of the file (A, µA in
+                        time sweeps), sweep_idx is 0 in the formats without sweeps
+        kind="dirac":   sweep_idx, t (m,) and fwd, rev (m, channels), the Dirac rows of a Dirac-tracking file (t as
+                        TIME_FROM_PREV), yielded after the samples block of the same chunk
+    Raises ValueError for files that are not pcb_smu logs.
+    '''
+    fmt = log_format(path)
+    if fmt is None:
+        raise ValueError(f"{path} is not a pcb_smu log")
+    if fmt == "dirac_tracking":
+        for samples, dirac in iter_dirac_tracking_chunks(path, chunk_rows):
+            if len(samples):
+                yield {"kind": "samples", "sweep_idx": samples["sweep"], "point": samples["point"], "t": samples["t"],
+                       "vg": samples["vg"], "currents": samples["currents"]}
+            if len(dirac):
+                yield {"kind": "dirac", "sweep_idx": dirac["sweep"], "t": dirac["t"], "fwd": dirac["fwd"], "rev": dirac["rev"]}
+        return
+    for columns, values in iter_csv_chunks(path, chunk_rows):
+        channels = [i for i, name in enumerate(columns) if name.startswith("I_CH")]
+        yield {"kind": "samples", "sweep_idx": np.zeros(len(values), dtype=np.int32), "point": values[:, 0].astype(np.int32),
+               "t": values[:, columns.index("TIME")], "vg": values[:, columns.index("V_GATE")], "currents": values[:, channels]}
+
+
+def stream_dirac(path, chunk_rows=CHUNK_ROWS, **options):
+    '''
+    extract_dirac of a Dirac-tracking file read chunk by chunk, yields a dict (sweep_ids, times and the extract_dirac
+    arrays) for the sweeps completed in every chunk, the same values as sweep_array + extract_dirac on the whole file.
+    Samples are only kept until the Dirac row of their sweep arrives, memory is set by chunk_rows and the sweep length.
+
+    options: extract_dirac settings, DIRAC_OPTIONS by default
+    '''
+    options = {**DIRAC_OPTIONS, **options}
+    held = None # samples of the sweeps still running
+    for samples, dirac in iter_dirac_tracking_chunks(path, chunk_rows):
+        held = samples if held is None else np.concatenate([held, samples])
+        if not len(dirac):
+            continue
+        # sweeps up to the last Dirac row are done, those without a Dirac row are dropped like in sweep_array
+        done = held["sweep"] <= dirac["sweep"].max()
+        vg, currents, sweep_ids, times = sweep_array(held[done], dirac)
+        held = held[~done]
+        if len(sweep_ids):
+            yield {"sweep_ids": sweep_ids, "times": times, **extract_dirac(vg, currents, **options)}
+
+
+class DriftEngine():
+    def __init__(self, window_samples, num_channels):
+        '''
+        Streaming drift analysis of multi-channel current recordings, fed chunk by chunk (feed) and closed with finish()
+
+        Per sample (blocks returned by feed / finish): dI/dt (backward difference, 0 for the first sample and for dt <= 0,
+        like the GUI's DI/DT columns) and centered moving averages of current and dI/dt over window_samples, NaN where
+        the window is not complete (pandas rolling(window, center=True).mean()). Blocks come out (window_samples-1)//2
+        samples behind the input because of the centered window.
+
+        Per channel (summary): min, max, percent drift (max - min) / max as in current_time_drift_analysis, and the
+        least-squares linear drift rate of the current.
+
+        Parameters:
+            window_samples: samples of the moving averages
+            num_channels: number of current channels
+        '''
+        self.window = max(int(window_samples), 1)
+        self.lookahead = (self.window - 1) // 2
+        self.num_channels = num_channels
+        # kept channel major (rows: current channels then dI/dt channels, columns: samples), the moving sums run along rows
+        self.history = np.empty((2 * num_channels, 0)) # last window-1 samples, for the moving sums
+        self.pending_t = np.empty(0)                     # samples waiting for the rest of their window
+        self.pending = np.empty((2 * num_channels, 0))
+        self.prev_t = None
+        self.prev_i = None
+        self.count = 0
+        self.t0 = None
+        # running sums for the summary, times relative to t0
+        self.i_min = np.full(num_channels, np.inf)
+        self.i_max = np.full(num_channels, -np.inf)
+        self.sums = {name: np.zeros(num_channels) for name in ("t", "t2", "i", "ti")}
+        self.max_abs_didt_smooth = np.zeros(num_channels)
+
+    def feed(self, t, currents):
+        '''
+        Adds samples, t: (n,), currents: (n, channels)
+        Returns the block of samples whose window is complete now: dict t, current, didt, current_smooth, didt_smooth
+        '''
+        t = np.asarray(t, dtype=float)
+        currents = np.asarray(currents, dtype=float)
+        if not len(t):
+            return self.block(np.empty(0), self.pending[:, :0], self.pending[:, :0])
+
+        # dI/dt, carrying the last sample of the previous chunk
+        prev_t = t[:1] if self.prev_t is None else [self.prev_t]
+        prev_i = currents[:1] if self.prev_i is None else self.prev_i[None, :]
+        dt = np.diff(np.concatenate([prev_t, t]))[:, None]
+        di = np.diff(np.concatenate([prev_i, currents]), axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            didt = np.where(dt > 0, di / dt, 0.0)
+        self.prev_t, self.prev_i = t[-1], currents[-1]
+        values = np.vstack([currents.T, didt.T]) # (2 * channels, n)
+
+        # trailing moving sums over history + new samples; the trailing mean ending at sample j is the centered mean of sample j - lookahead
+        n, h, w = len(t), self.history.shape[1], self.window
+        extended = np.hstack([self.history, values])
+        cumsum = np.zeros((extended.shape[0], extended.shape[1] + 1))
+        np.cumsum(extended, axis=1, out=cumsum[:, 1:])
+        first = max(h, w - 1) # first column of extended whose window is complete
+        smooth = np.full(values.shape, np.nan)
+        if first < h + n:
+            smooth[:, first - h:] = (cumsum[:, first + 1:] - cumsum[:, first + 1 - w:h + n + 1 - w]) / w
+        self.history = extended[:, max(0, extended.shape[1] - (w - 1)):]
+
+        self.update_summary(t, currents)
+        self.count += n
+
+        # emit every sample but the last lookahead ones, their windows need samples that have not arrived yet
+        all_t = np.concatenate([self.pending_t, t])
+        all_values = np.hstack([self.pending, values])
+        n_out = max(0, len(all_t) - self.lookahead)
+        self.pending_t, self.pending = all_t[n_out:], all_values[:, n_out:]
+        return self.block(all_t[:n_out], all_values[:, :n_out], smooth[:, n - n_out:])
+
+    def finish(self):
+        '''The last samples, their windows run past the end of the recording so the averages are NaN'''
+        block = self.block(self.pending_t, self.pending, np.full(self.pending.shape, np.nan))
+        self.pending_t, self.pending = np.empty(0), self.pending[:, :0]
+        return block
+
+    def block(self, t, values, smooth):
+        C = self.num_channels
+        if smooth.shape[1]:
+            with np.errstate(invalid="ignore"):
+                self.max_abs_didt_smooth = np.fmax(self.max_abs_didt_smooth, np.nanmax(np.abs(smooth[C:]), axis=1, initial=0))
+        return {"t": t, "current": values[:C].T, "didt": values[C:].T, "current_smooth": smooth[:C].T, "didt_smooth": smooth[C:].T}
+
+    def update_summary(self, t, currents):
+        if self.t0 is None:
+            self.t0 = t[0]
+        dt = (t - self.t0)[:, None]
+        self.i_min = np.fmin(self.i_min, currents.min(axis=0))
+        self.i_max = np.fmax(self.i_max, currents.max(axis=0))
+        self.sums["t"] += dt.sum()
+        self.sums["t2"] += (dt**2).sum()
+        self.sums["i"] += currents.sum(axis=0)
+        self.sums["ti"] += (dt * currents).sum(axis=0)
+
+    def summary(self):
+        '''
+        Per channel drift of everything fed so far, dict of arrays (channels,):
+            min, max, percent_drift: 100 * (max - min) / max
+            drift_rate: slope of the linear fit of current vs time (current units per s)
+            drift_rate_percent_per_hour: drift_rate relative to the mean current, in % per hour
+            max_abs_didt_smooth: largest magnitude of the smoothed dI/dt
+        '''
+        n = self.count
+        with np.errstate(all="ignore"):
+            slope = (n * self.sums["ti"] - self.sums["t"] * self.sums["i"]) / (n * self.sums["t2"] - self.sums["t"]**2)
+            mean = self.sums["i"] / n
+            return {
+                "min": self.i_min,
+                "max": self.i_max,
+                "percent_drift": 100 * (self.i_max - self.i_min) / self.i_max,
+                "drift_rate": slope,
+                "drift_rate_percent_per_hour": 100 * 3600 * slope / mean,
+                "max_abs_didt_smooth": self.max_abs_didt_smooth,
+            }
+
+
+def stream_drift(path, window_seconds=300, chunk_rows=CHUNK_ROWS, engine=None):
+    '''
+    Runs a time-sweep (or single voltage sweep) CSV through a DriftEngine chunk by chunk, yields the engine's per-sample blocks
+
+    The moving average window is int(window_seconds / dt) samples as in current_time_drift_analysis, with dt the
+    mean sample interval of the whole file (mean_sample_interval), so the result does not depend on chunk_rows.
+    Pass engine=[] to get the DriftEngine back as engine[0] (for its summary after the last block).
+    '''
+    drift = None
+    for block in iter_blocks(path, chunk_rows):
+        if block["kind"] != "samples":
+            continue
+        if drift is None:
+            drift = DriftEngine(int(window_seconds / mean_sample_interval(path)), block["currents"].shape[1])
+            if engine is not None:
+                engine.append(drift)
+        yield drift.feed(block["t"], block["currents"])
+    if drift is not None:
+        yield drift.finish()
+
+
+def drift_stats(path, window_seconds=300, chunk_rows=CHUNK_ROWS):
+    '''DriftEngine.summary of a whole file as a structured array (one record per channel), reading it in one streaming pass'''
+    engine = []
+    for block in stream_drift(path, window_seconds, chunk_rows, engine):
+        pass
+    if not engine:
+        raise ValueError(f"{path} has no samples")
+    summary = engine[0].summary()
+    stats = np.zeros(engine[0].num_channels, dtype=[(name, np.float64) for name in summary])
+    for name, values in summary.items():
+        stats[name] = values
+    return stats
+
+
+def drift_summary(path, window_seconds=300, chunk_rows=CHUNK_ROWS):
+    '''
+    Per channel drift of a time-sweep recording as a DataFrame (index: channel), see DriftEngine.summary.
+    Cached in the data_cache per file version and window, so repeated calls do not read the file.
+    '''
+    if data_cache is None:
+        stats = drift_stats(path, window_seconds, chunk_rows)
+    else:
+        stats = data_cache.cached_array(path, drift_stats, "pcb_smu.drift_stats", mmap=False,
+                                        window_seconds=window_seconds, chunk_rows=chunk_rows)
+    df = pd.DataFrame(stats)
+    df.index.name = "channel"
+    return df
+
+
+class NoiseEngine():
+    def __init__(self, num_channels):
+        '''
+        Streaming read noise of multi-channel current recordings, fed the DriftEngine blocks of a recording in order
+
+        Per channel (summary):
+            rms: RMS of current - current_smooth, the noise left around the moving average (samples with a complete window)
+            diff_rms: standard deviation of successive differences / sqrt(2), the white noise level, insensitive to slow drift
+        '''
+        self.num_channels = num_channels
+        self.prev = None
+        self.residual_sq = np.zeros(num_channels)
+        self.residual_n = np.zeros(num_channels)
+        self.diff_sum = np.zeros(num_channels)
+        self.diff_sq = np.zeros(num_channels)
+        self.diff_n = 0
+
+    def feed(self, block):
+        currents = block["current"]
+        if not len(currents):
+            return
+        residual = currents - block["current_smooth"]
+        valid = np.isfinite(residual)
+        self.residual_sq += (np.where(valid, residual, 0)**2).sum(axis=0)
+        self.residual_n += valid.sum(axis=0)
+        diffs = np.diff(currents if self.prev is None else np.vstack([self.prev, currents]), axis=0)
+        self.diff_sum += diffs.sum(axis=0)
+        self.diff_sq += (diffs**2).sum(axis=0)
+        self.diff_n += len(diffs)
+        self.prev = currents[-1:]
+
+    def summary(self):
+        m = self.diff_n
+        with np.errstate(all="ignore"):
+            diff_var = (self.diff_sq - self.diff_sum**2 / m) / (m - 1)
+            return {"rms": np.sqrt(self.residual_sq / self.residual_n), "diff_rms": np.sqrt(np.maximum(diff_var, 0) / 2)}
+
+
+def noise_stats(path, window_seconds=300, chunk_rows=CHUNK_ROWS):
+    '''NoiseEngine.summary of a whole file as a structured array (one record per channel), reading it in one streaming pass'''
+    noise = None
+    for block in stream_drift(path, window_seconds, chunk_rows):
+        if noise is None:
+            noise = NoiseEngine(block["current"].shape[1])
+        noise.feed(block)
+    if noise is None:
+        raise ValueError(f"{path} has no samples")
+    summary = noise.summary()
+    stats = np.zeros(noise.num_channels, dtype=[(name, np.float64) for name in summary])
+    for name, values in summary.items():
+        stats[name] = values
+    return stats
+
+
+def noise_summary(path, window_seconds=300, chunk_rows=CHUNK_ROWS):
+    '''
+    Per channel noise of a time-sweep recording as a DataFrame (index: channel), see NoiseEngine.
+    Cached in the data_cache per file version and window like drift_summary.
+    '''
+    if data_cache is None:
+        stats = noise_stats(path, window_seconds, chunk_rows)
+    else:
+        stats = data_cache.cached_array(path, noise_stats, "pcb_smu.noise_stats", mmap=False,
+                                        window_seconds=window_seconds, chunk_rows=chunk_rows)
+    df = pd.DataFrame(stats)
+    df.index.name = "channel"
+    return df
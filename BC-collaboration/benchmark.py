@@ -0,0 +1,131 @@
+'''
+Benchmarks of the Dataset pipeline on synthetic wells (synthetic.py) of growing size.
+
+For every device count a synthetic well is written to a temporary folder, then timed (best of --repeat):
+    load            Dataset(...), parsing the 13 files
+    derived         first access of every cached derived quantity (conductances, derivatives, dirac, ...)
+    <metric>        each of the twelve *_analysis methods (pooled curve_fit)
+    fit_hill_batch  per-device hill fits of the dirac shift, all devices at once
+    curve_fit_loop  the same fits with one curve_fit per device (only up to CURVE_FIT_LOOP_MAX devices)
+    device_analysis per-device analysis of the dirac shift
+
+The data and result caches are switched off so the real work is timed.
+
+    python benchmark.py
+    python benchmark.py --devices 4 40 400 --repeat 5 --output bench.csv
+'''
+
+import os
+
+# timings of the real work, not of cache hits; has to be set before utils / data_cache are imported
+os.environ["GFET_DATA_CACHE"] = "off"
+
+import io
+import sys
+import time
+import tempfile
+import warnings
+import contextlib
+
+import numpy as np
+from scipy.optimize import curve_fit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import utils
+import synthetic
+
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+DEVICE_COUNTS = [4, 40, 400, 4000, 10000]
+NUM_CONCS = 10
+NUM_POINTS = 76
+REPEAT = 3
+CURVE_FIT_LOOP_MAX = 400  # the per-device curve_fit loop is skipped above this many devices
+
+
+def best_time(func, repeat):
+    '''Best wall time of repeat calls (s) and the last result, None as result if func raised'''
+    best = np.inf
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            result = func()
+        except (RuntimeError, ValueError):
+            result = None
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def curve_fit_loop(data_array_2D):
+    concs = np.arange(data_array_2D.shape[0])
+    for dev_num in range(data_array_2D.shape[1]):
+        try:
+            curve_fit(utils.hill_function, concs, data_array_2D[:, dev_num])
+        except RuntimeError:
+            pass
+
+
+def benchmark_size(num_devices, repeat=REPEAT, num_concs=NUM_CONCS, num_points=NUM_POINTS):
+    '''Timings of one well size as a list of (step, seconds, note)'''
+    rows = []
+    with tempfile.TemporaryDirectory() as root:
+        args = synthetic.make_well(root, num_devices=num_devices, num_concs=num_concs, num_points=num_points)
+        cwd = os.getcwd()
+        os.chdir(root) # Dataset reads data/<file> relative to the working directory
+        try:
+            t, dataset = best_time(lambda: utils.Dataset(*args), repeat)
+            rows.append(("load", t, ""))
+
+            def derived():
+                dataset.invalidate()
+                for name in utils.cached_names(utils.Dataset):
+                    getattr(dataset, name)
+            rows.append(("derived", best_time(derived, repeat)[0], ""))
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                for metric in utils.METRICS:
+                    t, result = best_time(getattr(dataset, metric), repeat)
+                    rows.append((metric, t, "" if result is not None else "fit failed"))
+
+                shifts = dataset.adj_dirac_voltages
+                t, (coeffs, converged) = best_time(lambda: utils.fit_hill_batch(np.arange(num_concs), shifts), repeat)
+                rows.append(("fit_hill_batch", t, f"{converged.mean():.0%} converged"))
+                if num_devices <= CURVE_FIT_LOOP_MAX:
+                    rows.append(("curve_fit_loop", best_time(lambda: curve_fit_loop(shifts), repeat)[0], ""))
+                rows.append(("device_analysis", best_time(lambda: dataset.device_analysis(shifts), repeat)[0], ""))
+        finally:
+            os.chdir(cwd)
+    return rows
+
+
+def run_benchmarks(device_counts=DEVICE_COUNTS, repeat=REPEAT, output=None):
+    warnings.simplefilter("ignore") # overflow warnings of poor fits
+    results = []
+    for num_devices in device_counts:
+        print(f"\n{num_devices} devices x {NUM_CONCS} concentrations x {NUM_POINTS} gate voltages")
+        for step, t, note in benchmark_size(num_devices, repeat):
+            print(f"  {step:48s} {t*1e3:10.2f} ms  {note}")
+            results.append((num_devices, step, t, note))
+
+    if output:
+        import csv
+        with open(output, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["num_devices", "step", "seconds", "note"])
+            writer.writerows(results)
+        print(f"\nWrote {output}")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark Dataset on synthetic wells")
+    parser.add_argument("--devices", type=int, nargs="+", default=DEVICE_COUNTS, help="device counts to run")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="best of this many runs")
+    parser.add_argument("--output", help="also write the timings to this CSV")
+    args = parser.parse_args()
+    run_benchmarks(args.devices, args.repeat, args.output)
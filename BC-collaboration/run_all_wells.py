@@ -0,0 +1,144 @@
+'''
+Runs the analysis of every BC-collaboration well in one go and writes one results table.
+
+Wells are discovered in data/*/ by the file naming of the BC data:
+    BCdata_B48C13_<analyte>_<conc>.txt      one file per concentration, e.g. _1ag, _100fg, _1ng
+    BCdata_B48C13_<analyte>_aptamers.txt
+    BCdata_B48C13_<analyte>_initialDirac.txt
+    BCdata_B48C13_<analyte>_linker.txt
+Concentrations are sorted by value (ag < fg < pg < ng < ug < mg). Folders that do not follow this
+naming (e.g. Xue_data_Na, which has no initialDirac / linker sweeps) are skipped with a message.
+
+Every well is analyzed with Dataset.analyze_all_metrics (the twelve *_analysis variants), wells run in
+parallel worker processes. The output CSV has one row per (well, metric):
+    well, analyte, num_devices, num_concs, metric, S, LOD, LOQ, r2, r2_linear, A, K, n, b,
+    LOD_g_per_ml (LOD converted from concentration steps to g/ml, assuming decade steps from the lowest concentration)
+
+    python run_all_wells.py
+    python run_all_wells.py --processes 1 --output results.csv
+'''
+
+import os
+import re
+import glob
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import utils
+
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+DATA_DIR = "data"                              # relative to this script, utils.load_data_file reads from here
+OUTPUT_FILE = "analysis_results_all_wells.csv" # relative to this script
+PROCESSES = None                               # worker processes, None uses one per CPU core
+
+FILE_PATTERN = re.compile(r"BCdata_B48C13_(?P<analyte>.+)_(?P<label>[^_]+)\.txt$")
+CONC_PATTERN = re.compile(r"(?P<value>\d+(?:\.\d+)?)(?P<unit>ag|fg|pg|ng|ug|mg)$")
+UNIT_EXPONENTS = {"ag": -18, "fg": -15, "pg": -12, "ng": -9, "ug": -6, "mg": -3}
+STAGE_LABELS = ("aptamers", "initialDirac", "linker")
+
+
+def conc_g_per_ml(label):
+    '''Concentration of a file label such as "100fg" in g/ml, None if the label is not a concentration'''
+    match = CONC_PATTERN.match(label)
+    if not match:
+        return None
+    return float(match["value"]) * 10.0 ** UNIT_EXPONENTS[match["unit"]]
+
+
+def discover_wells(data_dir=DATA_DIR):
+    '''
+    Finds all wells in data_dir
+
+    Returns:
+        list of dicts with well (folder name), analyte, concs (g/ml, sorted), filenames, apt_filename,
+        id_filename, linker_filename; filenames are relative to data_dir like Dataset expects
+    '''
+    wells = []
+    for folder in sorted(glob.glob(os.path.join(data_dir, "*"))):
+        if not os.path.isdir(folder):
+            continue
+        well = os.path.basename(folder)
+        by_analyte = {}
+        for path in glob.glob(os.path.join(folder, "*.txt")):
+            match = FILE_PATTERN.match(os.path.basename(path))
+            if match:
+                by_analyte.setdefault(match["analyte"], {})[match["label"]] = f"{well}/{os.path.basename(path)}"
+        if not by_analyte:
+            print(f"Skipping {well}: no BCdata_B48C13_<analyte>_<conc>.txt files")
+            continue
+
+        for analyte, files in sorted(by_analyte.items()):
+            missing = [label for label in STAGE_LABELS if label not in files]
+            concs = sorted((conc_g_per_ml(label), name) for label, name in files.items() if conc_g_per_ml(label) is not None)
+            if missing or not concs:
+                print(f"Skipping {well} ({analyte}): missing {', '.join(missing) or 'concentration files'}")
+                continue
+            wells.append({
+                "well": well,
+                "analyte": analyte,
+                "concs": [conc for conc, _ in concs],
+                "filenames": [name for _, name in concs],
+                "apt_filename": files["aptamers"],
+                "id_filename": files["initialDirac"],
+                "linker_filename": files["linker"],
+            })
+    return wells
+
+
+def analyze_well(well):
+    '''All twelve metrics of one well as a DataFrame, runs in a worker process'''
+    warnings.simplefilter("ignore") # overflow warnings of poor fits would flood the console
+    dataset = utils.Dataset(well["filenames"], well["apt_filename"], well["id_filename"], well["linker_filename"])
+    results = dataset.analyze_all_metrics(processes=1).reset_index()
+
+    # LOD is in concentration steps, steps are decades from the lowest concentration if the files are spaced that way
+    log_concs = np.log10(well["concs"])
+    decades = np.allclose(np.diff(log_concs), 1)
+    results["LOD_g_per_ml"] = 10 ** (log_concs[0] + results["LOD"]) if decades else np.nan
+
+    results.insert(0, "num_concs", dataset.num_concs)
+    results.insert(0, "num_devices", dataset.num_devices)
+    results.insert(0, "analyte", well["analyte"])
+    results.insert(0, "well", well["well"])
+    return results
+
+
+def run_all_wells(output_file=OUTPUT_FILE, processes=PROCESSES, data_dir=DATA_DIR):
+    '''Analyzes every well found in data_dir and writes the consolidated table to output_file, returns the table'''
+    wells = discover_wells(data_dir)
+    if not wells:
+        print(f"No wells found in {data_dir}")
+        return None
+    print(f"Analyzing {len(wells)} wells: {', '.join(well['well'] for well in wells)}")
+
+    start = time.time()
+    if processes == 1:
+        tables = [analyze_well(well) for well in wells]
+    else:
+        with ProcessPoolExecutor(max_workers=processes or min(len(wells), os.cpu_count() or 1)) as pool:
+            tables = list(pool.map(analyze_well, wells))
+
+    results = pd.concat(tables, ignore_index=True)
+    results.to_csv(output_file, index=False)
+    print(f"Wrote {len(results)} rows to {output_file} in {time.time() - start:.1f} s")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Analyze all BC-collaboration wells")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="results CSV, relative to this script")
+    parser.add_argument("--processes", type=int, default=PROCESSES, help="worker processes, 1 runs in this process")
+    args = parser.parse_args()
+
+    # utils.load_data_file reads data/<well>/<file> relative to the working directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    run_all_wells(args.output, args.processes)
@@ -0,0 +1,89 @@
+'''
+Synthetic GFET wells in the exact file layout Dataset reads, for benchmarks and for checking the analysis
+on data with a known answer.
+
+A well is written to <root>/data/<folder>/ as
+    BCdata_B48C13_<analyte>_<conc>.txt    one per concentration (1ag, 10ag, ... in decades)
+    BCdata_B48C13_<analyte>_aptamers.txt
+    BCdata_B48C13_<analyte>_initialDirac.txt   (coarser gate grid, like the measured files)
+    BCdata_B48C13_<analyte>_linker.txt
+tab separated, first column gate voltage, one resistance column (Ohm) per device.
+
+Device model: the resistance of a GFET peaks at its Dirac voltage,
+    R(vg) = R_contact + R_channel / sqrt(1 + ((vg - V_dirac) / width)^2)
+with device to device spread of every parameter. The Dirac voltage of concentration i is
+    V_dirac = V_dirac_aptamer + hill_function(i, shift, K, n, 0)
+so the true hill coefficients of the dirac shift are known. Every point gets relative read noise and a
+fraction of points are outliers (spikes of several times the noise).
+
+    import synthetic
+    args = synthetic.make_well('/tmp/bench', num_devices=100)
+    os.chdir('/tmp/bench'); dataset = utils.Dataset(*args)
+'''
+
+import os
+
+import numpy as np
+
+
+CONC_UNITS = ["ag", "fg", "pg", "ng", "ug", "mg"]
+
+
+def conc_labels(num_concs):
+    '''File labels of num_concs decades starting at 1 ag/ml: 1ag, 10ag, 100ag, 1fg, ...'''
+    if num_concs > 3 * len(CONC_UNITS):
+        raise ValueError(f"at most {3 * len(CONC_UNITS)} concentration decades (1ag to 100mg)")
+    return [f"{10**(i % 3)}{CONC_UNITS[i // 3]}" for i in range(num_concs)]
+
+
+def transfer_curves(vg, dirac_v, r_contact, r_channel, width):
+    '''Resistance of every device (rows of the result) at gate voltages vg (columns)'''
+    return r_contact[:, None] + r_channel[:, None] / np.sqrt(1 + ((vg[None, :] - dirac_v[:, None]) / width[:, None])**2)
+
+
+def make_well(root, analyte="synth", num_devices=5, num_concs=10, num_points=76, v_max=1.5, seed=0,
+              dirac_shift=0.15, hill_K=4.5, hill_n=1.5, noise=2e-3, outlier_fraction=0.002, ragged=True):
+    '''
+    Writes one synthetic well and returns the Dataset arguments (filenames, apt_filename, id_filename, linker_filename)
+
+    Parameters:
+        root: folder that gets the data/ subfolder, Dataset has to be used with root as working directory
+        num_devices, num_concs, num_points: size of the well, num_points gate voltages from 0 to v_max
+        dirac_shift, hill_K, hill_n: hill curve of the dirac shift vs concentration index (A, K, n with b=0)
+        noise: relative read noise of the resistances
+        outlier_fraction: fraction of points replaced by spikes of 20x the noise
+        ragged: like the measured data, every third concentration sweep stops 5 gate steps early (1.4 V instead of 1.5 V)
+    '''
+    rng = np.random.default_rng(seed)
+    folder = f"BCdata_{analyte}"
+    os.makedirs(os.path.join(root, "data", folder), exist_ok=True)
+    prefix = f"{folder}/BCdata_B48C13_{analyte}_"
+
+    # per device parameters, spread like the measured wells
+    r_contact = rng.uniform(800, 1200, num_devices)
+    r_channel = rng.uniform(800, 1400, num_devices)
+    width = rng.uniform(0.15, 0.3, num_devices)
+    dirac_linker = rng.uniform(0.6, 0.9, num_devices)
+    dirac_aptamer = dirac_linker + rng.normal(0.05, 0.02, num_devices)
+    dirac_initial = dirac_linker - rng.normal(0.1, 0.03, num_devices)
+    shift = dirac_shift * rng.normal(1, 0.1, num_devices)
+
+    vg = np.linspace(0, v_max, num_points)
+    vg_initial = np.linspace(0, v_max, int((num_points - 1) / 2.5) + 1) # 2.5x coarser steps, like initialDirac
+
+    def write(name, grid, dirac_v):
+        R = transfer_curves(grid, dirac_v, r_contact, r_channel, width)
+        R *= 1 + noise * rng.standard_normal(R.shape)
+        outliers = rng.random(R.shape) < outlier_fraction
+        R[outliers] *= 1 + 20 * noise * rng.choice([-1, 1], outliers.sum())
+        np.savetxt(os.path.join(root, "data", prefix + name + ".txt"), np.column_stack([grid, R.T]), fmt="%.7g", delimiter="\t")
+
+    write("initialDirac", vg_initial, dirac_initial)
+    write("linker", vg, dirac_linker)
+    write("aptamers", vg, dirac_aptamer)
+    labels = conc_labels(num_concs)
+    for i, label in enumerate(labels):
+        grid = vg[:-5] if ragged and i % 3 == 2 and num_points > 10 else vg
+        write(label, grid, dirac_aptamer + shift * i**hill_n / (hill_K**hill_n + i**hill_n))
+
+    return [prefix + label + ".txt" for label in labels], prefix + "aptamers.txt", prefix + "initialDirac.txt", prefix + "linker.txt"
@@ -3,14 +3,44 @@
 import numpy as np
 import math
 import random
+import os
+import sys
+from functools import cached_property
 
 import matplotlib.pyplot as plt
 from matplotlib.ticker import ScalarFormatter, FuncFormatter
 from scipy.optimize import curve_fit
+from scipy.stats import norm
 from sklearn.metrics import r2_score
 
+# parsed-data cache shared by the whole repo (data_cache.py in the repo root), plain np.loadtxt without it
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+try:
+    import data_cache
+except ImportError:
+    data_cache = None
+
+def memoize(**options):
+    '''
+    Keeps results of a deterministic analysis on disk (data_cache.memoize), keyed by a hash of the input data
+    Does nothing without data_cache, or with GFET_RESULT_CACHE=off
+    '''
+    if data_cache is None:
+        return lambda func: func
+    return data_cache.memoize(**options)
+
+def report(result_and_details):
+    '''
+    Prints the messages of a memoized *_details method and returns its result. The warnings are kept in the cached
+    details instead of being printed in the cached body, so they show up on cache hits too.
+    '''
+    result, details = result_and_details
+    for message in details['messages']:
+        print(message)
+    return result
+
 class Dataset():
-    def __init__(self, filenames, apt_filename, id_filename, linker_filename):
+    def __init__(self, filenames, apt_filename, id_filename, linker_filename, grid=None):
         '''
         This Dataset class serves to process data for GFET data, for a single data well, including
         multiple devices per well, over the gate voltage sweeps for multiple concentrations.
@@ -18,6 +48,9 @@ class Dataset():
         Parameters:
             filenames: list of filenames that contains gate voltage sweeps, each for a single concentration
             apt_filename: the filename of the voltage sweep for the devices with only the aptamer
+            grid: None keeps every sweep on its own gate voltages (aligned by index). 'union', 'intersection'
+                  or an array of gate voltages resamples all sweeps, the initial dirac sweep included, onto one
+                  shared grid (see common_grid and resample), then voltages and id_voltages are that grid
         Returns:
             None
 
@@ -26,114 +59,236 @@ class Dataset():
             All other columns: Drain-Source Resistance for a single device. Each row shows the resistance
             experienced by each device for the gate voltage of the 1st column.
 
-        This assumes that all of the aptamer and linker data along with ALL concentrations share the same gate voltage steps.
+        Without grid, this assumes that all of the aptamer and linker data along with ALL concentrations share the same gate voltage steps.
         The initial dirac voltage does not have to have the same gate voltage steps.
         '''
+        # parse every input file exactly once, the arrays are shared by everything below
+        loaded = {} # {filename: transposed data array}, so a file passed twice is still parsed once
+        for filename in list(filenames) + [apt_filename, id_filename, linker_filename]:
+            if filename not in loaded:
+                loaded[filename] = load_data_file(filename)
+        raw_concs = [loaded[filename] for filename in filenames] # [:, [0, 1, 2, 3, 5]].T # [:, [0, 1, 2, 4]] # ONLY HERE BECAUSE WE WANT TO IGNORE FET 3
+        raw_data_apt = loaded[apt_filename]
+        raw_data_id = loaded[id_filename]
+        raw_data_linker = loaded[linker_filename]
+
         # initialize raw data and the data's basic features
         self.num_concs = len(filenames) # number of concentrations tested
-        self.num_devices = 0 # number of devices in the well at hand, set super high to start it will get smaller later
-        self.voltages = [] # list of the voltages we sweep over
-        for conc in range(self.num_concs): # calcluate the voltages list, number of voltages, and number of devices
-            raw_data = np.loadtxt('data/'+filenames[conc]).T # [:, [0, 1, 2, 3, 5]].T # [:, [0, 1, 2, 4]] # ONLY HERE BECAUSE WE WANT TO IGNORE FET 3
-            if len(raw_data[0,:]) > len(self.voltages): 
-                self.voltages = raw_data[0,:] # gets the biggest list of voltages to sweep over (some stop at 1.5V and others at 1.4V, we want 1.5)
-            self.num_devices = raw_data.shape[0] - 1
-
-        # builds resistance info
-        self.apt_resistances = {} # dictionary of lists of aptemer resistances. {device_number: resistance_list}
-        self.id_resistances = {} # dictionary of lists of initial dirac resistances. {device_number: resistance_list}
-        self.linker_resistances = {}
-        for dev_num in range(self.num_devices):
-            raw_data_apt = np.loadtxt('data/'+apt_filename).T # [:, [0, 1, 2, 3, 5]].T  # ONLY HERE BECAUSE WE WANT TO IGNORE FET 4
-            raw_data_id = np.loadtxt('data/'+id_filename).T # [:, [0, 1, 2, 3, 5]].T  # ONLY HERE BECAUSE WE WANT TO IGNORE FET 4
-            raw_data_linker = np.loadtxt('data/'+linker_filename).T # [:, [0, 1, 2, 3, 5]].T  # ONLY HERE BECAUSE WE WANT TO IGNORE FET 4
-            self.apt_resistances[dev_num] = raw_data_apt[dev_num+1]
-            # print(dev_num+1)
-            self.id_resistances[dev_num] = raw_data_id[dev_num+1]
-            self.id_voltages = raw_data_id[0]
-            self.linker_resistances[dev_num] = raw_data_linker[dev_num+1]
-            # self.id_voltages = raw_data_id[0]
-            
-        self.resistances = {}  # dictionary of dictionary of resistance list. {concentration_num: {device_number: list_of_resistances}}
-        for conc in range(self.num_concs):
-            conc_data_dic = {}
-            for dev_num in range(self.num_devices):
-                raw_data = np.loadtxt('data/'+filenames[conc]).T # [:, [0, 1, 2, 3, 5]].T # [:, [0, 1, 2, 4]] # ONLY HERE BECAUSE WE WANT TO IGNORE FET 3
-                conc_data_dic[dev_num] = raw_data[dev_num+1]
-            self.resistances[conc] = conc_data_dic
-
-        # builds resistance derivative info
-        self.resistance_derivatives = {} # dictionary of dictionary of delta resistance list. {concentration_num: {device_number: list_of_resistance_changes}}
-        for conc in range(self.num_concs):
-            conc_resistance_derivative = {}
-            for dev_num in range(self.num_devices): 
-                conc_resistance_derivative[dev_num] = [self.resistances[conc][dev_num][i] - self.resistances[conc][dev_num][i+1] for i in range(len(self.resistances[conc][dev_num])-1)]
-            self.resistance_derivatives[conc] = conc_resistance_derivative
-        self.apt_resistance_derivatives = {} # dictionary of lists of aptemer delta resistance. {device_number: list_of_resistance_changes}
-        self.id_resistance_derivatives = {} # dictionary that has the same structure as apt_resistance_derivatives, but for initial dirac sweep
-        self.linker_resistance_derivatives = {}
-        for dev_num in range(self.num_devices): 
-            self.apt_resistance_derivatives[dev_num] = [self.apt_resistances[dev_num][i] - self.apt_resistances[dev_num][i+1] for i in range(len(self.apt_resistances[dev_num])-1)]
-            self.id_resistance_derivatives[dev_num] = [self.id_resistances[dev_num][i] - self.id_resistances[dev_num][i+1] for i in range(len(self.id_resistances[dev_num])-1)]
-            self.linker_resistance_derivatives[dev_num] = [self.linker_resistances[dev_num][i] - self.linker_resistances[dev_num][i+1] for i in range(len(self.linker_resistances[dev_num])-1)]
+        self.num_devices = raw_concs[-1].shape[0] - 1 # number of devices in the well at hand
+        longest = int(np.argmax([raw.shape[1] for raw in raw_concs])) # first concentration with the most gate voltages
+        self.voltages = raw_concs[longest][0] # list of the voltages we sweep over (some stop at 1.5V and others at 1.4V, we want 1.5)
+        self.id_voltages = raw_data_id[0]
 
-        
-        # builds dirac voltage info
-        self.apt_dirac_voltages = {} # dictionary of lists for dirac voltages for the aptemer. The list enumerates the concentrations. {device_number: dirac_voltage_list}
-        self.id_dirac_voltages = {} # dictionary that has the same structure as apt_dirac_voltages, but for initial dirac sweep
-        self.linker_dirac_voltages = {}
-        for dev_num in range(self.num_devices):
-            self.apt_dirac_voltages[dev_num] = self.voltages[np.argmax(self.apt_resistances[dev_num])]
-            self.id_dirac_voltages[dev_num] = self.id_voltages[np.argmax(self.id_resistances[dev_num])]
-            self.linker_dirac_voltages[dev_num] = self.voltages[np.argmax(self.linker_resistances[dev_num])]
-        self.dirac_voltages = np.zeros((self.num_concs, self.num_devices)) # 2D array of dirac voltages. x:concentration, y: device_number
-        self.adj_dirac_voltages = np.zeros((self.num_concs, self.num_devices)) # 2D array of dirac voltage shifts (adjusted). x:concentration, y: device_number
-        for conc in range(self.num_concs):
-            for dev_num in range(self.num_devices):
-                self.dirac_voltages[conc,dev_num] = self.voltages[np.argmax(self.resistances[conc][dev_num])]
-                self.adj_dirac_voltages[conc,dev_num] = self.voltages[np.argmax(self.resistances[conc][dev_num])] - self.apt_dirac_voltages[dev_num]
-
-        # builds info about transconductance voltages, both pos and neg
-        self.apt_pos_transc_voltages = {} # dictionary of lists for positive transconductance voltages for the aptemer. The list enumerates the concentrations. {device_number: pos_transc_v_list}
-        self.apt_neg_transc_voltages = {}# dictionary of lists for negative transconductance voltages for the aptemer. The list enumerates the concentrations. {device_number: neg_transc_v_list}
-        for dev_num in range(self.num_devices):
-                self.apt_pos_transc_voltages[dev_num] = self.voltages[np.argmax(self.apt_resistance_derivatives[dev_num])]
-                self.apt_neg_transc_voltages[dev_num] = self.voltages[np.argmin(self.apt_resistance_derivatives[dev_num])]
-        self.pos_transc_voltages = np.zeros((self.num_concs, self.num_devices)) # 2D array of positive transconductance voltages. x:concentration, y: device_number
-        self.neg_transc_voltages = np.zeros((self.num_concs, self.num_devices)) # 2D array of negative transconductance voltages. x:concentration, y: device_number
-        self.adj_pos_transc_voltages = np.zeros((self.num_concs, self.num_devices)) # 2D array of positive transconductance voltage shifts (adjusted). x:concentration, y: device_number
-        self.adj_neg_transc_voltages = np.zeros((self.num_concs, self.num_devices)) # 2D array of negative transconductance voltage shifts (adjusted). x:concentration, y: device_number
-        for conc in range(self.num_concs):
-            for dev_num in range(self.num_devices):
-                self.pos_transc_voltages[conc, dev_num] = self.voltages[np.argmax(self.resistance_derivatives[conc][dev_num])]
-                self.neg_transc_voltages[conc, dev_num] = self.voltages[np.argmin(self.resistance_derivatives[conc][dev_num])]
-                self.adj_pos_transc_voltages[conc, dev_num] = self.voltages[np.argmax(self.resistance_derivatives[conc][dev_num])] - self.apt_pos_transc_voltages[dev_num]
-                self.adj_neg_transc_voltages[conc, dev_num] = self.voltages[np.argmin(self.resistance_derivatives[conc][dev_num])] - self.apt_neg_transc_voltages[dev_num]
-
-        # builds info about conductances
-        self.apt_conductances = {dev_num: 1/self.apt_resistances[dev_num] for dev_num in range(self.num_devices)} # dictionary of lists of conductances for the aptamer readings. {device_number: conductance_list}
-        self.id_conductances = {dev_num: 1/self.id_resistances[dev_num] for dev_num in range(self.num_devices)} # dictionary that has the same structure as apt_conductances, but for initial dirac sweep
-        self.linker_conductances = {dev_num: 1/self.linker_resistances[dev_num] for dev_num in range(self.num_devices)}
-        self.conductances = {} # dictionary of dictionaries of lists for conductance readings. {concentration: {device_number: conductance_list}}
-        for conc in range(self.num_concs):
-            self.conductances[conc] = [1 / self.resistances[conc][dev_num] for dev_num in range(self.num_devices)]
-
-        # builds info about conductance derivatives
-        self.conductance_derivatives = {} # dictionary of dictionary of delta conductance list. {concentration_num: {device_number: list_of_conductance_changes}}
-        for conc in range(self.num_concs):
-            conc_conductance_derivative = {}
-            for dev_num in range(self.num_devices): 
-                conc_conductance_derivative[dev_num] = [self.conductances[conc][dev_num][i] - self.conductances[conc][dev_num][i+1] for i in range(len(self.conductances[conc][dev_num])-1)]
-            self.conductance_derivatives[conc] = conc_conductance_derivative
-        self.apt_conductance_derivatives = {} # dictionary of lists of aptemer delta conductance. {device_number: list_of_conductance_changes}
-        self.id_conductance_derivatives = {} # dictionary that has the same structure as apt_conductance_derivatives, but for initial dirac sweep
-        self.linker_conductance_derivatives = {}
-        for dev_num in range(self.num_devices): 
-            self.apt_conductance_derivatives[dev_num] = [self.apt_conductances[dev_num][i] - self.apt_conductances[dev_num][i+1] for i in range(len(self.apt_conductances[dev_num])-1)]
-            self.id_conductance_derivatives[dev_num] = [self.id_conductances[dev_num][i] - self.id_conductances[dev_num][i+1] for i in range(len(self.id_conductances[dev_num])-1)]
-            self.linker_conductance_derivatives[dev_num] = [self.linker_conductances[dev_num][i] - self.linker_conductances[dev_num][i+1] for i in range(len(self.linker_conductances[dev_num])-1)]
+        # dense layout: one plane per stage, concentrations first, then aptamer, initial dirac and linker
+        self.apt_idx = self.num_concs # plane index of the aptamer sweep
+        self.id_idx = self.num_concs + 1 # plane index of the initial dirac sweep
+        self.linker_idx = self.num_concs + 2 # plane index of the linker sweep
+        stages = raw_concs + [raw_data_apt, raw_data_id, raw_data_linker]
+        self.stage_lengths = np.array([raw.shape[1] for raw in stages]) # number of valid gate voltages of every plane
+        num_points = self.stage_lengths.max()
+        self.stage_voltages = np.full((len(stages), num_points), np.nan) # 2D array of gate voltages. x: stage, y: gate voltage index, NaN padded
+        self.resistance_array = np.full((len(stages), self.num_devices, num_points), np.nan) # 3D array of resistances. x: stage, y: device_number, z: gate voltage index, NaN padded
+        for stage, raw in enumerate(stages):
+            self.stage_voltages[stage, :raw.shape[1]] = raw[0]
+            self.resistance_array[stage, :, :raw.shape[1]] = raw[1:self.num_devices+1]
+
+        # optionally put every sweep on one shared gate voltage grid
+        if grid is not None:
+            if isinstance(grid, str):
+                grid = common_grid(self.stage_voltages, grid)
+            grid = np.asarray(grid, dtype=float)
+            self.resistance_array = self.resample(grid)
+            valid = ~np.isnan(self.resistance_array).all(axis=1) # x: stage, y: grid point
+            self.stage_lengths = len(grid) - np.argmax(valid[:, ::-1], axis=1) # up to the last grid point inside each sweep
+            self.stage_voltages = np.tile(grid, (len(stages), 1))
+            self.voltages = grid
+            self.id_voltages = grid
+
+        # everything derived from resistance_array (conductances, derivatives, dirac and transconductance
+        # voltages) is a cached property below: computed on first use, dropped again by invalidate()
+
+    def invalidate(self, *names):
+        '''
+        Drops cached derived quantities so they are recomputed on next use. Call it after editing
+        resistance_array (or voltages / id_voltages) in place.
+
+        Parameters:
+            names: names of the cached properties to drop, all of them if none are given
+        '''
+        for name in names or cached_names(type(self)):
+            self.__dict__.pop(name, None)
+
+    def cache_token(self):
+        '''
+        The data everything in this class is computed from, memoized methods are keyed by its content
+        '''
+        return self.resistance_array, self.stage_lengths, self.voltages, self.id_voltages, self.num_concs
+
+    # derived arrays, same layout as resistance_array. Derivatives are R[i] - R[i+1], so they have one gate voltage less
+    @cached_property
+    def conductance_array(self):
+        return 1 / self.resistance_array
+
+    @cached_property
+    def resistance_derivative_array(self):
+        return -np.diff(self.resistance_array, axis=2)
+
+    @cached_property
+    def conductance_derivative_array(self):
+        return -np.diff(self.conductance_array, axis=2)
+
+    # dirac and transconductance points of every stage and device, as gate voltage indices. 2D arrays, x: stage, y: device_number
+    @cached_property
+    def stage_dirac_idx(self):
+        return nan_argmax(self.resistance_array)
+
+    @cached_property
+    def stage_pos_transc_idx(self):
+        return nan_argmax(self.resistance_derivative_array)
+
+    @cached_property
+    def stage_neg_transc_idx(self):
+        return nan_argmin(self.resistance_derivative_array)
+
+    # resistance info, views into resistance_array
+    @cached_property
+    def apt_resistances(self):
+        return self.stage_views(self.resistance_array, self.apt_idx) # dictionary of lists of aptemer resistances. {device_number: resistance_list}
+
+    @cached_property
+    def id_resistances(self):
+        return self.stage_views(self.resistance_array, self.id_idx) # dictionary of lists of initial dirac resistances. {device_number: resistance_list}
+
+    @cached_property
+    def linker_resistances(self):
+        return self.stage_views(self.resistance_array, self.linker_idx)
+
+    @cached_property
+    def resistances(self):
+        return {conc: self.stage_views(self.resistance_array, conc) for conc in range(self.num_concs)}  # dictionary of dictionary of resistance list. {concentration_num: {device_number: list_of_resistances}}
+
+    # resistance derivative info
+    @cached_property
+    def resistance_derivatives(self):
+        return {conc: self.stage_views(self.resistance_derivative_array, conc, 1) for conc in range(self.num_concs)} # dictionary of dictionary of delta resistance list. {concentration_num: {device_number: list_of_resistance_changes}}
+
+    @cached_property
+    def apt_resistance_derivatives(self):
+        return self.stage_views(self.resistance_derivative_array, self.apt_idx, 1) # dictionary of lists of aptemer delta resistance. {device_number: list_of_resistance_changes}
+
+    @cached_property
+    def id_resistance_derivatives(self):
+        return self.stage_views(self.resistance_derivative_array, self.id_idx, 1) # dictionary that has the same structure as apt_resistance_derivatives, but for initial dirac sweep
 
+    @cached_property
+    def linker_resistance_derivatives(self):
+        return self.stage_views(self.resistance_derivative_array, self.linker_idx, 1)
+
+    # dirac voltage info
+    @cached_property
+    def dirac_voltages(self):
+        return self.voltages[self.stage_dirac_idx[:self.num_concs]] # 2D array of dirac voltages. x:concentration, y: device_number
+
+    @cached_property
+    def apt_dirac_voltages(self):
+        return dict(enumerate(self.voltages[self.stage_dirac_idx[self.apt_idx]])) # {device_number: dirac_voltage}
+
+    @cached_property
+    def id_dirac_voltages(self):
+        return dict(enumerate(self.id_voltages[self.stage_dirac_idx[self.id_idx]])) # dictionary that has the same structure as apt_dirac_voltages, but for initial dirac sweep
+
+    @cached_property
+    def linker_dirac_voltages(self):
+        return dict(enumerate(self.voltages[self.stage_dirac_idx[self.linker_idx]]))
+
+    @cached_property
+    def adj_dirac_voltages(self):
+        return self.dirac_voltages - self.voltages[self.stage_dirac_idx[self.apt_idx]] # 2D array of dirac voltage shifts (adjusted). x:concentration, y: device_number
+
+    # transconductance voltage info, both pos and neg
+    @cached_property
+    def apt_pos_transc_voltages(self):
+        return dict(enumerate(self.voltages[self.stage_pos_transc_idx[self.apt_idx]])) # positive transconductance voltages for the aptemer. {device_number: pos_transc_v}
+
+    @cached_property
+    def apt_neg_transc_voltages(self):
+        return dict(enumerate(self.voltages[self.stage_neg_transc_idx[self.apt_idx]])) # negative transconductance voltages for the aptemer. {device_number: neg_transc_v}
+
+    @cached_property
+    def pos_transc_voltages(self):
+        return self.voltages[self.stage_pos_transc_idx[:self.num_concs]] # 2D array of positive transconductance voltages. x:concentration, y: device_number
+
+    @cached_property
+    def neg_transc_voltages(self):
+        return self.voltages[self.stage_neg_transc_idx[:self.num_concs]] # 2D array of negative transconductance voltages. x:concentration, y: device_number
+
+    @cached_property
+    def adj_pos_transc_voltages(self):
+        return self.pos_transc_voltages - self.voltages[self.stage_pos_transc_idx[self.apt_idx]] # 2D array of positive transconductance voltage shifts (adjusted). x:concentration, y: device_number
+
+    @cached_property
+    def adj_neg_transc_voltages(self):
+        return self.neg_transc_voltages - self.voltages[self.stage_neg_transc_idx[self.apt_idx]] # 2D array of negative transconductance voltage shifts (adjusted). x:concentration, y: device_number
+
+    # conductance info
+    @cached_property
+    def apt_conductances(self):
+        return self.stage_views(self.conductance_array, self.apt_idx) # dictionary of lists of conductances for the aptamer readings. {device_number: conductance_list}
+
+    @cached_property
+    def id_conductances(self):
+        return self.stage_views(self.conductance_array, self.id_idx) # dictionary that has the same structure as apt_conductances, but for initial dirac sweep
+
+    @cached_property
+    def linker_conductances(self):
+        return self.stage_views(self.conductance_array, self.linker_idx)
+
+    @cached_property
+    def conductances(self):
+        return {conc: list(self.stage_views(self.conductance_array, conc).values()) for conc in range(self.num_concs)} # dictionary of lists of conductance readings. {concentration: [conductance_list per device]}
+
+    # conductance derivative info
+    @cached_property
+    def conductance_derivatives(self):
+        return {conc: self.stage_views(self.conductance_derivative_array, conc, 1) for conc in range(self.num_concs)} # dictionary of dictionary of delta conductance list. {concentration_num: {device_number: list_of_conductance_changes}}
+
+    @cached_property
+    def apt_conductance_derivatives(self):
+        return self.stage_views(self.conductance_derivative_array, self.apt_idx, 1) # dictionary of lists of aptemer delta conductance. {device_number: list_of_conductance_changes}
+
+    @cached_property
+    def id_conductance_derivatives(self):
+        return self.stage_views(self.conductance_derivative_array, self.id_idx, 1) # dictionary that has the same structure as apt_conductance_derivatives, but for initial dirac sweep
+
+    @cached_property
+    def linker_conductance_derivatives(self):
+        return self.stage_views(self.conductance_derivative_array, self.linker_idx, 1)
+
+    def stage_views(self, array, stage, trim=0):
+        '''
+        Views of one stage plane of a dense (stage, device, gate voltage) array, cut to the valid gate voltages.
+
+        Returns:
+            {device_number: 1D view}
+        Parameters:
+            array: one of the dense arrays, e.g. self.resistance_array
+            stage: plane index, a concentration number or self.apt_idx / self.id_idx / self.linker_idx
+            trim: number of gate voltages the array is shorter than the raw data (1 for derivatives)
+        '''
+        length = self.stage_lengths[stage] - trim
+        return {dev_num: array[stage, dev_num, :length] for dev_num in range(self.num_devices)}
         
+    def resample(self, grid):
+        '''
+        Resistances of every sweep linearly interpolated onto the gate voltages grid, e.g. a finer grid for one metric
+
+        Returns:
+            3D array of resistances. x: stage, y: device_number, z: grid index. NaN outside each sweep's voltage range
+        Parameters:
+            grid: 1D array of gate voltages
+        '''
+        return interpolate_sweeps(self.stage_voltages, self.resistance_array, grid)
+
     def conductance_shifts(self, voltage_to_track):
         '''
         Calculates the conductance shift over different concentrations, for a static gate voltage.
@@ -145,26 +300,15 @@ class Dataset():
         '''
         voltage_idx = np.abs(self.voltages - voltage_to_track).argmin() # index of voltage we want to track in self.voltages. The voltage can be an average of others so it may not be on the list
 
-        # builds the 2D array of conductances at a voltage
-        conductance_at_voltage = np.zeros((self.num_concs, self.num_devices)) # 2D array of conductances. x:concentration, y: device_number
-        for conc in range(self.num_concs):
-            for dev_num in range(self.num_devices):
-                conductance_at_voltage[conc, dev_num] = self.conductances[conc][dev_num][voltage_idx]
-
-        # builds the 2D array of the change in conductances at a voltage. This change is with respect to the aptamer conductance
-        delta_conductance = np.zeros((self.num_concs, self.num_devices)) # 2D list tracking the change in conductances. x:concentration, y: device_number
-        for dev_num in range(self.num_devices):
-            delta_conductance[:,dev_num] = conductance_at_voltage[:,dev_num] - self.apt_conductances[dev_num][voltage_idx]
-
-        return delta_conductance
+        # change in conductance at that voltage with respect to the aptamer conductance. x:concentration, y: device_number
+        conductance_at_voltage = self.conductance_array[:self.num_concs, :, voltage_idx]
+        return conductance_at_voltage - self.conductance_array[self.apt_idx, :, voltage_idx]
 
     
     def normalize_2D_array(self, delta_Y, Y_0):
-        Y_norm = np.zeros((self.num_concs, self.num_devices))
-        for dev_num in range(self.num_devices):
-            # G_norm[:,dev_num] = (G_0[dev_num] - delta_G[:,dev_num]) / G_0[dev_num]
-            Y_norm[:,dev_num] = (delta_Y[:,dev_num] - Y_0[dev_num]) / Y_0[dev_num] + 1
-        return Y_norm
+        Y_0 = np.array([Y_0[dev_num] for dev_num in range(self.num_devices)]) # accepts the {device_number: value} dictionaries as well as arrays
+        # G_norm[:,dev_num] = (G_0[dev_num] - delta_G[:,dev_num]) / G_0[dev_num]
+        return (delta_Y - Y_0) / Y_0 + 1
 
     
     def normalized_conductance_shifts(self, voltage_to_track):
@@ -184,19 +328,145 @@ class Dataset():
 
         voltage_idx = np.abs(self.voltages - voltage_to_track).argmin() # index of voltage we want to track in self.voltages
 
-        # builds G_0 list
-        G_0 = {} # aptamer conductance, 
-        for dev_num in range(self.num_devices):
-            G_0[dev_num] = self.apt_conductances[dev_num][voltage_idx]
+        G_0 = self.conductance_array[self.apt_idx, :, voltage_idx] # aptamer conductance per device
+        return self.normalize_2D_array(delta_G, G_0)
 
-        # # builds G_norm array
-        # G_norm = np.zeros((self.num_concs, self.num_devices))
-        # for dev_num in range(self.num_devices):
-        #     # G_norm[:,dev_num] = (G_0[dev_num] - delta_G[:,dev_num]) / G_0[dev_num]
-        #     G_norm[:,dev_num] = (delta_G[:,dev_num] - G_0[dev_num]) / G_0[dev_num]
+    def conductance_shift_scan(self, normalized=False):
+        '''
+        conductance_shifts (or normalized_conductance_shifts) at every gate voltage of self.voltages at once
 
-        # return G_norm
-        return self.normalize_2D_array(delta_G, G_0)
+        Returns:
+            3D array, x: gate voltage index in self.voltages, y: concentration, z: device_number.
+            NaN where a concentration sweep stopped before that gate voltage
+        Parameters:
+            normalized: normalize to the aptamer conductance, like normalized_conductance_shifts
+        '''
+        num_voltages = len(self.voltages)
+        G = self.conductance_array[:self.num_concs, :, :num_voltages] # x: concentration, y: device_number, z: gate voltage
+        G_0 = self.conductance_array[self.apt_idx, :, :num_voltages] # aptamer conductance, x: device_number, y: gate voltage
+        delta_G = G - G_0
+        if normalized:
+            delta_G = (delta_G - G_0) / G_0 + 1 # same as normalize_2D_array
+        return delta_G.transpose(2, 0, 1)
+
+    @memoize()
+    def tracking_voltage_scan(self, normalized=False):
+        '''
+        Pooled hill analysis (as in analysis) of the conductance shift at every gate voltage, all fits at once with fit_hill_batch
+
+        Returns:
+            voltages: self.voltages
+            S: sensitivity per gate voltage
+            LOD: limit of detection per gate voltage
+            r2: r^2 of the fit per gate voltage
+            hill_coeffs: (A, K, n, b) per gate voltage, shape (num_voltages, 4)
+            converged: per gate voltage, False where the fit did not converge (S, LOD and r2 are NaN there)
+        Parameters:
+            normalized: scan normalized_conductance_shifts instead of conductance_shifts
+        '''
+        scan = self.conductance_shift_scan(normalized)
+        data_flat = scan.reshape(len(self.voltages), -1) # x: gate voltage, y: same order as data_array_flattened in analysis
+        concentrations_list = np.repeat(range(self.num_concs), self.num_devices)
+        hill_coeffs, converged = fit_hill_batch(concentrations_list, data_flat.T)
+
+        S, LOD, LOQ, r2, exp_range = pooled_hill_figures(data_flat, hill_coeffs, self.num_concs, converged)
+        return self.voltages, S, LOD, r2, hill_coeffs, converged
+
+    def optimal_tracking_voltage(self, criterion='S', normalized=False, min_r2=0.5):
+        '''
+        Gate voltage to track for the best static conductance analysis, from tracking_voltage_scan
+
+        Returns:
+            (voltage, S, LOD, r2) at the best gate voltage, NaNs if no gate voltage qualifies
+        Parameters:
+            criterion: 'S' for the largest sensitivity magnitude, 'LOD' for the smallest positive limit of detection
+            normalized: use normalized conductance shifts
+            min_r2: only gate voltages whose fit reaches this r^2 qualify, step-like fits of noise can have huge S
+        '''
+        voltages, S, LOD, r2, hill_coeffs, converged = self.tracking_voltage_scan(normalized)
+        if criterion == 'S':
+            score = np.abs(S)
+        elif criterion == 'LOD':
+            score = np.where(LOD > 0, -LOD, np.nan) # a negative LOD is unphysical (S of the wrong sign), 0 means no spread at the low concentration
+        else:
+            raise ValueError(f"criterion must be 'S' or 'LOD', not {criterion!r}")
+        score = np.where(np.isfinite(score) & (r2 >= min_r2), score, -np.inf)
+        if not np.isfinite(score).any():
+            print(f'no gate voltage has a fit with r2 >= {min_r2}' + (' and a positive LOD' if criterion == 'LOD' else ''))
+            return np.nan, np.nan, np.nan, np.nan
+        best = np.argmax(score)
+        return voltages[best], S[best], LOD[best], r2[best]
+
+    def bootstrap_analysis(self, data_array_2D, n_boot=2000, resample='devices', ci=95, seed=0, processes=None, executor=None, chunk_size=250, min_valid_fraction=0.5):
+        '''
+        Confidence intervals of the pooled analysis (as in analysis) by resampling and refitting with fit_hill_batch.
+
+        Returns:
+            {'S', 'LOD', 'LOQ', 'exp_range': (estimate, low, high)}, the estimate from the full data (NaN if its fit
+            did not converge), low and high the percentile (bootstrap) or normal (jackknife) confidence interval,
+            'n_valid': number of resamples whose fit converged and 'frac_valid': n_valid over the number of resamples
+        Parameters:
+            data_array_2D: 2D array of data we want to use. Must have x: concentration, y: device_number
+            n_boot: number of bootstrap resamples
+            resample: 'devices' draws whole devices with replacement, 'points' draws the devices independently
+                      at every concentration, 'jackknife' leaves out one device at a time (n_boot is ignored)
+            ci: confidence level in percent
+            seed: the resamples are drawn from seed-derived streams per chunk, so results do not depend on processes
+            processes: number of worker processes, 1 runs everything in this process
+            executor: an existing concurrent.futures executor to reuse
+            chunk_size: resamples fitted together in one fit_hill_batch call
+            min_valid_fraction: below this fraction of converged resamples the intervals are not trustworthy,
+                                they are NaN and a message is printed
+        '''
+        return report(self.bootstrap_analysis_details(data_array_2D, n_boot, resample, ci, seed, processes, executor, chunk_size, min_valid_fraction))
+
+    @memoize(ignore=('processes', 'executor'))
+    def bootstrap_analysis_details(self, data_array_2D, n_boot=2000, resample='devices', ci=95, seed=0, processes=None, executor=None, chunk_size=250, min_valid_fraction=0.5):
+        '''
+        The cached work of bootstrap_analysis
+
+        Returns:
+            result: the bootstrap_analysis dict
+            details: {'messages': the warnings bootstrap_analysis prints}
+        '''
+        data_array_2D = np.asarray(data_array_2D, dtype=float)
+        num_concs, num_devices = data_array_2D.shape
+        names = ['S', 'LOD', 'LOQ', 'exp_range']
+        concentrations_list = np.repeat(range(num_concs), num_devices)
+        hill_coeffs, converged = fit_hill_batch(concentrations_list, data_array_2D.reshape(-1, 1))
+        S, LOD, LOQ, r2, exp_range = pooled_hill_figures(data_array_2D.reshape(1, -1), hill_coeffs, num_concs, converged)
+        estimates = dict(zip(names, (S[0], LOD[0], LOQ[0], exp_range[0])))
+
+        if resample == 'jackknife':
+            chunks = [(data_array_2D, 'jackknife', np.arange(num_devices), None)]
+        elif resample in ('devices', 'points'):
+            chunk_sizes = [min(chunk_size, n_boot - start) for start in range(0, n_boot, chunk_size)]
+            seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+            chunks = [(data_array_2D, resample, size, child) for size, child in zip(chunk_sizes, seeds)]
+        else:
+            raise ValueError(f"resample must be 'devices', 'points' or 'jackknife', not {resample!r}")
+
+        results = parallel_map(bootstrap_chunk, chunks, processes, executor)
+        replicates = np.concatenate(results, axis=1) # x: figure (S, LOD, LOQ, exp_range), y: resample
+
+        valid = np.isfinite(replicates).all(axis=0)
+        out = {'n_valid': int(valid.sum()), 'frac_valid': valid.mean()}
+        messages = []
+        too_few = out['frac_valid'] < min_valid_fraction
+        if too_few:
+            messages.append(f"only {out['n_valid']} of {len(valid)} resamples converged, no confidence intervals")
+        for name, estimate, values in zip(names, estimates.values(), replicates[:, valid]):
+            if len(values) < 2 or too_few:
+                out[name] = (estimate, np.nan, np.nan)
+            elif resample == 'jackknife':
+                n_jack = len(values)
+                std_err = np.sqrt((n_jack-1) / n_jack * np.sum((values - values.mean())**2))
+                z = norm.ppf(0.5 + ci/200)
+                out[name] = (estimate, estimate - z*std_err, estimate + z*std_err)
+            else:
+                low, high = np.percentile(values, [50 - ci/2, 50 + ci/2])
+                out[name] = (estimate, low, high)
+        return out, {'messages': messages}
 
     def analysis(self, data_array_2D):
         '''
@@ -213,45 +483,197 @@ class Dataset():
         Parameters:
             data_array_2D: 2D array of data we want to use. Must have x: concentration, y: device_number
         '''
-        concentrations_list = np.repeat(range(self.num_concs), self.num_devices) # The list of concentrations that corresponds to the data_array_flattened list. Neeed because the data_array_2D is flattened
-        data_array_flattened = data_array_2D.flatten() # The flattened list from data_array_2D, needed because pyplot cannot plot 2D matrices.
-        hill_coeffs, c = curve_fit(hill_function, concentrations_list, data_array_flattened) # fits the datapoints to hill_function, the hill curve
-        std_devs = [] # calculates the standard deviation for each concentration
-        for i in range(self.num_concs):
-            mu = hill_function(i, *hill_coeffs)
-            val = np.sqrt(1/self.num_devices * sum([(mu - x_j)**2 for x_j in data_array_flattened[i*self.num_devices:i*(self.num_devices+1)]]))
-            std_devs.append(val)
-            
-        # calculates slope, which is needed for LOD
-        inf_point_x = inflection_point_hill_function(*hill_coeffs)
-        S = derivative_hill_function(inf_point_x, *hill_coeffs)
-        # print('inf point', inf_point_x)
+        result = hill_analysis(data_array_2D)
+        LOD = result[5]
+        print(f'LOD: {LOD} for decade, but for real:', str(10**(-18 + LOD)))
+        return result
 
-        # calculates standard deviation at low concentration, which is needed for lOD 
-        conc_to_take_std_dev = 3
-        std_dev = np.std(data_array_flattened[conc_to_take_std_dev*self.num_devices:conc_to_take_std_dev*(self.num_devices+1)])
+    def device_analysis(self, data_array_2D):
+        '''
+        Per-device version of analysis: fits one hill curve per device (all devices at once with fit_hill_batch)
+        and reports the mean and spread of the figures of merit over the devices. Devices whose fit did not converge
+        or whose figures are not finite (e.g. n < 1 has no inflection point) are left out of the means and spreads,
+        which devices were used is printed and available from device_analysis_details.
 
-        # caluclates and prints LOD, LOQ, and dynamic range
-        LOD = 3.3 * std_dev / S
-        LOQ = 10 * std_dev / S
-        # print(f'sensitivity: {S}') # :.4f}')
-        print(f'LOD: {LOD} for decade, but for real:', str(10**(-18 + LOD)))
-        # print(f'Theoetical dynamic range: {LOD} to {999999}')
-        # print(f'Experimental dynamic range: {LOD} to 10^-9')
-        # print(f'LOQ: {LOQ}')
-        # print(f'Dynamic range: {LOD} to {LOQ}')
-
-        # calculates r^2
-        predicted_data = [hill_function(conc, *hill_coeffs) for conc in concentrations_list]
-        r2 = r2_score(data_array_flattened, predicted_data)
-
-        # calculates r^2 for only the linear region, 10^-18 - 10^-14
-        predicted_data_linear = [hill_function(conc, *hill_coeffs) for conc in concentrations_list[:self.num_devices*5]]
-        data_array_flattened_linear = data_array_flattened[:self.num_devices*5]
-        r2_linear = r2_score(data_array_flattened_linear, predicted_data_linear)
-        
-        return concentrations_list, data_array_flattened, hill_coeffs, std_devs, S, LOD, r2, r2_linear
+        Returns:
+            data_array_2D: the data, x: concentration, y: device_number
+            hill_coeffs_array: (A, K, n, b) per device, shape (num_devices, 4)
+            prediction_std_devs: per concentration, RMS deviation of the devices from the curve of the mean coefficients
+            S_mean, S_std: sensitivity (slope at the inflection point) over the devices
+            LOD_mean, LOD_std: limit of detection over the devices, 3.3 * (RMS residual of the device's own fit) / S
+            exp_range_mean, exp_range_std: concentration where each device's curve is closest to 0
+            r2: r^2 of all points against the curve of the mean coefficients
+            r2_linear: same, for only the linear region 10^-18 - 10^-14
+        Parameters:
+            data_array_2D: 2D array of data we want to use. Must have x: concentration, y: device_number
+        '''
+        return report(self.device_analysis_details(data_array_2D))
+
+    @memoize()
+    def device_analysis_details(self, data_array_2D):
+        '''
+        The cached work of device_analysis
+
+        Returns:
+            result: the device_analysis tuple
+            details: {'converged': per device, 'used': per device, True where it is part of the means and spreads,
+                      'num_devices_used', 'messages': the warnings device_analysis prints}
+        '''
+        data_array_2D = np.asarray(data_array_2D, dtype=float)
+        num_concs, num_devices = data_array_2D.shape
+        messages = []
+        concs = np.arange(num_concs)
+        hill_coeffs_array, converged = fit_hill_batch(concs, data_array_2D)
+        if not converged.all():
+            messages.append(f'hill fit did not converge for devices {np.flatnonzero(~converged)}, they are left out of the summary')
+        A, K, n, b = (hill_coeffs_array[:, i] for i in range(4))
+        predicted_data_array_2D = hill_function(concs[:, None], A, K, n, b) # x: concentration, y: device_number
+
+        hill_coeffs_avg = np.mean(hill_coeffs_array[converged] if converged.any() else hill_coeffs_array, axis=0)
+        avg_predictions = hill_function(concs, *hill_coeffs_avg)
+        prediction_std_devs = np.sqrt(np.mean((data_array_2D - avg_predictions[:, None])**2, axis=1))
+
+        with np.errstate(all='ignore'):
+            inf_points_x = np.maximum(0, K * ((n-1)/(n+1))**(1/n)) # inflection_point_hill_function per device, NaN for n < 1
+            Ss = derivative_hill_function(inf_points_x, A, K, n, b)
+
+            # spread of each device around its own curve, a single residual per concentration has no spread
+            residual_rms = np.sqrt(np.nanmean((data_array_2D - predicted_data_array_2D)**2, axis=0))
+            LODs = 3.3 * residual_rms / Ss
+
+        # calculates experimental range
+        X_fit = np.linspace(0, num_concs-1, 100)
+        Y_fit = hill_function(X_fit[None, :], A[:, None], K[:, None], n[:, None], b[:, None])
+        exp_range = np.argmin(np.abs(Y_fit), axis=1) / 100 * (num_concs-1)
 
+        used = converged & np.isfinite(Ss) & np.isfinite(LODs)
+        num_devices_used = int(used.sum())
+        if num_devices_used < num_devices:
+            messages.append(f'device summary over {num_devices_used} of {num_devices} devices')
+        S_mean, S_std = (np.mean(Ss[used]), np.std(Ss[used])) if num_devices_used else (np.nan, np.nan)
+        LOD_mean, LOD_std = (np.mean(LODs[used]), np.std(LODs[used])) if num_devices_used else (np.nan, np.nan)
+        exp_range_mean, exp_range_std = (np.mean(exp_range[used]), np.std(exp_range[used])) if num_devices_used else (np.nan, np.nan)
+
+        # calculates r^2, and r^2 for only the linear region, 10^-18 - 10^-14
+        predicted_avg_2D = np.repeat(avg_predictions[:, None], num_devices, axis=1)
+        r2 = r2_score(data_array_2D.flatten(), predicted_avg_2D.flatten())
+        r2_linear = r2_score(data_array_2D[:5].flatten(), predicted_avg_2D[:5].flatten())
+
+        result = data_array_2D, hill_coeffs_array, prediction_std_devs, S_mean, S_std, LOD_mean, LOD_std, exp_range_mean, exp_range_std, r2, r2_linear
+        return result, {'converged': converged, 'used': used, 'num_devices_used': num_devices_used, 'messages': messages}
+
+
+    def metric_arrays(self):
+        '''
+        The data arrays of all twelve analysis variants, built with shared intermediates: the aptamer averages
+        and the conductance shifts at each tracked voltage are computed once and reused by the normalized variants.
+
+        Returns:
+            {analysis method name: 2D array, x: concentration, y: device_number}, in the order of METRICS
+        '''
+        arrays = {
+            'sweep_dirac_analysis': self.adj_dirac_voltages,
+            'sweep_dirac_analysis_normalized': self.normalize_2D_array(self.adj_dirac_voltages, self.apt_dirac_voltages),
+            'sweep_pos_transconductance_analysis': self.adj_pos_transc_voltages,
+            'sweep_pos_transconductance_analysis_normalized': self.normalize_2D_array(self.adj_pos_transc_voltages, self.apt_pos_transc_voltages),
+            'sweep_neg_transconductance_analysis': self.adj_neg_transc_voltages,
+            'sweep_neg_transconductance_analysis_normalized': self.normalize_2D_array(self.adj_neg_transc_voltages, self.apt_neg_transc_voltages),
+        }
+        tracked_voltages = {
+            'static_dirac_analysis': np.mean(list(self.apt_dirac_voltages.values())),
+            'static_pos_transc_conduc_analysis': np.mean(list(self.apt_pos_transc_voltages.values())),
+            'static_neg_transc_conduc_analysis': np.mean(list(self.apt_neg_transc_voltages.values())),
+        }
+        for name, voltage_to_track in tracked_voltages.items():
+            delta_G = self.conductance_shifts(voltage_to_track)
+            voltage_idx = np.abs(self.voltages - voltage_to_track).argmin()
+            arrays[name] = delta_G
+            arrays[name + '_normalized'] = self.normalize_2D_array(delta_G, self.conductance_array[self.apt_idx, :, voltage_idx])
+        return {name: arrays[name] for name in METRICS}
+
+    def analyze_all_metrics(self, processes=None, executor=None):
+        '''
+        Runs the pooled hill analysis of all twelve metrics (the *_analysis methods), fanning the fits out over a process pool.
+
+        Returns:
+            pandas DataFrame, one row per metric, columns S, LOD, LOQ, r2, r2_linear, A, K, n, b.
+            A metric whose fit fails gets NaN and the error is printed.
+        Parameters:
+            processes: number of worker processes, 1 runs the fits in this process (fastest for a single small well)
+            executor: an existing concurrent.futures executor to reuse, e.g. when analyzing many wells
+        '''
+        return report(self.analyze_all_metrics_details(processes, executor))
+
+    @memoize(ignore=('processes', 'executor'))
+    def analyze_all_metrics_details(self, processes=None, executor=None):
+        '''
+        The cached work of analyze_all_metrics
+
+        Returns:
+            result: the analyze_all_metrics DataFrame
+            details: {'errors': {metric: error of its failed fit}, 'messages': the warnings analyze_all_metrics prints}
+        '''
+        import pandas as pd
+
+        arrays = self.metric_arrays()
+        rows = parallel_map(analyze_metric, list(arrays.items()), processes, executor)
+
+        errors = {row['metric']: row.pop('error') for row in rows if 'error' in row}
+        messages = [f"{metric}: fit failed, {error}" for metric, error in errors.items()]
+        return pd.DataFrame(rows, columns=['metric'] + METRIC_COLUMNS).set_index('metric'), {'errors': errors, 'messages': messages}
+
+    @memoize(ignore=('processes', 'executor', 'chunk_size'))
+    def cross_validate(self, data_array_2D, hold_out='device', processes=None, executor=None, chunk_size=None):
+        '''
+        Out-of-sample check of the pooled hill calibration (as in analysis): the curve is refitted with one device
+        (or one concentration) held out, the held out readings are turned back into concentrations with
+        inverse_hill_function and compared with their true concentration. All folds are fitted together with
+        fit_hill_batch, held out points are NaN in their fold.
+
+        Returns:
+            {'RMSE', 'MAE', 'median_abs_error': prediction errors in concentration decades (steps),
+             'frac_invertible': fraction of held out readings inside the range the refitted curve reaches,
+             'q2': r^2 of the held out readings against their refitted curve, the out-of-sample r2,
+             'folds_converged': fraction of refits that converged,
+             'errors': predicted - true concentration per point, x: concentration, y: device_number, NaN if not invertible}
+        Parameters:
+            data_array_2D: 2D array of data we want to use. Must have x: concentration, y: device_number
+            hold_out: 'device' leaves out one device at a time, 'concentration' one concentration at a time
+                      (holding out the lowest or highest concentration checks extrapolation)
+            processes: number of worker processes, 1 runs everything in this process
+            executor: an existing concurrent.futures executor to reuse
+            chunk_size: folds fitted together in one fit_hill_batch call, by default as many as fit in ~2e6 points
+        '''
+        data_array_2D = np.asarray(data_array_2D, dtype=float)
+        chunks = cross_validation_chunks(data_array_2D, hold_out, chunk_size)
+        results = parallel_map(cross_validation_chunk, chunks, processes, executor)
+        return cross_validation_figures(data_array_2D, hold_out, results)
+
+    @memoize(ignore=('processes', 'executor'))
+    def cross_validate_all_metrics(self, hold_out='device', processes=None, executor=None):
+        '''
+        cross_validate for all twelve metrics, the folds of every metric share one process pool
+
+        Returns:
+            pandas DataFrame, one row per metric, columns RMSE, MAE, median_abs_error, frac_invertible, q2, folds_converged
+            (see cross_validate). Compare q2 with the in-sample r2 of analyze_all_metrics.
+        Parameters:
+            hold_out: 'device' or 'concentration', see cross_validate
+            processes: number of worker processes, 1 runs the fits in this process
+            executor: an existing concurrent.futures executor to reuse
+        '''
+        import pandas as pd
+
+        arrays = self.metric_arrays()
+        chunks = {name: cross_validation_chunks(np.asarray(data_array_2D, dtype=float), hold_out) for name, data_array_2D in arrays.items()}
+        items = [chunk for name in arrays for chunk in chunks[name]]
+        results = iter(parallel_map(cross_validation_chunk, items, processes, executor))
+
+        rows = []
+        for name, data_array_2D in arrays.items():
+            figures = cross_validation_figures(np.asarray(data_array_2D, dtype=float), hold_out, [next(results) for _ in chunks[name]])
+            rows.append({'metric': name, **{column: figures[column] for column in CV_COLUMNS}})
+        return pd.DataFrame(rows, columns=['metric'] + CV_COLUMNS).set_index('metric')
 
     def sweep_dirac_analysis(self):
         '''
@@ -313,6 +735,318 @@ class Dataset():
         avg_neg_apt_transc_voltage = np.mean(list(self.apt_neg_transc_voltages.values()))
         return self.analysis(self.normalized_conductance_shifts(avg_neg_apt_transc_voltage))
 
+def load_data_file(filename):
+    '''
+    Parses one sweep file from the data folder
+    Returns the transposed array: row 0 is the gate voltage, row i the resistance of device i-1
+    Repeat loads come from the on-disk cache (read-only memory maps) when data_cache is available
+    '''
+    if data_cache is not None:
+        return data_cache.loadtxt('data/'+filename).T
+    return np.loadtxt('data/'+filename).T
+
+def common_grid(stage_voltages, mode='union'):
+    '''
+    Shared gate voltage grid for sweeps with different ranges or steps, with the finest step of any sweep
+
+    Returns:
+        1D array of gate voltages
+    Parameters:
+        stage_voltages: 2D array of gate voltages, x: sweep, y: gate voltage index, NaN padded
+        mode: 'union' spans all sweeps (points outside a sweep become NaN), 'intersection' only the range every sweep covers
+    '''
+    starts = np.nanmin(stage_voltages, axis=1)
+    ends = np.nanmax(stage_voltages, axis=1)
+    step = np.nanmin(np.abs(np.diff(stage_voltages, axis=1)))
+    if mode == 'union':
+        start, end = starts.min(), ends.max()
+    elif mode == 'intersection':
+        start, end = starts.max(), ends.min()
+    else:
+        raise ValueError(f"mode must be 'union' or 'intersection', not {mode!r}")
+    num_points = int(round((end - start) / step)) + 1
+    return np.round(np.linspace(start, end, num_points), 10) # rounded so grid points equal the voltages written in the files
+
+def interpolate_sweeps(stage_voltages, values, grid):
+    '''
+    Linear interpolation of many sweeps onto one grid, vectorized over the devices of each sweep
+
+    Returns:
+        array of shape (sweeps, devices, len(grid)), NaN outside each sweep's voltage range
+    Parameters:
+        stage_voltages: 2D array of gate voltages, x: sweep, y: gate voltage index, NaN padded, increasing
+        values: 3D array, x: sweep, y: device_number, z: gate voltage index, same padding
+        grid: 1D array of gate voltages
+    '''
+    grid = np.asarray(grid, dtype=float)
+    out = np.full(values.shape[:2] + (len(grid),), np.nan)
+    for stage, voltages in enumerate(stage_voltages):
+        voltages = voltages[~np.isnan(voltages)]
+        if len(voltages) < 2:
+            continue
+        right = np.clip(np.searchsorted(voltages, grid), 1, len(voltages) - 1)
+        left = right - 1
+        weight = (grid - voltages[left]) / (voltages[right] - voltages[left])
+        weight = np.where(np.isclose(weight, 0, atol=1e-9), 0, np.where(np.isclose(weight, 1, atol=1e-9), 1, weight)) # exact values on shared points
+        inside = (grid >= voltages[0] - 1e-9) & (grid <= voltages[-1] + 1e-9)
+        resampled = values[stage][:, left] * (1 - weight) + values[stage][:, right] * weight
+        out[stage][:, inside] = resampled[:, inside]
+    return out
+
+def cached_names(cls):
+    '''
+    Names of all cached properties of a class, used by Dataset.invalidate
+    '''
+    return [name for klass in cls.__mro__ for name, attr in vars(klass).items() if isinstance(attr, cached_property)]
+
+def nan_argmax(array):
+    '''
+    Index of the maximum along the last axis, ignoring NaN padding
+    Returns an integer array with the last axis removed
+    '''
+    return np.where(np.isnan(array), -np.inf, array).argmax(axis=-1)
+
+def nan_argmin(array):
+    '''
+    Index of the minimum along the last axis, ignoring NaN padding
+    Returns an integer array with the last axis removed
+    '''
+    return np.where(np.isnan(array), np.inf, array).argmin(axis=-1)
+
+# analysis variants of Dataset, named after its analysis methods
+METRICS = ['sweep_dirac_analysis', 'sweep_dirac_analysis_normalized',
+           'sweep_pos_transconductance_analysis', 'sweep_pos_transconductance_analysis_normalized',
+           'sweep_neg_transconductance_analysis', 'sweep_neg_transconductance_analysis_normalized',
+           'static_dirac_analysis', 'static_dirac_analysis_normalized',
+           'static_pos_transc_conduc_analysis', 'static_pos_transc_conduc_analysis_normalized',
+           'static_neg_transc_conduc_analysis', 'static_neg_transc_conduc_analysis_normalized']
+METRIC_COLUMNS = ['S', 'LOD', 'LOQ', 'r2', 'r2_linear', 'A', 'K', 'n', 'b']
+
+def analyze_metric(item):
+    '''
+    Pooled hill analysis of one (metric name, data_array_2D) pair, module level so process pools can run it
+    Returns a row of Dataset.analyze_all_metrics as a dict
+    '''
+    name, data_array_2D = item
+    row = {'metric': name}
+    try:
+        concentrations_list, data_array_flattened, hill_coeffs, std_devs, S, LOD, r2, r2_linear = hill_analysis(data_array_2D)
+    except (RuntimeError, ValueError) as e:
+        row.update({column: np.nan for column in METRIC_COLUMNS}, error=str(e))
+        return row
+    row.update(S=S, LOD=LOD, LOQ=LOD * 10 / 3.3, r2=r2, r2_linear=r2_linear) # LOQ = 10 * std_dev / S, LOD = 3.3 * std_dev / S
+    row.update(zip('AKnb', hill_coeffs))
+    return row
+
+@memoize()
+def hill_analysis(data_array_2D):
+    '''
+    Performs curve fitting of a data array vs concentration. For example, Dirac Voltage vs concentration, or conductance vs concentration.
+
+    Returns:
+        concentrations_list: The list of concentrations that corresponds to the data_array_flattened list. Neeed because the data_array_2D was flattened
+        data_array_flattened: The flattened list from data_array_2D, needed because pyplot cannot plot 2D matrices.
+        hill_coeffs = (A, K, n, b): Coefficients for hill curve fitted to distribution
+        std_devs: The list, as long as the number of concentrations, for the standard deviations at each concentration
+        S: sensitivity
+        LOD: Limit of detection
+        r2: r^2 value on how the hill curve fits the points
+    Parameters:
+        data_array_2D: 2D array of data we want to use. Must have x: concentration, y: device_number
+    '''
+    num_concs, num_devices = data_array_2D.shape
+    concentrations_list = np.repeat(range(num_concs), num_devices) # The list of concentrations that corresponds to the data_array_flattened list. Neeed because the data_array_2D is flattened
+    data_array_flattened = data_array_2D.flatten() # The flattened list from data_array_2D, needed because pyplot cannot plot 2D matrices.
+    hill_coeffs, c = curve_fit(hill_function, concentrations_list, data_array_flattened) # fits the datapoints to hill_function, the hill curve
+    std_devs = [] # calculates the standard deviation for each concentration
+    for i in range(num_concs):
+        mu = hill_function(i, *hill_coeffs)
+        val = np.sqrt(1/num_devices * sum([(mu - x_j)**2 for x_j in data_array_flattened[i*num_devices:i*(num_devices+1)]]))
+        std_devs.append(val)
+        
+    # calculates slope, which is needed for LOD
+    inf_point_x = inflection_point_hill_function(*hill_coeffs)
+    S = derivative_hill_function(inf_point_x, *hill_coeffs)
+    # print('inf point', inf_point_x)
+
+    # calculates standard deviation at low concentration, which is needed for lOD 
+    conc_to_take_std_dev = 3
+    std_dev = np.std(data_array_flattened[conc_to_take_std_dev*num_devices:conc_to_take_std_dev*(num_devices+1)])
+
+    # caluclates and prints LOD, LOQ, and dynamic range
+    LOD = 3.3 * std_dev / S
+    LOQ = 10 * std_dev / S
+    # print(f'sensitivity: {S}') # :.4f}')
+    # print(f'Theoetical dynamic range: {LOD} to {999999}')
+    # print(f'Experimental dynamic range: {LOD} to 10^-9')
+    # print(f'LOQ: {LOQ}')
+    # print(f'Dynamic range: {LOD} to {LOQ}')
+
+    # calculates r^2
+    predicted_data = [hill_function(conc, *hill_coeffs) for conc in concentrations_list]
+    r2 = r2_score(data_array_flattened, predicted_data)
+
+    # calculates r^2 for only the linear region, 10^-18 - 10^-14
+    predicted_data_linear = [hill_function(conc, *hill_coeffs) for conc in concentrations_list[:num_devices*5]]
+    data_array_flattened_linear = data_array_flattened[:num_devices*5]
+    r2_linear = r2_score(data_array_flattened_linear, predicted_data_linear)
+    
+    return concentrations_list, data_array_flattened, hill_coeffs, std_devs, S, LOD, r2, r2_linear
+
+def bootstrap_chunk(args):
+    '''
+    One chunk of Dataset.bootstrap_analysis, module level so process pools can run it
+    Returns the figures (S, LOD, LOQ, exp_range) of every resample, shape (4, resamples)
+    Parameters:
+        args: (data_array_2D, resample, count or device list, SeedSequence), see Dataset.bootstrap_analysis
+    '''
+    data_array_2D, resample, count, seed_seq = args
+    num_concs, num_devices = data_array_2D.shape
+    if resample == 'jackknife':
+        keep = np.array([np.delete(np.arange(num_devices), dev) for dev in count]) # every device left out once
+        samples = data_array_2D[:, keep].transpose(1, 0, 2) # x: resample, y: concentration, z: device
+        num_devices -= 1
+    else:
+        rng = np.random.default_rng(seed_seq)
+        if resample == 'devices':
+            picks = rng.integers(0, num_devices, size=(count, 1, num_devices)) # same devices at every concentration
+        else:
+            picks = rng.integers(0, num_devices, size=(count, num_concs, num_devices)) # drawn per concentration
+        samples = np.take_along_axis(np.broadcast_to(data_array_2D, picks.shape[:1] + data_array_2D.shape), np.broadcast_to(picks, (len(picks), num_concs, num_devices)), axis=2)
+    data_flat = samples.reshape(len(samples), -1)
+    concentrations_list = np.repeat(range(num_concs), num_devices)
+    hill_coeffs, converged = fit_hill_batch(concentrations_list, data_flat.T)
+    S, LOD, LOQ, r2, exp_range = pooled_hill_figures(data_flat, hill_coeffs, num_concs, converged)
+    return np.array([S, LOD, LOQ, exp_range])
+
+CV_COLUMNS = ['RMSE', 'MAE', 'median_abs_error', 'frac_invertible', 'q2', 'folds_converged']
+
+def parallel_map(func, items, processes=None, executor=None):
+    '''list(map(func, items)) on executor, on a new process pool, or in this process if processes == 1 or there is one item'''
+    if executor is not None:
+        return list(executor.map(func, items))
+    if processes == 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=processes or min(len(items), os.cpu_count() or 1)) as pool:
+        return list(pool.map(func, items))
+
+def cross_validation_chunks(data_array_2D, hold_out, chunk_size=None):
+    '''
+    Work items of Dataset.cross_validate: (data_array_2D, hold_out, folds, p0), folds is an array of held out
+    device (or concentration) indices. p0 is the fit of the full data, every fold starts from it.
+    '''
+    num_concs, num_devices = data_array_2D.shape
+    if hold_out == 'device':
+        num_folds = num_devices
+    elif hold_out == 'concentration':
+        num_folds = num_concs
+    else:
+        raise ValueError(f"hold_out must be 'device' or 'concentration', not {hold_out!r}")
+    chunk_size = chunk_size or max(1, 2_000_000 // data_array_2D.size) # Y of one fit_hill_batch call stays at ~16 MB
+    hill_coeffs, converged = fit_hill_batch(np.repeat(range(num_concs), num_devices), data_array_2D.reshape(-1, 1))
+    p0 = hill_coeffs if converged[0] else None
+    return [(data_array_2D, hold_out, np.arange(start, min(start + chunk_size, num_folds)), p0) for start in range(0, num_folds, chunk_size)]
+
+def cross_validation_chunk(args):
+    '''
+    One chunk of folds of Dataset.cross_validate, module level so process pools can run it
+
+    Returns:
+        predicted_concs: concentration predicted for every held out reading, NaN if not invertible,
+                         shape (concs, folds) when holding out devices, (folds, devices) when holding out concentrations
+        predicted_readings: the refitted curve at the held out points, same shape
+        converged: per fold
+    Parameters:
+        args: (data_array_2D, hold_out, folds, p0), see cross_validation_chunks
+    '''
+    data_array_2D, hold_out, folds, p0 = args
+    num_concs, num_devices = data_array_2D.shape
+    concentrations_list = np.repeat(range(num_concs), num_devices)
+    Y = np.repeat(data_array_2D.reshape(-1, 1), len(folds), axis=1).reshape(num_concs, num_devices, len(folds))
+    if hold_out == 'device':
+        Y[:, folds, np.arange(len(folds))] = np.nan
+        held_out = data_array_2D[:, folds] # x: concentration, y: fold
+        x_held_out = np.arange(num_concs)[:, None]
+    else:
+        Y[folds, :, np.arange(len(folds))] = np.nan
+        held_out = data_array_2D[folds, :] # x: fold, y: device
+        x_held_out = folds[:, None]
+
+    hill_coeffs, converged = fit_hill_batch(concentrations_list, Y.reshape(-1, len(folds)), None if p0 is None else np.tile(p0, (len(folds), 1)))
+    # one fold per column when holding out devices, per row when holding out concentrations
+    per_fold = (lambda v: v[None, :]) if hold_out == 'device' else (lambda v: v[:, None])
+    A, K, n, b = (per_fold(hill_coeffs[:, i]) for i in range(4))
+    with np.errstate(all='ignore'):
+        predicted_concs = inverse_hill_function(held_out, A, K, n, b)
+        predicted_readings = hill_function(x_held_out, A, K, n, b) * np.ones_like(held_out)
+    failed = np.broadcast_to(per_fold(~converged), held_out.shape)
+    predicted_concs[failed] = np.nan
+    predicted_readings[failed] = np.nan
+    return predicted_concs, predicted_readings, converged
+
+def cross_validation_figures(data_array_2D, hold_out, results):
+    '''The dict of Dataset.cross_validate from the cross_validation_chunk results of all folds'''
+    fold_axis = 1 if hold_out == 'device' else 0
+    predicted_concs = np.concatenate([result[0] for result in results], axis=fold_axis)
+    predicted_readings = np.concatenate([result[1] for result in results], axis=fold_axis)
+    converged = np.concatenate([result[2] for result in results])
+
+    errors = predicted_concs - np.arange(data_array_2D.shape[0])[:, None] # in concentration steps, decades for the BC wells
+    abs_errors = np.abs(errors[np.isfinite(errors)])
+    fitted = np.isfinite(predicted_readings)
+    ss_res = np.sum((data_array_2D[fitted] - predicted_readings[fitted])**2)
+    ss_tot = np.sum((data_array_2D[fitted] - data_array_2D[fitted].mean())**2)
+    return {
+        'RMSE': np.sqrt(np.mean(abs_errors**2)) if len(abs_errors) else np.nan,
+        'MAE': np.mean(abs_errors) if len(abs_errors) else np.nan,
+        'median_abs_error': np.median(abs_errors) if len(abs_errors) else np.nan,
+        'frac_invertible': len(abs_errors) / errors.size,
+        'q2': 1 - ss_res / ss_tot if fitted.any() and ss_tot > 0 else np.nan,
+        'folds_converged': converged.mean(),
+        'errors': errors,
+    }
+
+def pooled_hill_figures(data_flat, hill_coeffs, num_concs, converged=None):
+    '''
+    Figures of merit of many pooled hill fits at once, with the definitions of hill_analysis
+
+    Returns:
+        S, LOD, LOQ, r2, exp_range: one value per fit, NaN where the fit did not converge.
+        exp_range is the concentration where the curve is closest to 0, as in Dataset.device_analysis
+    Parameters:
+        data_flat: one flattened data_array_2D per row (concentration major, like data_array_flattened)
+        hill_coeffs: (A, K, n, b) per row, shape (fits, 4)
+        num_concs: number of concentrations
+        converged: boolean per row from fit_hill_batch
+    '''
+    num_devices = data_flat.shape[1] // num_concs
+    concentrations_list = np.repeat(range(num_concs), num_devices)
+    A, K, n, b = (hill_coeffs[:, i:i+1] for i in range(4))
+    with np.errstate(all='ignore'):
+        inf_point_x = np.maximum(0, K * ((n-1)/(n+1))**(1/n)) # inflection_point_hill_function per fit
+        S = derivative_hill_function(inf_point_x, A, K, n, b)[:, 0]
+
+        # low concentration spread, LOD and LOQ
+        conc_to_take_std_dev = 3
+        std_dev = np.std(data_flat[:, conc_to_take_std_dev*num_devices:conc_to_take_std_dev*(num_devices+1)], axis=1)
+        LOD = 3.3 * std_dev / S
+        LOQ = 10 * std_dev / S
+
+        predicted = hill_function(concentrations_list[None, :], A, K, n, b)
+        ss_res = np.sum((data_flat - predicted)**2, axis=1)
+        ss_tot = np.sum((data_flat - data_flat.mean(axis=1, keepdims=True))**2, axis=1)
+        r2 = 1 - ss_res / ss_tot
+
+        X_fit = np.linspace(0, num_concs-1, 100)
+        exp_range = np.argmin(np.abs(hill_function(X_fit[None, :], A, K, n, b)), axis=1) / 100 * (num_concs-1)
+
+    figures = (S, LOD, LOQ, r2, exp_range)
+    if converged is not None:
+        for values in figures:
+            values[~converged] = np.nan
+    return figures
+
 def hill_function(x, A, K, n, b):
     '''
     Hill curve
@@ -335,6 +1069,237 @@ def inflection_point_hill_function(A, K, n, b):
     '''
     return max(0, K* ((n-1)/(n+1))**(1/n))
 
+def hill_jacobian(x, A, K, n, b):
+    '''
+    Analytic Jacobian of the hill curve with respect to (A, K, n, b)
+    Returns an array of shape (..., 4); x and the coefficients broadcast against each other, e.g. x of shape (concs,)
+    and coefficients of shape (devices, 1) give (devices, concs, 4)
+    '''
+    x = np.asarray(x, dtype=float)
+    u = x**n # x^n
+    v = K**n # K^n
+    s = u + v
+    frac = u / s
+    log_ratio = np.log(np.where(x > 0, x, 1)) - np.log(K) # d/dn of x^n/(K^n+x^n) is frac*(1-frac)*ln(x/K), zero at x=0
+    dA = frac
+    dK = -A * n * frac * (1 - frac) / K
+    dn = np.where(x > 0, A * frac * (1 - frac) * log_ratio, 0)
+    db = np.ones_like(frac)
+    return np.stack(np.broadcast_arrays(dA, dK, dn, db), axis=-1)
+
+def hill_initial_guess(x, Y):
+    '''
+    Data driven starting point of the hill fit for every column of Y
+    Returns an array of shape (devices, 4) of (A, K, n, b)
+    Parameters:
+        x: concentrations, shape (concs,), may repeat for pooled data
+        Y: data, x: concentration, y: device_number, NaN for missing points
+    '''
+    x = np.asarray(x, dtype=float)
+    # mean per distinct concentration, so pooled data (several devices per concentration) works too
+    x_unique, inverse = np.unique(x, return_inverse=True)
+    present = np.isfinite(Y)
+    sums = np.zeros((len(x_unique), Y.shape[1]))
+    counts = np.zeros((len(x_unique), Y.shape[1]))
+    np.add.at(sums, inverse, np.where(present, Y, 0))
+    np.add.at(counts, inverse, present)
+    with np.errstate(all='ignore'):
+        Y_mean = sums / counts
+    has_mean = counts > 0
+    columns = np.arange(Y.shape[1])
+    b = Y_mean[np.argmax(has_mean, axis=0), columns] # value at the lowest concentration with data
+    A = Y_mean[len(x_unique) - 1 - np.argmax(has_mean[::-1], axis=0), columns] - b # signed amplitude, the curve can rise or fall
+    A = np.where((A == 0) | ~np.isfinite(A), 1e-12, A)
+    # K: first concentration where the curve got halfway from b to b + A
+    with np.errstate(all='ignore'):
+        halfway = (Y_mean - b) / A >= 0.5
+    K = x_unique[np.where(halfway.any(axis=0), halfway.argmax(axis=0), len(x_unique) // 2)]
+    K = np.maximum(K, 0.5 * np.min(x_unique[x_unique > 0]))
+    n = np.ones_like(b)
+    return np.stack([A, K, n, b], axis=1)
+
+def hill_cost(x, Y, coeffs):
+    '''
+    Sum of squared residuals of the hill curve for every column of Y, inf where it is not finite
+    Parameters:
+        x: concentrations, shape (concs,)
+        Y: data, x: concentration, y: device_number, NaN points are left out
+        coeffs: (A, K, n, b) per column of Y, shape (devices, 4)
+    '''
+    with np.errstate(all='ignore'):
+        diff = hill_function(np.asarray(x, dtype=float)[:, None], *coeffs.T) - Y
+        cost = np.sum(np.where(np.isnan(Y), 0, diff)**2, axis=0)
+    return np.where(np.isfinite(cost), cost, np.inf)
+
+def fit_hill_batch(x, Y, p0=None, max_iter=200, tol=1.49e-8):
+    '''
+    Fits the hill curve to every column of Y at once with a vectorized Levenberg-Marquardt, instead of
+    one curve_fit per device.
+
+    Returns:
+        coeffs: array of (A, K, n, b) per device, shape (devices, 4)
+        converged: boolean array per device, False where max_iter was reached first (coeffs are then the best found)
+                   or the fit could not start
+    Parameters:
+        x: concentrations, shape (concs,)
+        Y: data, x: concentration, y: device_number. NaN points are left out of the fit (held out or missing),
+           columns with fewer than 4 points are not fitted
+        p0: starting coefficients, shape (devices, 4). If None, fits from hill_initial_guess and from all ones
+            and keeps the better one, since noisy hill data often has several local minima
+    '''
+    x = np.asarray(x, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    if Y.ndim == 1:
+        Y = Y[:, None]
+    if p0 is None:
+        # two starts, the data driven guess and curve_fit's default of all ones, the better fit is kept
+        guess, guess_converged = fit_hill_batch(x, Y, hill_initial_guess(x, Y), max_iter, tol)
+        ones, ones_converged = fit_hill_batch(x, Y, np.ones((Y.shape[1], 4)), max_iter, tol)
+        use_ones = hill_cost(x, Y, ones) < hill_cost(x, Y, guess)
+        return np.where(use_ones[:, None], ones, guess), np.where(use_ones, ones_converged, guess_converged)
+    p = np.array(p0, dtype=float).reshape(-1, 4)
+    num_fits = p.shape[0]
+
+    # fit in units of each column's spread, so tolerances mean the same for conductances (~1e-5) and voltages
+    offset = np.nanmean(Y, axis=0)
+    scale = np.nanstd(Y, axis=0)
+    scale = np.where((scale > 0) & np.isfinite(scale), scale, 1)
+    offset = np.where(np.isfinite(offset), offset, 0)
+    Y = (Y - offset) / scale
+    p[:, 0] /= scale
+    p[:, 3] = (p[:, 3] - offset) / scale
+
+    def residuals(p, Y_T, W_T):
+        A, K, n, b = (p[:, i:i+1] for i in range(4))
+        with np.errstate(all='ignore'):
+            return (hill_function(x, A, K, n, b) - Y_T) * W_T # shape (devices, concs), 0 at missing points
+
+    def costs(r):
+        cost = np.sum(r**2, axis=1)
+        return np.where(np.isfinite(cost), cost, np.inf)
+
+    W_T = np.isfinite(Y.T) # 1 where a point takes part in the fit
+    Y_T = np.where(W_T, Y.T, 0)
+    cost = costs(residuals(p, Y_T, W_T))
+    damping = np.full(num_fits, 1e-3)
+    converged = np.zeros(num_fits, dtype=bool)
+    finished = ~np.isfinite(cost) | (W_T.sum(axis=1) < 4) # fits that cannot start (too few points, non-finite p0) are given up right away
+
+    for _ in range(max_iter):
+        idx = np.flatnonzero(~finished) # only the fits still running are computed
+        if len(idx) == 0:
+            break
+        p_act, cost_act, damping_act = p[idx], cost[idx], damping[idx]
+        with np.errstate(all='ignore'):
+            J = hill_jacobian(x, *(p_act[:, i:i+1] for i in range(4))) * W_T[idx][:, :, None] # shape (devices, concs, 4)
+        r = residuals(p_act, Y_T[idx], W_T[idx])
+        JtJ = np.einsum('dci,dcj->dij', J, J)
+        Jtr = np.einsum('dci,dc->di', J, r)
+        diag = np.diagonal(JtJ, axis1=1, axis2=2)
+        diag = np.maximum(diag, 1e-12 * diag.max(axis=1, keepdims=True) + 1e-300) # Marquardt scaling, kept invertible
+        system = JtJ + damping_act[:, None, None] * (diag[:, :, None] * np.eye(4))
+        bad = ~np.isfinite(system).all(axis=(1, 2)) | ~np.isfinite(Jtr).all(axis=1)
+        system[bad] = np.eye(4)
+        Jtr[bad] = 0
+        step = np.linalg.solve(system, -Jtr[:, :, None])[:, :, 0]
+
+        p_new = p_act + step
+        cost_new = costs(residuals(p_new, Y_T[idx], W_T[idx]))
+        better = cost_new < cost_act
+        # accepted steps lower the damping (towards Gauss-Newton), rejected ones raise it (towards gradient descent)
+        rel_change = np.where(better, (cost_act - cost_new) / np.maximum(cost_act, 1e-300), 0)
+        p_act[better] = p_new[better]
+        cost_act[better] = cost_new[better]
+        damping_act = np.where(better, damping_act / 3, damping_act * 4)
+        small_step = np.linalg.norm(step, axis=1) <= tol * (np.linalg.norm(p_act, axis=1) + tol)
+        done = (better & (rel_change < tol)) | small_step | (cost_act == 0) | (damping_act > 1e12)
+        p[idx], cost[idx], damping[idx] = p_act, cost_act, damping_act
+        finished[idx] = done
+        converged[idx] = done
+
+    p[:, 0] *= scale
+    p[:, 3] = p[:, 3] * scale + offset
+    return p, converged
+
+def inverse_hill_function(y, A, K, n, b):
+    '''
+    Inverse of the hill curve, the concentration x at which hill_function(x, A, K, n, b) == y
+    Returns NaN where y is not between b and b + A (the curve never reaches it)
+    '''
+    frac = (np.asarray(y, dtype=float) - b) / A
+    with np.errstate(all='ignore'):
+        x = K * (frac / (1 - frac))**(1/n)
+    return np.where((frac > 0) & (frac < 1), x, np.nan)
+
+class HillCalibration():
+    def __init__(self, hill_coeffs, covariance=None, conc_range=(0, 9), lowest_conc_exponent=-18):
+        '''
+        Calibration curve of a well, turns measured shifts (dirac voltage, conductance, ...) into concentrations
+        with the closed form inverse of the hill curve, vectorized over any number of readings.
+
+        Parameters:
+            hill_coeffs: (A, K, n, b) of the calibration fit
+            covariance: 4x4 covariance of the coefficients, for the uncertainty of the predictions (None: no fit uncertainty)
+            conc_range: (lowest, highest) concentration index the calibration was measured at, predictions outside are flagged
+            lowest_conc_exponent: log10 of the concentration at index 0 in g/ml (1 ag/ml for the BC wells), for to_g_per_ml
+        '''
+        self.hill_coeffs = np.asarray(hill_coeffs, dtype=float)
+        self.covariance = np.zeros((4, 4)) if covariance is None else np.asarray(covariance, dtype=float)
+        self.conc_range = conc_range
+        self.lowest_conc_exponent = lowest_conc_exponent
+
+    @classmethod
+    def from_analysis(cls, analysis_result, **options):
+        '''
+        Calibration from the output of Dataset.analysis (or any of its *_analysis variants).
+        The covariance is the one curve_fit reports: s^2 (J^T J)^-1 with s^2 the residual variance.
+        '''
+        concentrations_list, data_array_flattened, hill_coeffs = analysis_result[:3]
+        J = hill_jacobian(concentrations_list, *hill_coeffs)
+        residuals = data_array_flattened - hill_function(concentrations_list, *hill_coeffs)
+        dof = max(len(residuals) - 4, 1)
+        covariance = np.linalg.pinv(J.T @ J) * np.sum(residuals**2) / dof
+        options.setdefault('conc_range', (np.min(concentrations_list), np.max(concentrations_list)))
+        return cls(hill_coeffs, covariance, **options)
+
+    def concentrations(self, readings, reading_std=0):
+        '''
+        Concentrations of many readings at once
+
+        Returns:
+            concs: concentration index per reading (same scale as the calibration, 0 = lowest concentration), NaN where
+                   the reading is outside the range the hill curve reaches
+            conc_stds: standard deviation of each concentration, from the fit covariance and reading_std
+            in_range: True where the concentration could be computed and lies inside conc_range
+        Parameters:
+            readings: array of measured shifts, any shape
+            reading_std: standard deviation of a single reading (scalar or array like readings)
+        '''
+        A, K, n, b = self.hill_coeffs
+        readings = np.asarray(readings, dtype=float)
+        concs = inverse_hill_function(readings, A, K, n, b)
+
+        # first order error propagation of x = K * (f / (1-f))^(1/n), f = (y - b) / A
+        frac = (readings - b) / A
+        with np.errstate(all='ignore'):
+            dx_dfrac = concs / (n * frac * (1 - frac))
+            gradient = np.stack([
+                dx_dfrac * -frac / A,                         # d/dA
+                concs / K,                                    # d/dK
+                -concs * np.log(frac / (1 - frac)) / n**2,    # d/dn
+                dx_dfrac * -1 / A,                            # d/db
+            ], axis=-1)
+            variance = np.einsum('...i,ij,...j->...', gradient, self.covariance, gradient) + (dx_dfrac / A * reading_std)**2
+        conc_stds = np.sqrt(variance)
+
+        low, high = self.conc_range
+        in_range = np.isfinite(concs) & (concs >= low) & (concs <= high)
+        return concs, conc_stds, in_range
+
+    def to_g_per_ml(self, concs):
+        '''Concentration index (decades above the lowest concentration) to g/ml, as printed by analysis'''
+        return 10**(self.lowest_conc_exponent + np.asarray(concs, dtype=float))
+
 def format_with_e(x, pos):
     '''
     Used in pyplot, for formatting the y-axis so that the numbers use e notation, not leading 0's or e's above the y-axis
@@ -15,6 +15,16 @@ import csv
 import tkinter as tk
 from tkinter import filedialog
 from tkinter import ttk
+import numpy as np
+
+from smu_blit import BlitRenderer
+
+
+# rendering mode: persistent lines + blitting (True), or clearing and replotting the axes every frame (False)
+USE_BLIT = True
+BLIT_INTERVAL_MS = 50 # time between frames in blit mode
+MAX_PLOT_POINTS = 4000 # max points drawn per channel in blit mode, longer runs are decimated for display only
+MAX_LINES_PER_FRAME = 500 # serial lines handled per frame in blit mode, keeps the GUI responsive
 
 
 # Setup serial connection
@@ -37,6 +47,9 @@ ser.write(b'start\n')
 
 
 def redraw_plot(*args):
+    if USE_BLIT:
+        renderer.full_redraw()
+        return
     ax.clear()
     
     # calculate max and min current for y-limits
@@ -154,6 +167,24 @@ plt.subplots_adjust(right=0.8)
 canvas = FigureCanvasTkAgg(fig, master=plot_frame)
 canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
+def custom_current_range():
+    # custom y-limits (µA) typed into the entries, or None to fit the data
+    if not use_custom_range.get():
+        return None
+    try:
+        return float(custom_min_entry.get()), float(custom_max_entry.get())
+    except ValueError:
+        return None
+
+renderer = None
+if USE_BLIT:
+    renderer = BlitRenderer(fig, ax, canvas, channel_enabled,
+                            title=f"Time vs Drain-Source Current",
+                            xlabel=rf"Time ($s$)",
+                            ylabel=rf"Drain-Source Current, $I_{{DS}}$ ($\mu A$)",
+                            custom_ylim=custom_current_range,
+                            max_plot_points=MAX_PLOT_POINTS)
+
 
 
 # set up CSV file saving
@@ -259,8 +290,45 @@ def update(frame):
         print(f"Error parsing line: {e}")
 
 
+# update helper for blit mode, handles every serial line already waiting and then draws one frame
+def update_blit():
+    handled = 0
+    while ser.in_waiting and handled < MAX_LINES_PER_FRAME:
+        line = ser.readline().decode().strip()
+        handled += 1
+
+        parts = line.split(",")
+        if len(parts) != 20:
+            print("Mis-formatted serial line:")
+            print(parts)
+            continue
+        try:
+            step_number = int(parts[0])
+            time_step = float(parts[1])
+            drain_voltage = float(parts[2])
+            gate_voltage = float(parts[3])
+            readings = list(map(float, parts[4:]))
+        except ValueError as e:
+            print(f"Error parsing line: {e}")
+            continue
+
+        renderer.append(time_step, np.array(readings) * 1e6)
+
+        # Write to CSV, flushed once per frame below
+        if csv_writer:
+            csv_writer.writerow([step_number, time_step, drain_voltage, gate_voltage] + readings)
+
+    if handled and csv_writer:
+        csv_file.flush()
+    renderer.frame()
+    root.after(BLIT_INTERVAL_MS, update_blit)
+
+
 if ask_save_file_and_start():
-    ani = animation.FuncAnimation(fig, update, interval=50)
+    if USE_BLIT:
+        root.after(BLIT_INTERVAL_MS, update_blit)
+    else:
+        ani = animation.FuncAnimation(fig, update, interval=50)
     root.mainloop()
 else:
     print("Exiting because no save file was selected.")
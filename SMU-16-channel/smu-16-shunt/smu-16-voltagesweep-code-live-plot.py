@@ -23,8 +23,20 @@ from tkinter import filedialog
 import atexit
 import numpy as np
 
+from smu_blit import BlitRenderer
+
+
+# rendering mode: persistent lines + blitting (True), or clearing and replotting the axes every frame (False)
+USE_BLIT = True
+BLIT_INTERVAL_MS = 50 # time between frames in blit mode
+MAX_PLOT_POINTS = 4000 # max points drawn per channel in blit mode, longer runs are decimated for display only
+MAX_LINES_PER_FRAME = 500 # serial lines handled per frame in blit mode, keeps the GUI responsive
+
 
 def redraw_plot(*args):
+    if USE_BLIT:
+        renderer.full_redraw()
+        return
     ax.clear()
     max_current = float('-inf')
     min_current = float('inf')
@@ -69,13 +81,17 @@ def plot_transcondutance():
     plotted_any = False
     transconductance_gate_voltages = []
 
+    if USE_BLIT:
+        x, currents = renderer.data() # currents already in µA
+    else:
+        x = np.array(gate_voltages)
+        currents = np.array(channel_data) * 1000000
+
     for i in range(16):
         if channel_enabled[i].get():
-            y = np.array(channel_data[i])
-            x = np.array(gate_voltages)
-            dy_dx = np.gradient(y, x)
+            dy_dx = np.gradient(currents[i], x)
 
-            ax_deriv.plot(x, dy_dx*1000000, label=f'dI/dV Ch {i}')
+            ax_deriv.plot(x, dy_dx, label=f'dI/dV Ch {i}')
             plotted_any = True
             
             transconductance_gate_voltages.append(x[np.argmin(dy_dx)])
@@ -136,6 +152,14 @@ plt.subplots_adjust(right=0.8)
 canvas = FigureCanvasTkAgg(fig, master=plot_frame)
 canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
+renderer = None
+if USE_BLIT:
+    renderer = BlitRenderer(fig, ax, canvas, channel_enabled,
+                            title=f"Gate Voltage vs Drain-Source Current",
+                            xlabel=rf"Gate Voltage, $V_{{GS}}$ ($V$)",
+                            ylabel=rf"Drain-Source Current, $I_{{DS}}$ ($\mu A$)",
+                            max_plot_points=MAX_PLOT_POINTS)
+
 
 
 # set up CSV file saving
@@ -182,6 +206,17 @@ ser.write(b'start\n')  # Begin transmission
 gate_voltages = []
 channel_data = [[] for _ in range(16)]
 
+def add_post_sweep_buttons():
+    global plot_deriv_button
+    # adds button for allowing user to plot the transconductance point once all voltages are swept
+    plot_deriv_button = tk.Button(control_frame, text="Plot Transconductance", command=plot_transcondutance)
+    plot_deriv_button.pack(pady=10)
+
+    # add button below checkboxes in the control frame, for saving the image
+    save_button = tk.Button(control_frame, text="Save Plot Image", command=save_image)
+    save_button.pack(pady=5)
+
+
 # update helper function called for the animation, for reading new serial data
 def update(frame):
     global gate_voltages, channel_data, plot_deriv_button, save_image
@@ -192,14 +227,7 @@ def update(frame):
     if line == "DONE":
         # end loop so that we don't have to pretty the teeny's button
         ani.event_source.stop()
-        
-        # adds button for allowing user to plot the transconductance point once all voltages are swept
-        plot_deriv_button = tk.Button(control_frame, text="Plot Transconductance", command=plot_transcondutance)
-        plot_deriv_button.pack(pady=10)
-
-        # add button below checkboxes in the control frame, for saving the image
-        save_button = tk.Button(control_frame, text="Save Plot Image", command=save_image)
-        save_button.pack(pady=5)
+        add_post_sweep_buttons()
 
     try:
         parts = line.split(",")
@@ -251,8 +279,53 @@ def update(frame):
 
 
 
+# update helper for blit mode, handles every serial line already waiting and then draws one frame
+def update_blit():
+    handled = 0
+    while ser.in_waiting and handled < MAX_LINES_PER_FRAME:
+        line = ser.readline().decode().strip()
+        handled += 1
+
+        # case where the full sweep is complete, draw the final frame and end the loop
+        if line == "DONE":
+            if csv_writer:
+                csv_file.flush()
+            renderer.full_redraw()
+            add_post_sweep_buttons()
+            return
+
+        parts = line.split(",")
+        if len(parts) != 20:
+            print("Mis-formatted serial line:")
+            print(parts)
+            continue
+        try:
+            step_number = int(parts[0])
+            time_step = float(parts[1])
+            drain_voltage = float(parts[2])
+            gate_voltage = float(parts[3])
+            readings = list(map(float, parts[4:]))
+        except ValueError as e:
+            print(f"Error parsing line: {e}")
+            continue
+
+        renderer.append(gate_voltage, np.array(readings) * 1000000)
+
+        # Write to CSV, flushed once per frame below
+        if csv_writer:
+            csv_writer.writerow([step_number, time_step, drain_voltage, gate_voltage] + readings)
+
+    if handled and csv_writer:
+        csv_file.flush()
+    renderer.frame()
+    root.after(BLIT_INTERVAL_MS, update_blit)
+
+
 if ask_save_file_and_start():
-    ani = animation.FuncAnimation(fig, update, interval=50)
+    if USE_BLIT:
+        root.after(BLIT_INTERVAL_MS, update_blit)
+    else:
+        ani = animation.FuncAnimation(fig, update, interval=50)
     root.mainloop()
 else:
     print("Exiting because no save file was selected.")
@@ -0,0 +1,140 @@
+'''
+Blitting live-plot renderer shared by the 16-channel shunt SMU live-plot scripts
+(smu-16-timesweep-code-live-plot.py, smu-16-voltagesweep-code-live-plot.py).
+
+    renderer = BlitRenderer(fig, ax, canvas, channel_enabled, title, xlabel, ylabel)
+    renderer.append(x, readings_ua)    # per sample, 16 currents in µA
+    renderer.frame()                   # per GUI frame, blits the lines or redraws the axes when needed
+    renderer.full_redraw()             # after toggling channels or changing the current range
+'''
+
+import numpy as np
+
+
+MAX_PLOT_POINTS = 4000 # default max points drawn per channel
+
+
+class BlitRenderer:
+    '''
+    Live plot renderer that keeps one persistent Line2D per channel and only redraws the lines
+    (blitting) on each frame. Samples are stored in preallocated numpy buffers (in µA) and the
+    per-channel min/max currents are tracked as samples arrive, so the work done per frame does not
+    grow with the length of the run. The axes, ticks and legend are only redrawn when the data leaves
+    the current limits or the visible channels change, and the limits are set with headroom so this
+    happens rarely.
+    '''
+    def __init__(self, fig, ax, canvas, channel_enabled, title, xlabel, ylabel, custom_ylim=None, capacity=1024,
+                 max_plot_points=MAX_PLOT_POINTS):
+        self.fig = fig
+        self.ax = ax
+        self.canvas = canvas
+        self.channel_enabled = channel_enabled
+        self.custom_ylim = custom_ylim # callable returning (ymin, ymax) in µA, or None to use the data range
+        self.max_plot_points = max_plot_points # longer runs are decimated for display only
+
+        self.n = 0
+        self.x = np.zeros(capacity)
+        self.y = np.zeros((16, capacity))
+        self.y_min = np.full(16, np.inf) # running extrema per channel, µA
+        self.y_max = np.full(16, -np.inf)
+
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        self.lines = [ax.plot([], [], label=f'Channel {i}', animated=True)[0] for i in range(16)]
+        self.background = None
+        canvas.mpl_connect('draw_event', self.on_draw)
+
+    def append(self, x, readings_ua):
+        if self.n == len(self.x):
+            self.x = np.concatenate([self.x, np.zeros(len(self.x))])
+            self.y = np.concatenate([self.y, np.zeros(self.y.shape)], axis=1)
+        self.x[self.n] = x
+        self.y[:, self.n] = readings_ua
+        np.minimum(self.y_min, readings_ua, out=self.y_min)
+        np.maximum(self.y_max, readings_ua, out=self.y_max)
+        self.n += 1
+
+    def data(self):
+        '''Returns views of the stored x values and the (16 x points) currents in µA'''
+        return self.x[:self.n], self.y[:, :self.n]
+
+    def visible_channels(self):
+        return np.array([var.get() for var in self.channel_enabled])
+
+    def target_limits(self):
+        '''x and y limits that fit the data, with headroom so they do not need to change every frame'''
+        x = self.x[:self.n]
+        x_lo, x_hi = x.min(), x.max()
+        x_span = (x_hi - x_lo) or 1.0
+        xlim = (x_lo, x_hi + 0.25 * x_span)
+
+        ylim = self.custom_ylim() if self.custom_ylim else None
+        if ylim is None:
+            visible = self.visible_channels()
+            if not visible.any():
+                return xlim, self.ax.get_ylim()
+            y_lo, y_hi = self.y_min[visible].min(), self.y_max[visible].max()
+            y_span = (y_hi - y_lo) or 1.0
+            ylim = (y_lo - 0.1 * y_span, y_hi + 0.1 * y_span)
+        return xlim, ylim
+
+    def limits_exceeded(self):
+        x_lo, x_hi = self.ax.get_xlim()
+        y_lo, y_hi = self.ax.get_ylim()
+        x_last = self.x[self.n - 1]
+        if x_last < x_lo or x_last > x_hi:
+            return True
+        custom = self.custom_ylim() if self.custom_ylim else None
+        if custom is not None:
+            return tuple(custom) != tuple(self.ax.get_ylim())
+        visible = self.visible_channels()
+        if not visible.any():
+            return False
+        return self.y_min[visible].min() < y_lo or self.y_max[visible].max() > y_hi
+
+    def set_line_data(self):
+        # decimate for display only, so drawing cost is bounded by max_plot_points
+        stride = max(1, -(-self.n // self.max_plot_points))
+        x = self.x[:self.n:stride]
+        for i, line in enumerate(self.lines):
+            if line.get_visible():
+                line.set_data(x, self.y[i, :self.n:stride])
+
+    def on_draw(self, event):
+        # a full draw just happened (resize, limit change, toggle), grab the new background
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_lines()
+
+    def draw_lines(self):
+        for line in self.lines:
+            if line.get_visible():
+                self.ax.draw_artist(line)
+
+    def full_redraw(self):
+        visible = self.visible_channels()
+        for i, line in enumerate(self.lines):
+            line.set_visible(bool(visible[i]))
+        if self.n > 0:
+            self.set_line_data()
+            xlim, ylim = self.target_limits()
+            self.ax.set_xlim(*xlim)
+            self.ax.set_ylim(*ylim)
+        handles = [line for line in self.lines if line.get_visible()]
+        legend = self.ax.get_legend()
+        if legend:
+            legend.remove()
+        if handles:
+            self.ax.legend(handles=handles, ncol=1, fontsize='small', loc='center left', bbox_to_anchor=(1, 0.5))
+        self.canvas.draw()
+
+    def frame(self):
+        if self.n == 0:
+            return
+        if self.background is None or self.limits_exceeded():
+            self.full_redraw()
+            return
+        self.set_line_data()
+        self.canvas.restore_region(self.background)
+        self.draw_lines()
+        self.canvas.blit(self.fig.bbox)
@@ -17,6 +17,11 @@ import os
 
 import ctypes
 
+from smu_emulator import EmulatedSerial
+from smu_live_server import start_live_server
+from smu_pipeline import Pipeline, CsvSink, Scale, DiracExtractor, LiveServerSink
+from smu_protocol import load_protocol, describe, run_folder, phase_csv_path, phase_sweep_args, PhaseMonitor
+
 
 
 
@@ -26,6 +31,9 @@ import ctypes
 # SERIAL_PORT = "COM6"
 BAUD_RATE = 115200
 N_CHANNELS = 16
+LIVE_SERVER_PORT = None          # e.g. 8765 to let browsers / Python clients watch the run (see smu_live_server.py)
+LIVE_SERVER_HOST = "127.0.0.1"   # "0.0.0.0" to serve the whole LAN
+EMULATE = False                  # True runs against the emulated SMU (smu_emulator.py) instead of the Teensy
 
 
 class LivePlotter(QtWidgets.QMainWindow):
@@ -45,6 +53,7 @@ class LivePlotter(QtWidgets.QMainWindow):
         self.x = []
         self.y = [[] for _ in range(N_CHANNELS)]
         self.sweep_running = False
+        self.protocol_running = False
         self.sweep_index = 0
 
 
@@ -77,8 +86,13 @@ class LivePlotter(QtWidgets.QMainWindow):
         stop_btn.setStyleSheet("background-color: red; color: white; font-weight: bold;")
         stop_btn.clicked.connect(self.stop_sweep)
 
+        protocol_btn = QtWidgets.QPushButton("Run Protocol")
+        protocol_btn.setStyleSheet("background-color: #1f5fbf; color: white; font-weight: bold;")
+        protocol_btn.clicked.connect(self.run_protocol)
+
         control.addWidget(start_btn)
         control.addWidget(stop_btn)
+        control.addWidget(protocol_btn)
 
         # Gate voltage range
         control.addWidget(QtWidgets.QLabel("Gate Voltage Range (V)"))
@@ -258,7 +272,14 @@ class LivePlotter(QtWidgets.QMainWindow):
         self.csv_file = None
         self.csv_writer = None
         self.current_sweep_csv = None
+        self.csv_path = None
         self.ser = None
+        self.pipeline = None
+
+        # optional live-data server for other viewers
+        self.live_server = None
+        if LIVE_SERVER_PORT:
+            self.live_server = start_live_server(LIVE_SERVER_HOST, LIVE_SERVER_PORT, N_CHANNELS)
 
 
 ###############################
@@ -290,12 +311,19 @@ class LivePlotter(QtWidgets.QMainWindow):
             return
         self.current_sweep_csv = self.csv_file
 
+        self.prepare_run()
+        self.run_sweeps()
+
+    def prepare_run(self):
         # -----------------------------
         # Serial (keep it open if already)
         # -----------------------------
         if not self.ser or not self.ser.is_open:
             self.init_serial()
 
+        # processing stages for this run
+        self.pipeline = self.build_pipeline()
+
 
         # Clear Dirac tracking
         for ch in range(N_CHANNELS):
@@ -304,63 +332,32 @@ class LivePlotter(QtWidgets.QMainWindow):
             self.dirac_vals_rev[ch].clear()
             self.dirac_curves_fwd[ch].setData([], [])
             self.dirac_curves_rev[ch].setData([], [])
-            
 
-        
+    def run_sweeps(self, phase=None):
+        '''
+        Back-to-back sweeps into the open CSV until Stop is pressed, or for a
+        protocol phase until its stop condition is reached. Returns True if a
+        protocol phase finished on its own.
+        '''
         self.sweep_running = True    
         self.experiment_start_time = time.time()
         self.sweep_index = 0
+        self.publish_status("running")
+        monitor = PhaseMonitor(phase) if phase else None
         
         while self.sweep_running:
-            # Validate gate voltage inputs
-            try:
-                vmin = float(self.vmin_box.text())
-                vmax = float(self.vmax_box.text())
-            except ValueError:
-                print("Input Error", "Gate voltages must be numbers.")
-    
-            if vmin < -1.5 or vmax > 1.5 or vmin >= vmax:
-                print("Gate voltages must satisfy:\n-1.5 ≤ min < max ≤ 1.5")
+            if phase:
+                vmin, vmax, sweep_delay_ms, gate_v_res = phase_sweep_args(phase)
+            else:
+                inputs = self.read_sweep_inputs()
+                if inputs is None:
+                    self.sweep_running = False
+                    return False
+                vmin, vmax, sweep_delay_ms, gate_v_res = inputs
 
             self.plot.setXRange(vmin, vmax, padding=0)
             self.plot.enableAutoRange(axis='x', enable=False)
     
-            # Validate step delay input
-            try:
-                sweep_delay_ms = float(self.sweep_delay_box.text())
-            except ValueError:
-                QtWidgets.QMessageBox.critical(
-                    self, "Input Error", "Sweep delay must be a number (ms)."
-                )
-                return
-        
-            if sweep_delay_ms <= 0 or sweep_delay_ms > 5000:
-                QtWidgets.QMessageBox.critical(
-                    self,
-                    "Input Error",
-                    "Sweep delay must be between 0 and 5000 ms."
-                )
-                return
-
-
-
-            # Validate gate voltage resolution input
-            try:
-                gate_v_res = float(self.gate_v_res_box.text())
-            except ValueError:
-                QtWidgets.QMessageBox.critical(
-                    self, "Input Error", "Gate voltage resolution must be an integer (points/Volt)."
-                )
-                return
-        
-            if gate_v_res <= 10 or gate_v_res > 2000:
-                QtWidgets.QMessageBox.critical(
-                    self,
-                    "Input Error",
-                    "Sweep delay must be between 10 and 2000 points/Volt."
-                )
-                return
-    
             # Clear live sweep graph and prepare x and y values
             self.x.clear()
             for ch in self.y:
@@ -401,33 +398,183 @@ class LivePlotter(QtWidgets.QMainWindow):
                 t = float(parts[1])
                 vg = float(parts[2])
                 currents = list(map(float, parts[3:]))
+
+                # CSV row, µA scaling, live server, ... (see build_pipeline)
+                block = self.pipeline.push_samples(self.sweep_index, step, t, vg, currents)
     
                 self.x.append(vg)
+                currents_ua = block.currents[0]
                 for i in range(N_CHANNELS):
-                    self.y[i].append(currents[i] * 1e6)
-                        
-    
-                # write to CSV
-                self.csv_writer.writerow([self.sweep_index, step, t, vg] + currents)
-                self.current_sweep_csv.flush()
+                    self.y[i].append(currents_ua[i])
     
                 self.update_plot()
                 QtWidgets.QApplication.processEvents()
 
             if sweep_completed and self.sweep_running:
                 # Compute Dirac points for this sweep
-                self.compute_and_plot_dirac()
+                dirac_fwd = self.compute_and_plot_dirac()
                 self.sweep_index += 1
+                self.publish_status("running")
+
+                if monitor:
+                    monitor.add_sweep(dirac_fwd)
+                    reason = monitor.finished()
+                    if reason:
+                        print(f"Phase {phase['name']}-{phase['label']} finished: {reason}")
+                        break
 
             # gives teensy time between sweeps to reset
             QtWidgets.QApplication.processEvents()
             time.sleep(0.05)
 
+        completed = self.sweep_running
+        self.sweep_running = False
         print("Sweep loop exited cleanly")
+        return completed
+
+    def read_sweep_inputs(self):
+        '''Sweep settings from the control panel, None (after an error dialog) if invalid'''
+        # Validate gate voltage inputs
+        try:
+            vmin = float(self.vmin_box.text())
+            vmax = float(self.vmax_box.text())
+        except ValueError:
+            print("Input Error", "Gate voltages must be numbers.")
+
+        if vmin < -1.5 or vmax > 1.5 or vmin >= vmax:
+            print("Gate voltages must satisfy:\n-1.5 ≤ min < max ≤ 1.5")
+
+        # Validate step delay input
+        try:
+            sweep_delay_ms = float(self.sweep_delay_box.text())
+        except ValueError:
+            QtWidgets.QMessageBox.critical(
+                self, "Input Error", "Sweep delay must be a number (ms)."
+            )
+            return None
+    
+        if sweep_delay_ms <= 0 or sweep_delay_ms > 5000:
+            QtWidgets.QMessageBox.critical(
+                self,
+                "Input Error",
+                "Sweep delay must be between 0 and 5000 ms."
+            )
+            return None
+
+
+
+        # Validate gate voltage resolution input
+        try:
+            gate_v_res = float(self.gate_v_res_box.text())
+        except ValueError:
+            QtWidgets.QMessageBox.critical(
+                self, "Input Error", "Gate voltage resolution must be an integer (points/Volt)."
+            )
+            return None
+    
+        if gate_v_res <= 10 or gate_v_res > 2000:
+            QtWidgets.QMessageBox.critical(
+                self,
+                "Input Error",
+                "Sweep delay must be between 10 and 2000 points/Volt."
+            )
+            return None
+
+        return vmin, vmax, sweep_delay_ms, gate_v_res
+
+
+    # -----------------------------
+    # Protocol Functions
+    # -----------------------------
+    def run_protocol(self):
+        '''Runs every phase of a protocol file back-to-back, see smu_protocol.py for the format'''
+        if self.sweep_running or self.protocol_running:
+            print("Sweep already running - Run Protocol ignored")
+            return
+
+        path, _ = QFileDialog.getOpenFileName(self, "Open Protocol", "", "Protocol Files (*.json)")
+        if not path:
+            return
+        try:
+            protocol = load_protocol(path)
+        except (OSError, ValueError) as e:
+            QtWidgets.QMessageBox.critical(self, "Protocol Error", str(e))
+            return
+
+        base_dir = protocol.get("output_dir") or QFileDialog.getExistingDirectory(self, "Select Data Folder")
+        if not base_dir:
+            return
+        os.makedirs(run_folder(protocol, base_dir), exist_ok=True)
+        print(describe(protocol))
+
+        self.protocol_running = True
+        n_phases = len(protocol["phases"])
+        for i, phase in enumerate(protocol["phases"]):
+            if not self.protocol_running:
+                break
+            step_title = f"Protocol step {i + 1}/{n_phases}"
+
+            if phase.get("prompt"):
+                answer = QtWidgets.QMessageBox.question(
+                    self, step_title, phase["prompt"],
+                    QtWidgets.QMessageBox.Ok | QtWidgets.QMessageBox.Cancel
+                )
+                if answer != QtWidgets.QMessageBox.Ok:
+                    break
+
+            if phase.get("wait_min"):
+                print(f"{step_title}: waiting {phase['wait_min']} min")
+                self.publish_status("waiting")
+                if not self.protocol_wait(60 * phase["wait_min"]):
+                    break
+
+            if phase["type"] == "wait":
+                continue
+
+            if not self.setup_csv(phase_csv_path(protocol, phase, base_dir)):
+                break
+            self.current_sweep_csv = self.csv_file
+            self.prepare_run()
+            if self.ser is None:
+                break
+
+            print(f"{step_title}: {phase['type']} {os.path.basename(self.csv_path)}")
+            if not self.run_sweeps(phase):
+                break
+            self.finish_phase()
+
+        completed = self.protocol_running
+        self.protocol_running = False
+        self.finish_phase()
+        self.publish_status("protocol done" if completed else "protocol stopped")
+        print("Protocol finished" if completed else "Protocol stopped")
+
+    def protocol_wait(self, seconds):
+        '''Keeps the GUI responsive while waiting, False if Stop was pressed'''
+        end_time = time.time() + seconds
+        while self.protocol_running and time.time() < end_time:
+            QtWidgets.QApplication.processEvents()
+            time.sleep(0.05)
+        return self.protocol_running
+
+    def finish_phase(self):
+        # close this phase's file, the serial connection stays open for the next phase
+        if self.pipeline:
+            self.pipeline.close()
+            self.pipeline = None
+        if self.current_sweep_csv:
+            self.current_sweep_csv.close()
+            self.current_sweep_csv = None
+            self.csv_writer = None
 
     def stop_sweep(self):
-        # Stop the running loop
+        # Stop the running loop (and any protocol)
         self.sweep_running = False
+        self.protocol_running = False
+        self.publish_status("stopped")
+
+        if self.pipeline:
+            self.pipeline.close()
 
         # Close current CSV
         if self.current_sweep_csv:
@@ -496,47 +643,53 @@ class LivePlotter(QtWidgets.QMainWindow):
 
         # Time since the start of the experiment (not just this sweep)
         t = time.time() - self.experiment_start_time
-    
-        # Compute Dirac points for all channels
-        dirac_row = [""] * (4 + N_CHANNELS)  # Placeholder for SWEEP_IDX, POINT, TIME, V_GATE, I_CH0..15
-        dirac_values_fwd = []
-        dirac_values_rev = []
+
+        # Dirac extraction, Dirac CSV row and live server publishing run as pipeline stages
+        sweep = self.pipeline.end_sweep(self.sweep_index, time=t)
+        dirac_values_fwd = sweep.results["dirac_fwd"]
+        dirac_values_rev = sweep.results["dirac_rev"]
     
         for ch in range(N_CHANNELS):
-            if len(self.x) < 2:
-                dirac_v = ""
-            else:
-                y = np.array(self.y[ch])
-                x = np.array(self.x)  
-                min_idx_fwd = np.argmin(np.abs(y[:len(y)//2]))
-                min_idx_rev = np.argmin(np.abs(y[len(y)//2:])) + len(y)//2 # to acount for that we are looking at the second half of the y-list
-                dirac_v_fwd = x[min_idx_fwd]
-                dirac_v_rev = x[min_idx_rev]
-    
             # Store for tracking
             self.dirac_times[ch].append(t)
-            self.dirac_vals_fwd[ch].append(dirac_v_fwd)
-            self.dirac_vals_rev[ch].append(dirac_v_rev)
-            
+            self.dirac_vals_fwd[ch].append(dirac_values_fwd[ch])
+            self.dirac_vals_rev[ch].append(dirac_values_rev[ch])
 
-            # WILL THIS MESS STUFF UP???
             # Update Dirac curve
             self.dirac_curves_fwd[ch].setData(self.dirac_times[ch], self.dirac_vals_fwd[ch])
             self.dirac_curves_rev[ch].setData(self.dirac_times[ch], self.dirac_vals_rev[ch])
-        
-            dirac_values_fwd.append(dirac_v_fwd)
-            dirac_values_rev.append(dirac_v_rev)
-    
-        # Build the CSV row: first columns are sweep point placeholders, last columns are Dirac points
-        csv_row = dirac_row + [self.sweep_index] + dirac_values_fwd + dirac_values_rev
-    
-        # Write to CSV
-        if self.current_sweep_csv:
-            self.csv_writer.writerow(csv_row)
-            self.current_sweep_csv.flush()
+
+        return dirac_values_fwd
+
+    def build_pipeline(self):
+        '''
+        Per-sample and per-sweep processing for one run. Add stages here (smoothing,
+        drift correction, event detectors, ...) instead of editing the read loop;
+        heavy ones can be added with mode="thread" or mode="process".
+        '''
+        pipeline = Pipeline()
+        # raw sample rows (A): SWEEP_IDX, POINT, TIME, V_GATE, I_CH0..15
+        pipeline.add(CsvSink(self.current_sweep_csv, ["sweep_idx", "point", "t", "vg", "currents"]))
+        pipeline.add(Scale(1e6))  # A -> µA
+        pipeline.add(DiracExtractor())
+        # Dirac rows: empty sample columns, DIRAC_SWEEP_IDX, DIRAC_V_FWD_CH0..15, DIRAC_V_REV_CH0..15
+        pipeline.add(CsvSink(self.current_sweep_csv, [None] * (4 + N_CHANNELS) + ["sweep_idx", "dirac_fwd", "dirac_rev"],
+                             on="sweep"))
+        if self.live_server:
+            pipeline.add(LiveServerSink(self.live_server))
+        return pipeline
         
     
+    def publish_status(self, state):
+        if self.live_server:
+            self.live_server.publish_status(state=state, sweep_index=self.sweep_index, csv_path=self.csv_path)
+
     def init_serial(self):
+        if EMULATE:
+            self.ser = EmulatedSerial()
+            print("Serial connected on emulated SMU")
+            return
+
         # code for specifying the PORT to use
         # try:
         #     self.ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=2)
@@ -585,21 +738,24 @@ class LivePlotter(QtWidgets.QMainWindow):
             print(f"Error sending {msg}: {e}")
 
 
-    def setup_csv(self):
-        dialog = QFileDialog(self, "Save CSV")
-        dialog.setAcceptMode(QFileDialog.AcceptSave)
-        dialog.setNameFilter("CSV Files (*.csv)")
-        dialog.setOptions(QFileDialog.DontUseNativeDialog)
-        dialog.setWindowFlags(dialog.windowFlags() | Qt.WindowStaysOnTopHint)  # force on top
-    
-        if dialog.exec_() == QFileDialog.Accepted:
-            path = dialog.selectedFiles()[0]
-            if not path.lower().endswith(".csv"):
-                path += ".csv"
-        else:
-            return False
+    def setup_csv(self, path=None):
+        # protocol phases pass their file name, manual runs ask for one
+        if path is None:
+            dialog = QFileDialog(self, "Save CSV")
+            dialog.setAcceptMode(QFileDialog.AcceptSave)
+            dialog.setNameFilter("CSV Files (*.csv)")
+            dialog.setOptions(QFileDialog.DontUseNativeDialog)
+            dialog.setWindowFlags(dialog.windowFlags() | Qt.WindowStaysOnTopHint)  # force on top
+        
+            if dialog.exec_() == QFileDialog.Accepted:
+                path = dialog.selectedFiles()[0]
+                if not path.lower().endswith(".csv"):
+                    path += ".csv"
+            else:
+                return False
     
         self.csv_file = open(path, "w", newline="")
+        self.csv_path = path
         self.csv_writer = csv.writer(self.csv_file)
     
         header = ["SWEEP_IDX", "POINT", "TIME", "V_GATE"] \
@@ -739,6 +895,8 @@ class LivePlotter(QtWidgets.QMainWindow):
     def closeEvent(self, event):
         print("Exiting program.")
         self.stop_sweep()
+        if self.live_server:
+            self.live_server.shutdown()
         event.accept()
 
 
@@ -748,7 +906,8 @@ class LivePlotter(QtWidgets.QMainWindow):
 # -----------------------------
 if __name__ == "__main__":
     myappid = "gfet.liveplotter.v1"  # any unique string
-    ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
+    if hasattr(ctypes, "windll"):  # Windows only, lets the emulator run elsewhere
+        ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
 
 
     app = QtWidgets.QApplication(sys.argv)
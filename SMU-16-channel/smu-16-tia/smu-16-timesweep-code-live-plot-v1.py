@@ -10,6 +10,8 @@ import pyqtgraph as pg
 from PyQt5.QtWidgets import QFileDialog
 from PyQt5.QtCore import Qt
 
+from smu_pipeline import Pipeline, CsvSink, Scale, TimeDerivative, SlidingWindow
+
 
 # -----------------------------
 # CONFIG
@@ -29,9 +31,10 @@ class LivePlotter(QtWidgets.QMainWindow):
         # -----------------------------
         # Data buffers
         # -----------------------------
-        self.t = []
-        self.y = [[] for _ in range(N_CHANNELS)]
-        self.dy_dt = [[] for _ in range(N_CHANNELS)]
+        # views into the pipeline's sliding window, t: (n,), y and dy_dt: (N_CHANNELS, n)
+        self.t = np.empty(0)
+        self.y = np.empty((N_CHANNELS, 0))
+        self.dy_dt = np.empty((N_CHANNELS, 0))
         self.point_idx = 0
         self.sweep_running = False
 
@@ -180,6 +183,8 @@ class LivePlotter(QtWidgets.QMainWindow):
         self.csv_file = None
         self.csv_writer = None
         self.ser = None
+        self.pipeline = None
+        self.window = None
 
     # -----------------------------
     # Start sweep
@@ -225,10 +230,8 @@ class LivePlotter(QtWidgets.QMainWindow):
             return
         
 
-        self.t.clear()
-        for ch in range(N_CHANNELS):
-            self.y[ch].clear()
-            self.dy_dt[ch].clear()
+        # processing stages for this run
+        self.pipeline = self.build_pipeline()
 
         self.sweep_running = True
         self.point_idx = 0
@@ -248,40 +251,15 @@ class LivePlotter(QtWidgets.QMainWindow):
                 continue
 
             t = float(parts[0])
-            currents = np.array(parts[1:], dtype=float) * 1e6
-
-            self.t.append(t)
-
-            for ch in range(N_CHANNELS):
-                self.y[ch].append(currents[ch])
-
-                if len(self.t) >= 2:
-                    dt = self.t[-1] - self.t[-2]
-                    di = self.y[ch][-1] - self.y[ch][-2]
-                    self.dy_dt[ch].append(di / dt if dt > 0 else 0)
-                else:
-                    self.dy_dt[ch].append(0)
-
-            # self.csv_writer.writerow([t] + currents.tolist())
-            # self.csv_file.flush()
-            self.csv_writer.writerow(
-                [self.point_idx, t, gate_v]
-                + currents.tolist()
-                + [self.dy_dt[ch][-1] for ch in range(N_CHANNELS)]
-            )
-            self.csv_file.flush()
-            
-            self.point_idx += 1
-
-
+            currents = np.array(parts[1:], dtype=float)
 
+            # µA scaling, dI/dt, CSV row and sliding window (see build_pipeline)
+            self.pipeline.push_samples(0, self.point_idx, t, gate_v, currents)
+            self.point_idx += 1
 
-            # Sliding window
-            if len(self.t) > MAX_POINTS:
-                self.t = self.t[-MAX_POINTS:]
-                for ch in range(N_CHANNELS):
-                    self.y[ch] = self.y[ch][-MAX_POINTS:]
-                    self.dy_dt[ch] = self.dy_dt[ch][-MAX_POINTS:]
+            self.t = self.window.get("t")
+            self.y = self.window.get("currents").T
+            self.dy_dt = self.window.get("dI_dt").T
             
 
             self.update_plot()
@@ -303,11 +281,29 @@ class LivePlotter(QtWidgets.QMainWindow):
 
         self.ser = None
 
+        if self.pipeline:
+            self.pipeline.close()
+
         if self.csv_file:
             self.csv_file.close()
             self.csv_file = None
             self.csv_writer = None
 
+    def build_pipeline(self):
+        '''
+        Per-sample processing for one run. Add stages here (smoothing, drift
+        correction, event detectors, ...) instead of editing the read loop;
+        heavy ones can be added with mode="thread" or mode="process".
+        '''
+        pipeline = Pipeline(keep_sweep=False)
+        pipeline.add(Scale(1e6))  # A -> µA
+        pipeline.add(TimeDerivative())  # results["dI_dt"], µA/s
+        # POINT_IDX, TIME, V_GATE, I_CH0..15 (µA), DI/DT0..15
+        pipeline.add(CsvSink(self.csv_file, ["point", "t", "vg", "currents", "dI_dt"]))
+        # the last MAX_POINTS samples are plotted
+        self.window = pipeline.add(SlidingWindow(MAX_POINTS, ("t", "currents", "dI_dt")))
+        return pipeline
+
     # -----------------------------
     # Plot update
     # -----------------------------
@@ -354,8 +350,8 @@ class LivePlotter(QtWidgets.QMainWindow):
         ymin, ymax = None, None
         # Go through all visible channels
         for i, cb in enumerate(self.channel_enabled):
-            if cb.isChecked() and self.y[i]:
-                data = np.array(self.y[i])
+            if cb.isChecked() and len(self.y[i]):
+                data = self.y[i]
                 ch_min, ch_max = data.min(), data.max()
                 if ymin is None or ch_min < ymin:
                     ymin = ch_min
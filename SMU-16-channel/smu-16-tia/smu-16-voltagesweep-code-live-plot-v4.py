@@ -20,6 +20,8 @@ from PyQt5.QtCore import Qt
 # SERIAL_PORT = "COM6"
 BAUD_RATE = 115200
 N_CHANNELS = 16
+GM_HALF_WINDOW = 3 # points on each side of a sample used for the smoothed dI/dVg
+GM_INIT_CAPACITY = 1024 # starting size of the transconductance buffers, doubled when full
 
 # -----------------------------
 # MAIN APP
@@ -28,7 +30,7 @@ class LivePlotter(QtWidgets.QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("SMU Channel Plotter (pyqtgraph)")
-        self.resize(1400, 700)  # wider to fit legend outside
+        self.resize(1900, 700)  # wider to fit legend and transconductance pane
 
         # -----------------------------
         # Data buffers (grow dynamically)
@@ -38,6 +40,11 @@ class LivePlotter(QtWidgets.QMainWindow):
 
         self.sweep_running = False
 
+        # -----------------------------
+        # Transconductance buffers (running sums so gm is updated per sample)
+        # -----------------------------
+        self.reset_transconductance()
+
         # -----------------------------
         # Central widget
         # -----------------------------
@@ -166,6 +173,18 @@ class LivePlotter(QtWidgets.QMainWindow):
         self.plot.getAxis('bottom').setStyle(showValues=True)
         self.plot.getAxis('bottom').enableAutoSIPrefix(False)
 
+        # -----------------------------
+        # Transconductance widget (middle-right)
+        # -----------------------------
+        self.gm_plot = pg.PlotWidget()
+        layout.addWidget(self.gm_plot, 1)
+
+        self.gm_plot.setLabel("bottom", "Gate Voltage (V)")
+        self.gm_plot.setLabel("left", "Transconductance, dI/dV (µA/V)")
+        self.gm_plot.setTitle("Transconductance")
+        self.gm_plot.showGrid(x=True, y=True)
+        self.gm_plot.getAxis('bottom').enableAutoSIPrefix(False)
+
         # -----------------------------
         # Legend panel (right)
         # -----------------------------
@@ -221,7 +240,19 @@ class LivePlotter(QtWidgets.QMainWindow):
             )
             self.curves.append(curve)
 
-        
+        self.gm_curves = [self.gm_plot.plot([], [], pen=self.channel_colors[i]) for i in range(N_CHANNELS)]
+
+        # live peak markers, up triangle for the positive peak and down triangle for the negative peak
+        self.gm_pos_peaks = pg.ScatterPlotItem(symbol="t1", size=12, pen=pg.mkPen("w"))
+        self.gm_neg_peaks = pg.ScatterPlotItem(symbol="t", size=12, pen=pg.mkPen("w"))
+        self.gm_plot.addItem(self.gm_pos_peaks)
+        self.gm_plot.addItem(self.gm_neg_peaks)
+
+        # average negative transconductance point of the selected channels, used as the time sweep gate voltage
+        self.gm_neg_line = pg.InfiniteLine(angle=90, pen=pg.mkPen("grey", style=Qt.DashLine))
+        self.gm_neg_line.setVisible(False)
+        self.gm_plot.addItem(self.gm_neg_line)
+
 
         # -----------------------------
         # CSV setup
@@ -350,6 +381,8 @@ class LivePlotter(QtWidgets.QMainWindow):
             ch.clear()
         for curve in self.curves:
             curve.setData([], [])
+        self.reset_transconductance()
+        self.update_transconductance_plot()
 
         # setup csv
         if self.csv_file:
@@ -403,6 +436,7 @@ class LivePlotter(QtWidgets.QMainWindow):
             self.x.append(vg)
             for i in range(N_CHANNELS):
                 self.y[i].append(currents[i] * 1e6)
+            self.append_transconductance(vg, np.array(currents) * 1e6)
 
             # write to current csv sweep
             self.csv_writer.writerow([step, t, vg] + currents)
@@ -482,6 +516,147 @@ class LivePlotter(QtWidgets.QMainWindow):
             else:
                 self.curves[i].setData([], [])
 
+        self.update_transconductance_plot()
+
+    # -----------------------------
+    # Transconductance (incremental)
+    # -----------------------------
+    def reset_transconductance(self, capacity=GM_INIT_CAPACITY):
+        """
+        Clear the transconductance buffers. gm at each point is the least-squares slope of I vs Vg
+        over +/- GM_HALF_WINDOW points, computed from running (prefix) sums so that a new sample only
+        updates the last few points instead of the whole sweep. The window never crosses the point where
+        the sweep turns around, so the forward and reverse halves are differentiated separately.
+        """
+        self.gm_n = 0
+        self.gm_capacity = capacity
+        self.gm_x = np.zeros(capacity)
+        self.gm_sum_1 = np.zeros(capacity + 1) # prefix sums, index k holds the sum over points 0..k-1
+        self.gm_sum_x = np.zeros(capacity + 1)
+        self.gm_sum_xx = np.zeros(capacity + 1)
+        self.gm_sum_y = np.zeros((N_CHANNELS, capacity + 1))
+        self.gm_sum_xy = np.zeros((N_CHANNELS, capacity + 1))
+        self.gm = np.full((N_CHANNELS, capacity), np.nan) # (channels x points), µA/V
+        self.gm_seg_id = np.zeros(capacity, dtype=int) # sweep direction segment each point belongs to
+        self.gm_seg_starts = [0] # first index usable by each segment's windows
+        self.gm_direction = 0 # +1 forward, -1 reverse, 0 not known yet
+
+    def grow_transconductance(self):
+        """Double the capacity of the transconductance buffers, keeping the data already in them."""
+        n = self.gm_n
+        new_capacity = 2 * self.gm_capacity
+        for name in ["gm_x", "gm_seg_id"]:
+            old = getattr(self, name)
+            new = np.zeros(new_capacity, dtype=old.dtype)
+            new[:n] = old[:n]
+            setattr(self, name, new)
+        for name in ["gm_sum_1", "gm_sum_x", "gm_sum_xx"]:
+            old = getattr(self, name)
+            new = np.zeros(new_capacity + 1)
+            new[:n + 1] = old[:n + 1]
+            setattr(self, name, new)
+        for name in ["gm_sum_y", "gm_sum_xy"]:
+            old = getattr(self, name)
+            new = np.zeros((N_CHANNELS, new_capacity + 1))
+            new[:, :n + 1] = old[:, :n + 1]
+            setattr(self, name, new)
+        gm = np.full((N_CHANNELS, new_capacity), np.nan)
+        gm[:, :n] = self.gm[:, :n]
+        self.gm = gm
+        self.gm_capacity = new_capacity
+
+    def append_transconductance(self, vg, currents_ua):
+        """
+        Add one sample (gate voltage, 16 currents in µA) and refresh gm for every point whose
+        smoothing window includes the new sample.
+        """
+        if self.gm_n == self.gm_capacity:
+            self.grow_transconductance()
+        n = self.gm_n
+
+        # start a new segment when the sweep changes direction, the turnaround point is shared by both
+        if n > 0:
+            step = vg - self.gm_x[n - 1]
+            if step != 0:
+                direction = 1 if step > 0 else -1
+                if self.gm_direction != 0 and direction != self.gm_direction:
+                    self.gm_seg_starts.append(n - 1)
+                self.gm_direction = direction
+
+        self.gm_x[n] = vg
+        self.gm_sum_1[n + 1] = self.gm_sum_1[n] + 1
+        self.gm_sum_x[n + 1] = self.gm_sum_x[n] + vg
+        self.gm_sum_xx[n + 1] = self.gm_sum_xx[n] + vg * vg
+        self.gm_sum_y[:, n + 1] = self.gm_sum_y[:, n] + currents_ua
+        self.gm_sum_xy[:, n + 1] = self.gm_sum_xy[:, n] + vg * currents_ua
+        self.gm_seg_id[n] = len(self.gm_seg_starts) - 1
+        self.gm_n = n + 1
+
+        # only the last GM_HALF_WINDOW + 1 points can see the new sample
+        idx = np.arange(max(0, self.gm_n - 1 - GM_HALF_WINDOW), self.gm_n)
+        seg_starts = np.array(self.gm_seg_starts)
+        seg_ends = np.append(seg_starts[1:], self.gm_n - 1)
+        seg = self.gm_seg_id[idx]
+        lo = np.maximum(idx - GM_HALF_WINDOW, seg_starts[seg])
+        hi = np.minimum(idx + GM_HALF_WINDOW, seg_ends[seg]) + 1
+
+        count = self.gm_sum_1[hi] - self.gm_sum_1[lo]
+        sx = self.gm_sum_x[hi] - self.gm_sum_x[lo]
+        sxx = self.gm_sum_xx[hi] - self.gm_sum_xx[lo]
+        sy = self.gm_sum_y[:, hi] - self.gm_sum_y[:, lo]
+        sxy = self.gm_sum_xy[:, hi] - self.gm_sum_xy[:, lo]
+
+        denom = sxx - sx * sx / count
+        numer = sxy - sx * sy / count
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.gm[:, idx] = np.where(denom > 1e-12, numer / denom, np.nan)
+
+    def transconductance_peaks(self):
+        """
+        Returns the point indices of the positive and negative gm peaks of every channel, and a mask of
+        the channels that have any gm values yet. All three arrays have length N_CHANNELS.
+        """
+        gm = self.gm[:, :self.gm_n]
+        missing = np.isnan(gm)
+        has_data = ~np.all(missing, axis=1) if self.gm_n else np.zeros(N_CHANNELS, dtype=bool)
+        if not has_data.any():
+            empty = np.zeros(N_CHANNELS, dtype=int)
+            return empty, empty, has_data
+        pos_idx = np.argmax(np.where(missing, -np.inf, gm), axis=1)
+        neg_idx = np.argmin(np.where(missing, np.inf, gm), axis=1)
+        return pos_idx, neg_idx, has_data
+
+    def update_transconductance_plot(self):
+        n = self.gm_n
+        x = self.gm_x[:n]
+        enabled = np.array([cb.isChecked() for cb in self.channel_enabled])
+
+        for i in range(N_CHANNELS):
+            if enabled[i] and n > 0:
+                self.gm_curves[i].setData(x, self.gm[i, :n], connect="finite")
+            else:
+                self.gm_curves[i].setData([], [])
+
+        pos_idx, neg_idx, has_data = self.transconductance_peaks()
+        channels = np.flatnonzero(enabled & has_data)
+        if len(channels) == 0:
+            self.gm_pos_peaks.setData([], [])
+            self.gm_neg_peaks.setData([], [])
+            self.gm_neg_line.setVisible(False)
+            self.gm_plot.setTitle("Transconductance")
+            return
+
+        pos_idx = pos_idx[channels]
+        neg_idx = neg_idx[channels]
+        brushes = [pg.mkBrush(self.channel_colors[ch]) for ch in channels]
+        self.gm_pos_peaks.setData(x=x[pos_idx], y=self.gm[channels, pos_idx], brush=brushes)
+        self.gm_neg_peaks.setData(x=x[neg_idx], y=self.gm[channels, neg_idx], brush=brushes)
+
+        avg_neg = float(np.mean(x[neg_idx]))
+        self.gm_neg_line.setValue(avg_neg)
+        self.gm_neg_line.setVisible(True)
+        self.gm_plot.setTitle(f"Transconductance, Avg Neg Transconductance Point: {avg_neg:.3f} V")
+
     def update_legend(self):
         # Show/hide pre-created rows based on checkbox state
         for i, row in enumerate(self.legend_rows):
@@ -564,16 +739,15 @@ class LivePlotter(QtWidgets.QMainWindow):
         layout.addWidget(canvas)
         ax = fig.add_subplot(111)
     
-        # Compute and plot dI/dV for each selected channel
-        x = np.array(self.x)
+        # Plot the dI/dV already computed by the live transconductance pane for each selected channel
+        x = self.gm_x[:self.gm_n]
+        _, neg_idx, has_data = self.transconductance_peaks()
         for i, cb in enumerate(self.channel_enabled):
-            if cb.isChecked() and self.y[i]:
-                y = np.array(self.y[i])
-                dy_dx = np.gradient(y, x)  # derivative
-                ax.plot(x, dy_dx, color=self.channel_colors[i].getRgbF()[:3], label=f'dI/dV Ch {i}')
+            if cb.isChecked() and has_data[i]:
+                ax.plot(x, self.gm[i, :self.gm_n], color=self.channel_colors[i].getRgbF()[:3], label=f'dI/dV Ch {i}')
                 plotted_any = True
-                # Example: store gate voltage of minimum derivative
-                transconductance_gate_voltages.append(x[np.argmin(dy_dx)])
+                # store gate voltage of minimum derivative
+                transconductance_gate_voltages.append(x[neg_idx[i]])
     
         if not plotted_any:
             print("No channels selected")
@@ -0,0 +1,171 @@
+'''
+Software stand-in for the Teensy running the 16-channel TIA SMU firmware.
+
+EmulatedSerial exposes the small part of the pyserial API that the live-plot
+scripts use (write, flush, readline, in_waiting, is_open, close, setDTR) and
+answers the same serial commands as the firmware:
+
+    mode="sweep"     : smu-16-diractracking / smu-16-voltagesweep firmware
+                       "start,vmin,vmax,delay_ms,res" -> forward + reverse sweep
+                       of 2*steps+1 lines "step, t, vg, I0..I15" then "DONE"
+    mode="timesweep" : smu-16-timesweep firmware
+                       "start,vg,delay_ms" -> "t, I0..I15" lines until "stop"
+
+Currents are in A, like the firmware prints them. Each channel is a V-shaped
+GFET transfer curve with its own Dirac voltage, a small forward/reverse
+hysteresis, a slow Dirac drift and some read noise, so Dirac tracking and
+drift analysis have something realistic to chew on without hardware.
+'''
+
+import threading
+import time
+
+import numpy as np
+
+
+N_CHANNELS = 16
+
+
+class EmulatedSerial:
+    def __init__(self, mode="sweep", n_channels=N_CHANNELS, speed=1.0, seed=None,
+                 dirac_v=None, drift_v_per_hr=-0.02, hysteresis_v=0.03, noise_a=2e-9):
+        '''
+        mode: "sweep" or "timesweep", see module docstring
+        speed: time scaling, 10 means steps are emitted 10x faster than delay_ms asks for
+        dirac_v: per-channel Dirac voltages (V), random around 0.45 V if None
+        drift_v_per_hr: Dirac drift applied to every channel
+        '''
+        self.mode = mode
+        self.n_channels = n_channels
+        self.speed = speed
+        self.rng = np.random.default_rng(seed)
+
+        if dirac_v is None:
+            dirac_v = 0.45 + 0.08 * self.rng.standard_normal(n_channels)
+        self.dirac_v = np.asarray(dirac_v, dtype=float)
+        self.drift_v_per_hr = drift_v_per_hr
+        self.hysteresis_v = hysteresis_v
+        self.noise_a = noise_a
+
+        # transfer curve shape: I = Vds * (g_min + k * sqrt((vg - vd)^2 + w^2)), per channel
+        self.g_min = 4e-4 * (1 + 0.15 * self.rng.standard_normal(n_channels))
+        self.k_slope = 1.2e-3 * (1 + 0.15 * self.rng.standard_normal(n_channels))
+        self.width_v = 0.08
+        self.v_ds = 0.01
+
+        self.is_open = True
+        self.port = "EMULATED"
+        self.created_time = time.time()
+
+        self._lines = []
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    # -----------------------------
+    # pyserial-like API
+    # -----------------------------
+    @property
+    def in_waiting(self):
+        with self._cond:
+            return sum(len(line) for line in self._lines)
+
+    def write(self, data):
+        for cmd in data.decode().splitlines():
+            self._handle_command(cmd.strip())
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def readline(self, timeout=2):
+        with self._cond:
+            if not self._lines:
+                self._cond.wait(timeout)
+            if not self._lines:
+                return b""
+            return self._lines.pop(0)
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._lines.clear()
+
+    def setDTR(self, state):
+        pass
+
+    def close(self):
+        self._stop_thread()
+        self.is_open = False
+
+    # -----------------------------
+    # Device model
+    # -----------------------------
+    def currents(self, vg, direction=1):
+        '''Drain currents (A) of all channels at gate voltage vg, direction=+1 forward, -1 reverse'''
+        hours = (time.time() - self.created_time) * self.speed / 3600
+        vd = self.dirac_v + self.drift_v_per_hr * hours + 0.5 * direction * self.hysteresis_v
+        g = self.g_min + self.k_slope * np.sqrt((vg - vd) ** 2 + self.width_v ** 2)
+        return self.v_ds * g + self.noise_a * self.rng.standard_normal(self.n_channels)
+
+    def _handle_command(self, cmd):
+        if cmd.startswith("start"):
+            parts = cmd.split(",")[1:]
+            try:
+                params = [float(p) for p in parts]
+            except ValueError:
+                return
+            if self.mode == "sweep" and len(params) == 4:
+                target = self._run_sweep
+            elif self.mode == "timesweep" and len(params) == 2:
+                target = self._run_timesweep
+            else:
+                return
+            self._stop_thread()
+            self._running = True
+            self._thread = threading.Thread(target=target, args=params, daemon=True)
+            self._thread.start()
+        elif cmd == "stop":
+            self._stop_thread()
+
+    def _stop_thread(self):
+        self._running = False
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+        self._thread = None
+
+    def _emit(self, line):
+        with self._cond:
+            self._lines.append(f"{line}\r\n".encode())
+            self._cond.notify()
+
+    def _sleep(self, delay_ms):
+        time.sleep(delay_ms / 1000 / self.speed)
+
+    def _run_sweep(self, vmin, vmax, delay_ms, res):
+        # same step arithmetic as the firmware, forward sweep then reverse sweep
+        steps = int((vmax - vmin) * res)
+        start_time = time.time()
+        for step in range(2 * steps + 1):
+            if not self._running:
+                return
+            if steps == 0:
+                vg = vmin
+            elif step >= steps:
+                vg = vmax - (vmax - vmin) * ((step - steps) / steps)
+            else:
+                vg = vmin + (vmax - vmin) * (step / steps)
+            self._sleep(delay_ms + self.n_channels)  # settle delay + 1 ms per mux channel
+            direction = 1 if step < steps else -1
+            t = (time.time() - start_time) * self.speed
+            currents = ", ".join(f"{i:.12f}" for i in self.currents(vg, direction))
+            self._emit(f"{step}, {t:.3f}, {vg:.6f}, {currents}")
+        self._emit("DONE")
+        self._running = False
+
+    def _run_timesweep(self, vg, delay_ms):
+        start_time = time.time()
+        while self._running:
+            t = (time.time() - start_time) * self.speed
+            currents = ", ".join(f"{i:.12f}" for i in self.currents(vg))
+            self._emit(f"{t:.3f}, {currents}")
+            self._sleep(delay_ms + self.n_channels)  # sample delay + 1 ms per mux channel
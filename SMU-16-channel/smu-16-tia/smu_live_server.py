@@ -0,0 +1,539 @@
+'''
+Optional live-data server for the 16-channel TIA SMU live plotters.
+
+The acquisition GUI publishes samples, Dirac points and run status to a
+LiveServer; any number of browsers or Python clients on localhost / the LAN
+can then watch the experiment. Standard library only (http.server + a minimal
+WebSocket implementation), no external services.
+
+Endpoints
+    /           small browser viewer (live sweep + Dirac vs time)
+    /status     latest run status as JSON
+    /ws?level=N WebSocket stream of binary frames, only every 2**N-th sweep
+                point is sent (level can be changed later by sending the
+                text message "level N")
+
+Binary frames (little endian, first byte is the frame type)
+    FRAME_SAMPLES: <B I I H B  sweep_idx, first point, n points, n channels
+                   then float32 vg[n], float32 currents_uA[n, n_channels]
+    FRAME_DIRAC:   <B I d B    sweep_idx, time (s), n channels
+                   then float32 fwd[n_channels], float32 rev[n_channels]
+    FRAME_STATUS:  <B          then utf-8 JSON
+
+The publish_* methods never block: every client has its own bounded queue and
+a client that cannot keep up loses its oldest frames instead of slowing the
+acquisition loop down.
+
+Demo without hardware (emulated SMU):
+    python smu_live_server.py --demo --port 8765
+    python smu_live_server.py --client 127.0.0.1:8765 --level 2
+'''
+
+import base64
+import hashlib
+import json
+import os
+import queue
+import select
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+
+# -----------------------------
+# CONFIG
+# -----------------------------
+CLIENT_QUEUE_SIZE = 256  # frames buffered per client before old frames are dropped
+MAX_LEVEL = 6            # coarsest decimation, every 64th point
+
+FRAME_SAMPLES = 1
+FRAME_DIRAC = 2
+FRAME_STATUS = 3
+
+SAMPLES_HEADER = struct.Struct("<BIIHB")
+DIRAC_HEADER = struct.Struct("<BIdB")
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+# -----------------------------
+# Frame encoding / decoding
+# -----------------------------
+def encode_samples(sweep_idx, first_point, vg, currents_ua):
+    vg = np.asarray(vg, dtype="<f4").reshape(-1)
+    currents_ua = np.asarray(currents_ua, dtype="<f4").reshape(len(vg), -1)
+    header = SAMPLES_HEADER.pack(FRAME_SAMPLES, sweep_idx, first_point, len(vg), currents_ua.shape[1])
+    return header + vg.tobytes() + currents_ua.tobytes()
+
+
+def encode_dirac(sweep_idx, t, dirac_fwd, dirac_rev):
+    fwd = np.asarray(dirac_fwd, dtype="<f4")
+    rev = np.asarray(dirac_rev, dtype="<f4")
+    return DIRAC_HEADER.pack(FRAME_DIRAC, sweep_idx, t, len(fwd)) + fwd.tobytes() + rev.tobytes()
+
+
+def encode_status(status):
+    return bytes([FRAME_STATUS]) + json.dumps(status).encode()
+
+
+def decode_frame(frame):
+    '''Returns (frame type, dict of fields) for a binary frame'''
+    kind = frame[0]
+    if kind == FRAME_SAMPLES:
+        _, sweep_idx, first_point, n, n_ch = SAMPLES_HEADER.unpack_from(frame)
+        body = np.frombuffer(frame, dtype="<f4", offset=SAMPLES_HEADER.size)
+        return kind, {"sweep_idx": sweep_idx, "first_point": first_point,
+                      "vg": body[:n], "currents_ua": body[n:].reshape(n, n_ch)}
+    if kind == FRAME_DIRAC:
+        _, sweep_idx, t, n_ch = DIRAC_HEADER.unpack_from(frame)
+        body = np.frombuffer(frame, dtype="<f4", offset=DIRAC_HEADER.size)
+        return kind, {"sweep_idx": sweep_idx, "t": t, "fwd": body[:n_ch], "rev": body[n_ch:]}
+    if kind == FRAME_STATUS:
+        return kind, json.loads(frame[1:].decode())
+    raise ValueError(f"Unknown frame type {kind}")
+
+
+def decimate_samples(first_point, vg, currents_ua, level):
+    '''Keeps the points whose sweep point index is a multiple of 2**level'''
+    step = 1 << level
+    offset = (-first_point) % step
+    return first_point + offset, vg[offset::step], currents_ua[offset::step]
+
+
+# -----------------------------
+# Minimal WebSocket framing (RFC 6455, unfragmented messages)
+# -----------------------------
+def ws_pack(payload, opcode=0x2):
+    n = len(payload)
+    if n < 126:
+        header = struct.pack("!BB", 0x80 | opcode, n)
+    elif n < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+    return header + payload
+
+
+def recv_exact(sock, n):
+    data = b""
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("socket closed")
+        data += chunk
+    return data
+
+
+def ws_recv(sock):
+    '''Reads one WebSocket message, returns (opcode, payload)'''
+    b0, b1 = recv_exact(sock, 2)
+    n = b1 & 0x7F
+    if n == 126:
+        n = struct.unpack("!H", recv_exact(sock, 2))[0]
+    elif n == 127:
+        n = struct.unpack("!Q", recv_exact(sock, 8))[0]
+    mask = recv_exact(sock, 4) if b1 & 0x80 else None
+    payload = recv_exact(sock, n)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return b0 & 0x0F, payload
+
+
+# -----------------------------
+# Server
+# -----------------------------
+class LiveClient:
+    def __init__(self, level):
+        self.level = level
+        self.frames = queue.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.dropped = 0
+
+    def put(self, frame):
+        # drop the oldest frame rather than ever blocking the publisher
+        while True:
+            try:
+                self.frames.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+
+class LiveServer:
+    def __init__(self, host="127.0.0.1", port=8765, n_channels=16):
+        self.n_channels = n_channels
+        self.clients = set()
+        self.clients_lock = threading.Lock()
+        self.status = {"state": "idle", "n_channels": n_channels, "started": time.time()}
+        self.status_lock = threading.Lock()
+
+        handler = type("LiveHandler", (LiveRequestHandler,), {"live_server": self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def address(self):
+        return self.httpd.server_address[:2]
+
+    def start(self):
+        self.thread.start()
+        print(f"Live server on http://{self.address[0]}:{self.address[1]}/")
+        return self
+
+    def shutdown(self):
+        self.publish_status(state="closed")
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # -----------------------------
+    # Publishing (called from the acquisition loop)
+    # -----------------------------
+    def publish_samples(self, sweep_idx, first_point, vg, currents_ua):
+        '''vg: scalar or (n,) gate voltages, currents_ua: (n_channels,) or (n, n_channels) in µA'''
+        with self.clients_lock:
+            clients = list(self.clients)
+        if not clients:
+            return
+        vg = np.atleast_1d(np.asarray(vg, dtype=float))
+        currents_ua = np.asarray(currents_ua, dtype=float).reshape(len(vg), -1)
+
+        # encode once per decimation level in use, not once per client
+        encoded = {}
+        for client in clients:
+            level = client.level
+            if level not in encoded:
+                first, vg_d, cur_d = decimate_samples(first_point, vg, currents_ua, level)
+                encoded[level] = encode_samples(sweep_idx, first, vg_d, cur_d) if len(vg_d) else None
+            if encoded[level] is not None:
+                client.put(encoded[level])
+
+    def publish_dirac(self, sweep_idx, t, dirac_fwd, dirac_rev):
+        self.broadcast(encode_dirac(sweep_idx, t, dirac_fwd, dirac_rev))
+
+    def publish_status(self, **fields):
+        with self.status_lock:
+            self.status.update(fields)
+            self.status["updated"] = time.time()
+            frame = encode_status(self.status)
+        self.broadcast(frame)
+
+    def broadcast(self, frame):
+        with self.clients_lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.put(frame)
+
+    def get_status(self):
+        with self.status_lock:
+            status = dict(self.status)
+        with self.clients_lock:
+            status["clients"] = len(self.clients)
+            status["dropped_frames"] = sum(c.dropped for c in self.clients)
+        return status
+
+    def add_client(self, level):
+        client = LiveClient(level)
+        with self.status_lock:
+            client.put(encode_status(self.status))
+        with self.clients_lock:
+            self.clients.add(client)
+        return client
+
+    def remove_client(self, client):
+        with self.clients_lock:
+            self.clients.discard(client)
+
+
+class LiveRequestHandler(BaseHTTPRequestHandler):
+    live_server = None
+
+    def log_message(self, format, *args):
+        pass  # keep the acquisition console quiet
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/status":
+            self.send_body(json.dumps(self.live_server.get_status()).encode(), "application/json")
+        elif url.path == "/ws":
+            try:
+                level = int(query.get("level", ["0"])[0])
+            except ValueError:
+                level = 0
+            self.serve_websocket(min(max(level, 0), MAX_LEVEL))
+        elif url.path == "/":
+            self.send_body(VIEWER_HTML.encode(), "text/html; charset=utf-8")
+        else:
+            self.send_error(404)
+
+    def send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def serve_websocket(self, level):
+        key = self.headers.get("Sec-WebSocket-Key")
+        if not key or self.headers.get("Upgrade", "").lower() != "websocket":
+            self.send_error(400, "Expected a WebSocket upgrade")
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+
+        sock = self.connection
+        client = self.live_server.add_client(level)
+        try:
+            while True:
+                # control messages from the client ("level N", close, ping)
+                readable, _, _ = select.select([sock], [], [], 0)
+                if readable:
+                    opcode, payload = ws_recv(sock)
+                    if opcode == 0x8:
+                        break
+                    if opcode == 0x9:
+                        sock.sendall(ws_pack(payload, opcode=0xA))
+                    elif opcode == 0x1 and payload.startswith(b"level"):
+                        try:
+                            client.level = min(max(int(payload.split()[1]), 0), MAX_LEVEL)
+                        except (IndexError, ValueError):
+                            pass
+                try:
+                    frame = client.frames.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                sock.sendall(ws_pack(frame))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.live_server.remove_client(client)
+
+
+def start_live_server(host="127.0.0.1", port=8765, n_channels=16):
+    try:
+        return LiveServer(host, port, n_channels).start()
+    except OSError as e:
+        print(f"Live server failed to start on {host}:{port}: {e}")
+        return None
+
+
+# -----------------------------
+# Python client
+# -----------------------------
+class LiveClientConnection:
+    '''
+    Blocking client for scripts and notebooks, e.g.
+        with LiveClientConnection("127.0.0.1", 8765, level=2) as conn:
+            for kind, fields in conn:
+                ...
+    '''
+    def __init__(self, host="127.0.0.1", port=8765, level=0, timeout=10):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        key = base64.b64encode(os.urandom(16)).decode()
+        request = (f"GET /ws?level={level} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+                   f"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                   f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n")
+        self.sock.sendall(request.encode())
+        response = b""
+        while b"\r\n\r\n" not in response:
+            chunk = self.sock.recv(1)
+            if not chunk:
+                raise ConnectionError("server closed the connection during the handshake")
+            response += chunk
+        if b" 101 " not in response.split(b"\r\n", 1)[0]:
+            raise ConnectionError(f"WebSocket handshake failed: {response.splitlines()[0]!r}")
+
+    def set_level(self, level):
+        self.send_text(f"level {level}")
+
+    def send_text(self, text, opcode=0x1):
+        # client to server messages must be masked
+        payload = text.encode()
+        mask = os.urandom(4)
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        self.sock.sendall(struct.pack("!BB", 0x80 | opcode, 0x80 | len(payload)) + mask + masked)
+
+    def recv(self):
+        '''Next (frame type, fields), skipping pings'''
+        while True:
+            opcode, payload = ws_recv(self.sock)
+            if opcode == 0x8:
+                raise ConnectionError("server closed the stream")
+            if opcode == 0x2:
+                return decode_frame(payload)
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.recv()
+            except (ConnectionError, OSError):
+                return
+
+    def close(self):
+        try:
+            self.send_text("", opcode=0x8)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# -----------------------------
+# Browser viewer
+# -----------------------------
+VIEWER_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>SMU live</title>
+<style>body{background:#111;color:#ddd;font-family:sans-serif;margin:8px}
+canvas{background:#000;margin:4px;border:1px solid #444}</style></head>
+<body>
+<div>Decimation level <select id="level"></select> <span id="status">connecting...</span></div>
+<canvas id="sweep" width="700" height="450"></canvas>
+<canvas id="dirac" width="700" height="450"></canvas>
+<script>
+const colors = [...Array(16).keys()].map(i => `hsl(${i * 360 / 16},90%,55%)`);
+let sweep = {idx: -1, vg: [], i: []}, dirac = [];
+const sel = document.getElementById("level");
+for (let l = 0; l <= {max_level}; l++) sel.add(new Option(l, l));
+const ws = new WebSocket(`ws://${location.host}/ws?level=0`);
+ws.binaryType = "arraybuffer";
+sel.onchange = () => ws.send("level " + sel.value);
+ws.onclose = () => document.getElementById("status").textContent = "disconnected";
+ws.onmessage = ev => {
+  const dv = new DataView(ev.data), kind = dv.getUint8(0);
+  if (kind === 1) {
+    const idx = dv.getUint32(1, true), n = dv.getUint16(9, true), nch = dv.getUint8(11);
+    if (idx !== sweep.idx) sweep = {idx: idx, vg: [], i: [...Array(nch)].map(() => [])};
+    const f = new Float32Array(ev.data.slice(12));
+    for (let k = 0; k < n; k++) {
+      sweep.vg.push(f[k]);
+      for (let c = 0; c < nch; c++) sweep.i[c].push(f[n + k * nch + c]);
+    }
+  } else if (kind === 2) {
+    const nch = dv.getUint8(13), f = new Float32Array(ev.data.slice(14));
+    dirac.push({t: dv.getFloat64(5, true), fwd: f.slice(0, nch), rev: f.slice(nch)});
+  } else if (kind === 3) {
+    const s = JSON.parse(new TextDecoder().decode(new Uint8Array(ev.data, 1)));
+    document.getElementById("status").textContent =
+      `${s.state}  sweep ${s.sweep_index ?? "-"}  ${s.csv_path ?? ""}`;
+  }
+};
+function draw(id, xs, series, xlabel, ylabel, marker) {
+  const cv = document.getElementById(id), g = cv.getContext("2d");
+  g.clearRect(0, 0, cv.width, cv.height);
+  const all = series.flat().filter(Number.isFinite);
+  if (!xs.length || !all.length) return;
+  const x0 = Math.min(...xs), x1 = Math.max(...xs), y0 = Math.min(...all), y1 = Math.max(...all);
+  const X = x => 50 + (x - x0) / ((x1 - x0) || 1) * (cv.width - 60);
+  const Y = y => cv.height - 30 - (y - y0) / ((y1 - y0) || 1) * (cv.height - 40);
+  series.forEach((ys, c) => {
+    g.strokeStyle = g.fillStyle = colors[c % 16]; g.beginPath();
+    ys.forEach((y, k) => marker ? g.fillRect(X(xs[k]) - 2, Y(y) - 2, 4, 4)
+                                : (k ? g.lineTo(X(xs[k]), Y(y)) : g.moveTo(X(xs[k]), Y(y))));
+    if (!marker) g.stroke();
+  });
+  g.fillStyle = "#ddd";
+  g.fillText(`${xlabel}: ${x0.toFixed(3)} .. ${x1.toFixed(3)}`, 50, cv.height - 10);
+  g.fillText(`${ylabel}: ${y0.toFixed(3)} .. ${y1.toFixed(3)}`, 50, 12);
+}
+function frame() {
+  draw("sweep", sweep.vg, sweep.i, "Gate Voltage (V)", "Drain Current (uA)", false);
+  const t = dirac.map(d => d.t), nch = dirac.length ? dirac[0].fwd.length : 0;
+  draw("dirac", t.concat(t), [...Array(nch).keys()].map(c =>
+    dirac.map(d => d.fwd[c]).concat(dirac.map(d => d.rev[c]))), "Time (s)", "Dirac Voltage (V)", true);
+  requestAnimationFrame(frame);
+}
+requestAnimationFrame(frame);
+</script></body></html>
+""".replace("{max_level}", str(MAX_LEVEL))
+
+
+# -----------------------------
+# Demo / test without hardware
+# -----------------------------
+def run_demo(host, port, vmin=0.0, vmax=1.0, res=100, delay_ms=1, speed=20):
+    '''Dirac-tracking loop on the emulated SMU, published exactly like the GUI does'''
+    from smu_emulator import EmulatedSerial
+
+    server = start_live_server(host, port)
+    if server is None:
+        return
+    ser = EmulatedSerial(speed=speed)
+    start_time = time.time()
+    sweep_index = 0
+    try:
+        while True:
+            server.publish_status(state="running", sweep_index=sweep_index, csv_path="(emulated)")
+            ser.write(f"start,{vmin},{vmax},{delay_ms},{res}\n".encode())
+            vg, currents = [], []
+            while True:
+                line = ser.readline().decode().strip()
+                if line == "DONE":
+                    break
+                parts = line.split(",")
+                if len(parts) != 19:
+                    continue
+                vg.append(float(parts[2]))
+                currents.append(np.array(parts[3:], dtype=float) * 1e6)
+                server.publish_samples(sweep_index, int(parts[0]), vg[-1], currents[-1])
+            vg, currents = np.array(vg), np.array(currents)
+            half = len(vg) // 2
+            fwd = vg[np.argmin(np.abs(currents[:half]), axis=0)]
+            rev = vg[half + np.argmin(np.abs(currents[half:]), axis=0)]
+            server.publish_dirac(sweep_index, time.time() - start_time, fwd, rev)
+            sweep_index += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ser.close()
+        server.shutdown()
+
+
+def run_client(host, port, level):
+    with LiveClientConnection(host, port, level) as conn:
+        for kind, fields in conn:
+            if kind == FRAME_SAMPLES:
+                print(f"sweep {fields['sweep_idx']} point {fields['first_point']}: "
+                      f"vg={fields['vg'][0]:.3f} V, I_ch0={fields['currents_ua'][0, 0]:.3f} µA")
+            elif kind == FRAME_DIRAC:
+                print(f"sweep {fields['sweep_idx']} Dirac fwd (V): {np.round(fields['fwd'], 3)}")
+            else:
+                print("status:", fields)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SMU live-data server demo and client")
+    parser.add_argument("--demo", action="store_true", help="serve emulated Dirac-tracking data")
+    parser.add_argument("--client", metavar="HOST:PORT", help="print frames from a running server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--level", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.client:
+        host, port = args.client.rsplit(":", 1)
+        run_client(host, int(port), args.level)
+    else:
+        run_demo(args.host, args.port)
@@ -0,0 +1,497 @@
+'''
+Streaming processing pipeline for the 16-channel TIA SMU live plotters.
+
+The GUI read loop only parses serial lines and pushes them into a Pipeline;
+everything done with the numbers afterwards (unit scaling, dI/dt, display
+windows, Dirac extraction, CSV rows, ...) is a Stage plugged into the pipeline.
+
+    pipeline = Pipeline()
+    pipeline.add(CsvSink(csv_file, ["sweep_idx", "point", "t", "vg", "currents"]))
+    pipeline.add(Scale(1e6))                                   # A -> µA
+    pipeline.add(DiracExtractor())
+    pipeline.add(DiracShiftDetector(0.02), mode="process")     # off the GUI thread
+
+    block = pipeline.push_samples(sweep_idx, step, t, vg, currents)   # per serial line
+    sweep = pipeline.end_sweep(sweep_idx)                              # on "DONE"
+    sweep.results["dirac_fwd"], pipeline.poll()
+
+Blocks
+    kind="samples": n consecutive samples, point/t/vg are (n,), currents is (n, n_channels)
+    kind="sweep":   every sample of one sweep (after the inline sample stages),
+                    assembled by the pipeline on end_sweep()
+    Stages put computed arrays in block.results and notable findings in
+    block.events. Stages must not modify arrays in place, assign new ones
+    instead, the same arrays may already be queued for a threaded stage.
+
+Execution modes (Pipeline.add(stage, mode=...))
+    "inline":  runs in the calling thread, output feeds the next stage
+    "thread":  runs on a worker thread, "process": runs in a worker process
+               (stage must be picklable). Both are taps: they get the block as
+               it is at that point of the chain, the chain does not wait for
+               them, and their output blocks are collected with poll(). Queues
+               are bounded, a worker that falls behind drops blocks (counted in
+               runner.dropped) instead of stalling acquisition.
+'''
+
+import copy
+import csv
+import multiprocessing as mp
+import queue
+import threading
+
+import numpy as np
+
+
+# -----------------------------
+# Blocks and base stage
+# -----------------------------
+class Block:
+    def __init__(self, kind, sweep_idx, point, t, vg, currents, results=None, events=None):
+        self.kind = kind
+        self.sweep_idx = sweep_idx
+        self.point = point
+        self.t = t
+        self.vg = vg
+        self.currents = currents
+        self.results = results if results is not None else {}
+        self.events = events if events is not None else []
+
+    def __len__(self):
+        return len(self.t)
+
+    def copy(self):
+        # arrays are shared, containers are not
+        block = copy.copy(self)
+        block.results = dict(self.results)
+        block.events = list(self.events)
+        return block
+
+    def get(self, name):
+        '''Block field or result by name, e.g. "t", "currents", "dI_dt"'''
+        if name in ("sweep_idx", "point", "t", "vg", "currents"):
+            return getattr(self, name)
+        return self.results[name]
+
+
+class Stage:
+    '''
+    Base class for filters, extractors, detectors and sinks. Override the hooks
+    needed; returning None from a hook stops the block from reaching later stages.
+    '''
+    def start(self):
+        '''Called once, in the thread or process the stage runs in, before the first block'''
+
+    def on_samples(self, block):
+        return block
+
+    def on_sweep(self, sweep):
+        return sweep
+
+    def close(self):
+        '''Called once after the last block'''
+
+
+# -----------------------------
+# Runners (inline / thread / process)
+# -----------------------------
+class InlineRunner:
+    def __init__(self, stage):
+        self.stage = stage
+        self.dropped = 0
+
+    def start(self):
+        self.stage.start()
+
+    def submit(self, block):
+        return dispatch(self.stage, block)
+
+    def poll(self):
+        return []
+
+    def close(self):
+        self.stage.close()
+
+
+def dispatch(stage, block):
+    if block.kind == "sweep":
+        return stage.on_sweep(block)
+    return stage.on_samples(block)
+
+
+def run_worker(stage, inbox, outbox):
+    stage.start()
+    while True:
+        block = inbox.get()
+        if block is None:
+            break
+        out = dispatch(stage, block)
+        if out is not None and (out.results or out.events):
+            outbox.put(out)
+    stage.close()
+
+
+class ThreadRunner:
+    def __init__(self, stage, queue_size=1024):
+        self.stage = stage
+        self.dropped = 0
+        self.inbox = queue.Queue(maxsize=queue_size)
+        self.outbox = queue.Queue()
+        self.worker = None
+
+    def start(self):
+        self.worker = threading.Thread(target=run_worker, args=(self.stage, self.inbox, self.outbox),
+                                       daemon=True)
+        self.worker.start()
+
+    def submit(self, block):
+        try:
+            self.inbox.put_nowait(block.copy())
+        except queue.Full:
+            self.dropped += 1
+        return block
+
+    def poll(self):
+        out = []
+        while True:
+            try:
+                out.append(self.outbox.get_nowait())
+            except queue.Empty:
+                return out
+
+    def close(self):
+        if self.worker:
+            self.inbox.put(None)
+            self.worker.join(timeout=5)
+            self.worker = None
+
+
+class ProcessRunner(ThreadRunner):
+    def __init__(self, stage, queue_size=1024):
+        super().__init__(stage)
+        self.inbox = mp.Queue(maxsize=queue_size)
+        self.outbox = mp.Queue()
+
+    def start(self):
+        self.worker = mp.Process(target=run_worker, args=(self.stage, self.inbox, self.outbox),
+                                 daemon=True)
+        self.worker.start()
+
+    def close(self):
+        if self.worker:
+            self.inbox.put(None)
+            self.worker.join(timeout=5)
+            if self.worker.is_alive():
+                self.worker.terminate()
+            self.worker = None
+
+
+RUNNERS = {"inline": InlineRunner, "thread": ThreadRunner, "process": ProcessRunner}
+
+
+# -----------------------------
+# Pipeline
+# -----------------------------
+class Pipeline(Stage):
+    def __init__(self, stages=(), keep_sweep=True):
+        '''
+        stages: stages to run inline, more can be added with add()
+        keep_sweep: collect processed samples so end_sweep() can run the per-sweep stages
+        '''
+        self.runners = []
+        self.keep_sweep = keep_sweep
+        self.sweep_blocks = []
+        self.started = False
+        for stage in stages:
+            self.add(stage)
+
+    def add(self, stage, mode="inline", queue_size=1024):
+        if mode not in RUNNERS:
+            raise ValueError(f"mode must be one of {list(RUNNERS)}")
+        runner = InlineRunner(stage) if mode == "inline" else RUNNERS[mode](stage, queue_size)
+        self.runners.append(runner)
+        if self.started:
+            runner.start()
+        return stage
+
+    def start(self):
+        for runner in self.runners:
+            runner.start()
+        self.started = True
+
+    def close(self):
+        for runner in self.runners:
+            runner.close()
+        self.started = False
+
+    def on_samples(self, block):
+        return self.run(block)
+
+    def on_sweep(self, sweep):
+        return self.run(sweep)
+
+    def run(self, block):
+        if not self.started:
+            self.start()
+        for runner in self.runners:
+            block = runner.submit(block)
+            if block is None:
+                return None
+        return block
+
+    def push_samples(self, sweep_idx, point, t, vg, currents):
+        '''One sample (scalars + (n_channels,) currents) or a block of n samples'''
+        t = np.atleast_1d(np.asarray(t, dtype=float))
+        block = Block("samples", sweep_idx,
+                      np.atleast_1d(np.asarray(point)),
+                      t,
+                      np.broadcast_to(np.asarray(vg, dtype=float), t.shape),
+                      np.asarray(currents, dtype=float).reshape(len(t), -1))
+        block = self.run(block)
+        if block is not None and self.keep_sweep:
+            self.sweep_blocks.append(block)
+        return block
+
+    def end_sweep(self, sweep_idx, **info):
+        '''Runs the per-sweep stages on every sample collected since the last end_sweep()'''
+        blocks, self.sweep_blocks = self.sweep_blocks, []
+        sweep = concat_blocks("sweep", sweep_idx, blocks)
+        sweep.results.update(info)
+        return self.run(sweep)
+
+    def poll(self):
+        '''Output blocks of threaded / process stages that finished since the last poll'''
+        out = []
+        for runner in self.runners:
+            out.extend(runner.poll())
+        return out
+
+
+def concat_blocks(kind, sweep_idx, blocks):
+    if not blocks:
+        empty = np.empty(0)
+        return Block(kind, sweep_idx, empty.astype(int), empty, empty, np.empty((0, 0)))
+    results = {}
+    for key in blocks[0].results:
+        parts = [b.results.get(key) for b in blocks]
+        if all(isinstance(p, np.ndarray) and len(p) == len(b) for p, b in zip(parts, blocks)):
+            results[key] = np.concatenate(parts)
+    return Block(kind, sweep_idx,
+                 np.concatenate([b.point for b in blocks]),
+                 np.concatenate([b.t for b in blocks]),
+                 np.concatenate([b.vg for b in blocks]),
+                 np.concatenate([b.currents for b in blocks]),
+                 results)
+
+
+# -----------------------------
+# Filters
+# -----------------------------
+class Scale(Stage):
+    '''Multiplies the currents, e.g. Scale(1e6) for A -> µA'''
+    def __init__(self, factor):
+        self.factor = factor
+
+    def on_samples(self, block):
+        block.currents = block.currents * self.factor
+        return block
+
+
+class MovingAverage(Stage):
+    '''Causal moving average of the currents over the last `window` samples (within a sweep)'''
+    def __init__(self, window):
+        self.window = window
+
+    def start(self):
+        self.history = None
+        self.sweep_idx = None
+
+    def on_samples(self, block):
+        if self.history is None or block.sweep_idx != self.sweep_idx:
+            self.history = np.empty((0, block.currents.shape[1]))
+            self.sweep_idx = block.sweep_idx
+        data = np.concatenate([self.history, block.currents])
+        csum = np.cumsum(np.vstack([np.zeros((1, data.shape[1])), data]), axis=0)
+        end = np.arange(len(self.history), len(data)) + 1
+        begin = np.maximum(end - self.window, 0)
+        block.currents = (csum[end] - csum[begin]) / (end - begin)[:, None]
+        self.history = data[-(self.window - 1):] if self.window > 1 else data[:0]
+        return block
+
+
+# -----------------------------
+# Extractors
+# -----------------------------
+class TimeDerivative(Stage):
+    '''results["dI_dt"]: backward difference of the currents over time, 0 for the first sample or dt <= 0'''
+    def start(self):
+        self.prev_t = None
+        self.prev_i = None
+
+    def on_samples(self, block):
+        if self.prev_t is None:
+            t = np.concatenate([block.t[:1], block.t])
+            currents = np.concatenate([block.currents[:1], block.currents])
+        else:
+            t = np.concatenate([[self.prev_t], block.t])
+            currents = np.concatenate([self.prev_i[None, :], block.currents])
+        dt = np.diff(t)[:, None]
+        di = np.diff(currents, axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            block.results["dI_dt"] = np.where(dt > 0, di / dt, 0.0)
+        self.prev_t = block.t[-1]
+        self.prev_i = block.currents[-1]
+        return block
+
+
+class SlidingWindow(Stage):
+    '''
+    Keeps the last `size` samples of the given block fields / results, e.g. for
+    display. get(name) returns a view, oldest sample first. Appending is amortised
+    O(1): buffers hold 2*size rows and are compacted when full.
+    '''
+    def __init__(self, size, names=("t", "currents")):
+        self.size = size
+        self.names = names
+        self.buffers = {}
+        self.count = 0
+
+    def start(self):
+        self.buffers = {}
+        self.count = 0
+
+    def on_samples(self, block):
+        n = len(block)
+        if n > self.size:
+            block_rows = slice(n - self.size, n)
+            n = self.size
+        else:
+            block_rows = slice(0, n)
+        if self.count + n > 2 * self.size:
+            keep = self.size - n
+            for buf in self.buffers.values():
+                buf[:keep] = buf[self.count - keep:self.count]
+            self.count = keep
+        for name in self.names:
+            values = np.asarray(block.get(name))[block_rows]
+            if name not in self.buffers:
+                self.buffers[name] = np.empty((2 * self.size,) + values.shape[1:], dtype=values.dtype)
+            self.buffers[name][self.count:self.count + n] = values
+        self.count += n
+        return block
+
+    def get(self, name):
+        start = max(self.count - self.size, 0)
+        if name not in self.buffers:
+            return np.empty(0)
+        return self.buffers[name][start:self.count]
+
+
+class DiracExtractor(Stage):
+    '''
+    results["dirac_fwd"] / ["dirac_rev"]: gate voltage of minimum |I| per channel
+    in the first and second half of a forward + reverse sweep. NaN if the sweep has
+    fewer than 2 points.
+    '''
+    def on_sweep(self, sweep):
+        n = len(sweep)
+        if n < 2:
+            n_ch = sweep.currents.shape[1] if sweep.currents.ndim == 2 else 0
+            sweep.results["dirac_fwd"] = np.full(n_ch, np.nan)
+            sweep.results["dirac_rev"] = np.full(n_ch, np.nan)
+            return sweep
+        half = n // 2
+        abs_i = np.abs(sweep.currents)
+        sweep.results["dirac_fwd"] = sweep.vg[np.argmin(abs_i[:half], axis=0)]
+        sweep.results["dirac_rev"] = sweep.vg[half + np.argmin(abs_i[half:], axis=0)]
+        return sweep
+
+
+# -----------------------------
+# Detectors
+# -----------------------------
+class DiracShiftDetector(Stage):
+    '''Adds an event when a channel's forward Dirac point moves more than threshold_v since the previous sweep'''
+    def __init__(self, threshold_v):
+        self.threshold_v = threshold_v
+
+    def start(self):
+        self.prev = None
+
+    def on_sweep(self, sweep):
+        dirac = sweep.results.get("dirac_fwd")
+        if dirac is None:
+            return sweep
+        if self.prev is not None and len(self.prev) == len(dirac):
+            shift = dirac - self.prev
+            for ch in np.flatnonzero(np.abs(shift) > self.threshold_v):
+                sweep.events.append({"type": "dirac_shift", "sweep_idx": sweep.sweep_idx,
+                                     "channel": int(ch), "shift_v": float(shift[ch])})
+        self.prev = dirac
+        return sweep
+
+
+# -----------------------------
+# Sinks
+# -----------------------------
+class CsvSink(Stage):
+    '''
+    Writes one CSV row per sample (on="samples") or per sweep (on="sweep").
+    columns: block field / result names, multi-channel values expand to one cell per
+    channel, None is an empty cell. NaN values are written as empty cells.
+    '''
+    def __init__(self, csv_file, columns, on="samples", flush=True):
+        self.csv_file = csv_file
+        self.writer = csv.writer(csv_file)
+        self.columns = columns
+        self.on = on
+        self.flush = flush
+
+    def rows(self, block):
+        n = len(block) if self.on == "samples" else 1
+        parts = []
+        for name in self.columns:
+            if name is None:
+                parts.append([[""]] * n)
+                continue
+            value = np.asarray(block.get(name))
+            if value.ndim == 0:
+                parts.append([[value.item()]] * n)
+            elif self.on == "samples":
+                parts.append(value.reshape(n, -1).tolist())
+            else:
+                parts.append([value.reshape(-1).tolist()])
+        rows = []
+        for i in range(n):
+            row = [x for part in parts for x in part[i]]
+            rows.append(["" if x != x else x for x in row])
+        return rows
+
+    def write(self, block):
+        if self.csv_file is None or self.csv_file.closed:
+            return block
+        self.writer.writerows(self.rows(block))
+        if self.flush:
+            self.csv_file.flush()
+        return block
+
+    def on_samples(self, block):
+        return self.write(block) if self.on == "samples" else block
+
+    def on_sweep(self, sweep):
+        return self.write(sweep) if self.on == "sweep" else sweep
+
+
+class LiveServerSink(Stage):
+    '''Publishes samples and Dirac points to a smu_live_server.LiveServer'''
+    def __init__(self, server):
+        self.server = server
+
+    def on_samples(self, block):
+        self.server.publish_samples(block.sweep_idx, int(block.point[0]), block.vg, block.currents)
+        return block
+
+    def on_sweep(self, sweep):
+        if "dirac_fwd" in sweep.results:
+            self.server.publish_dirac(sweep.sweep_idx, sweep.results.get("time", 0.0),
+                                      sweep.results["dirac_fwd"], sweep.results["dirac_rev"])
+        return sweep
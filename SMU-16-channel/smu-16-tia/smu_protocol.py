@@ -0,0 +1,186 @@
+'''
+Experiment protocols for unattended Dirac-tracking runs.
+
+A protocol is a JSON file listing the phases of one experiment, e.g. the
+functionalization and analyte steps of
+"2026-03-18 w1d06 dirac-tracking pyrene-capped pos-neg-ctrl":
+
+    {
+        "device": "w1d06",
+        "description": "dirac-tracking pyrene-capped pos-neg-ctrl",
+        "output_dir": "../../Akinwande-lab-measurements/iv-curves/data_pcb_smu",   (optional)
+        "defaults": {"type": "dirac", "vmin": 0, "vmax": 1.0, "res": 500, "delay_ms": 1},
+        "phases": [
+            {"name": "func1", "label": "id", "max_sweeps": 20},
+            {"name": "func2", "label": "oligo", "prompt": "Add the oligos", "duration_min": 15},
+            {"name": "analyte1", "label": "1a", "wait_min": 30, "duration_min": 15,
+             "stable_dirac": {"sweeps": 5, "tol_v": 0.004}},
+            ...
+        ]
+    }
+
+The run folder is "<date> <device> <description>" inside output_dir (relative
+to the protocol file, asked for if missing; the date is today unless "date" is
+given) and every measured phase is saved there as "<name>-<device>-<label>.csv",
+the same convention as data_pcb_smu.
+
+Phase keys (defaults are merged into every phase)
+    type          "dirac"     repeated forward + reverse sweeps (Dirac tracking)
+                  "sweep"     a single forward + reverse sweep
+                  "timesweep" gate held at "vg" (see below)
+                  "wait"      no measurement, only wait_min / prompt
+    vmin, vmax, res, delay_ms   sweep settings, same limits as the GUI inputs
+    vg            gate voltage of a timesweep phase
+    wait_min      idle time before the phase starts (incubation)
+    prompt        message the operator has to confirm before the phase starts
+                  (e.g. "add 1aM analyte"), leave it out for unattended steps
+    Stop conditions of "dirac" / "timesweep" phases, the first one reached ends
+    the phase (checked after every completed sweep), at least one is required:
+    duration_min  measurement time
+    max_sweeps    number of sweeps
+    stable_dirac  {"sweeps": N, "tol_v": V}: forward Dirac points of every channel
+                  stayed within V over the last N sweeps
+
+The Dirac-tracking firmware only knows forward + reverse sweeps, so a timesweep
+phase runs back-to-back one-step sweeps from vg to vg + 1.5/res (3 points each,
+the firmware rounds the step count down to 1) and is saved with the
+Dirac-tracking schema.
+'''
+
+import datetime
+import json
+import os
+import time
+
+import numpy as np
+
+
+PHASE_TYPES = ("dirac", "sweep", "timesweep", "wait")
+STOP_KEYS = ("duration_min", "max_sweeps", "stable_dirac")
+
+
+def load_protocol(path):
+    '''Reads and validates a protocol file, raises ValueError with a readable message if it is wrong'''
+    with open(path) as f:
+        try:
+            protocol = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path} is not valid JSON: {e}")
+
+    for key in ("device", "description", "phases"):
+        if key not in protocol:
+            raise ValueError(f"Protocol is missing '{key}'")
+    if not protocol["phases"]:
+        raise ValueError("Protocol has no phases")
+
+    defaults = protocol.get("defaults", {})
+    phases = []
+    for i, phase in enumerate(protocol["phases"]):
+        phase = {**defaults, **phase}
+        phase.setdefault("type", "dirac")
+        check_phase(phase, i)
+        phases.append(phase)
+    protocol["phases"] = phases
+    protocol.setdefault("date", datetime.date.today().isoformat())
+
+    # relative output folders are relative to the protocol file
+    if protocol.get("output_dir"):
+        protocol["output_dir"] = os.path.join(os.path.dirname(os.path.abspath(path)), protocol["output_dir"])
+    return protocol
+
+
+def check_phase(phase, i):
+    where = f"Phase {i} ({phase.get('name', '?')})"
+    if phase["type"] not in PHASE_TYPES:
+        raise ValueError(f"{where}: type must be one of {PHASE_TYPES}")
+    if phase["type"] == "wait":
+        return
+    for key in ("name", "label"):
+        if key not in phase:
+            raise ValueError(f"{where}: measured phases need a '{key}' for the file name")
+    keys = ("vg", "res", "delay_ms") if phase["type"] == "timesweep" else ("vmin", "vmax", "res", "delay_ms")
+    for key in keys:
+        if not isinstance(phase.get(key), (int, float)):
+            raise ValueError(f"{where}: '{key}' must be a number")
+    if phase["type"] == "timesweep":
+        vmin, vmax = phase_sweep_args(phase)[:2]
+    else:
+        vmin, vmax = phase["vmin"], phase["vmax"]
+    if vmin < -1.5 or vmax > 1.5 or vmin >= vmax:
+        raise ValueError(f"{where}: gate voltages must satisfy -1.5 <= min < max <= 1.5")
+    if not 0 < phase["delay_ms"] <= 5000:
+        raise ValueError(f"{where}: delay_ms must be between 0 and 5000 ms")
+    if not 10 < phase["res"] <= 2000:
+        raise ValueError(f"{where}: res must be between 10 and 2000 points/V")
+    if phase["type"] != "sweep" and not any(key in phase for key in STOP_KEYS):
+        raise ValueError(f"{where}: needs a stop condition, one of {STOP_KEYS}")
+
+
+def run_folder(protocol, base_dir):
+    return os.path.join(base_dir, f"{protocol['date']} {protocol['device']} {protocol['description']}")
+
+
+def phase_filename(protocol, phase):
+    return f"{phase['name']}-{protocol['device']}-{phase['label']}.csv"
+
+
+def phase_csv_path(protocol, phase, base_dir):
+    '''Path of the phase CSV, never overwrites: a rerun gets "-2", "-3", ... appended'''
+    path = os.path.join(run_folder(protocol, base_dir), phase_filename(protocol, phase))
+    stem, ext = os.path.splitext(path)
+    n = 2
+    while os.path.exists(path):
+        path = f"{stem}-{n}{ext}"
+        n += 1
+    return path
+
+
+def phase_sweep_args(phase):
+    '''(vmin, vmax, delay_ms, res) of the firmware "start" command for this phase'''
+    if phase["type"] == "timesweep":
+        return phase["vg"], phase["vg"] + 1.5 / phase["res"], phase["delay_ms"], phase["res"]
+    return phase["vmin"], phase["vmax"], phase["delay_ms"], phase["res"]
+
+
+class PhaseMonitor:
+    '''Keeps track of one running phase and decides when it is finished'''
+    def __init__(self, phase):
+        self.phase = phase
+        self.start_time = time.time()
+        self.n_sweeps = 0
+        self.dirac_history = []
+
+    def add_sweep(self, dirac_fwd):
+        self.n_sweeps += 1
+        self.dirac_history.append(np.asarray(dirac_fwd, dtype=float))
+        stable = self.phase.get("stable_dirac")
+        if stable:
+            self.dirac_history = self.dirac_history[-stable["sweeps"]:]
+
+    def finished(self):
+        '''Reason the phase is over, or None while it should keep sweeping'''
+        phase = self.phase
+        if phase["type"] == "sweep" and self.n_sweeps >= 1:
+            return "single sweep done"
+        if "max_sweeps" in phase and self.n_sweeps >= phase["max_sweeps"]:
+            return f"{self.n_sweeps} sweeps done"
+        if "duration_min" in phase and time.time() - self.start_time >= 60 * phase["duration_min"]:
+            return f"{phase['duration_min']} min elapsed"
+        stable = phase.get("stable_dirac")
+        if stable and len(self.dirac_history) >= stable["sweeps"]:
+            spread = np.ptp(np.array(self.dirac_history), axis=0)
+            if np.nanmax(spread) <= stable["tol_v"]:
+                return f"Dirac points stable within {stable['tol_v']} V over {stable['sweeps']} sweeps"
+        return None
+
+
+def describe(protocol):
+    '''One line per phase, for printing before a run starts'''
+    lines = [f"{protocol['date']} {protocol['device']} {protocol['description']}"]
+    for phase in protocol["phases"]:
+        name = phase_filename(protocol, phase) if phase["type"] != "wait" else "(wait)"
+        notes = [f"wait {phase['wait_min']} min"] if phase.get("wait_min") else []
+        notes += [f"{k}={phase[k]}" for k in STOP_KEYS if k in phase]
+        notes += ["prompt"] if phase.get("prompt") else []
+        lines.append(f"  {phase['type']:9s} {name:28s} {', '.join(notes)}")
+    return "\n".join(lines)
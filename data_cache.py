@@ -0,0 +1,329 @@
+'''
+On-disk cache of parsed measurement files.
+
+Parsing the ASCII data files (np.loadtxt on the BC .txt files, np.genfromtxt in
+the quickiv notebooks, pd.read_csv on the pcb_smu CSVs, np.loadtxt in the Raman
+notebook) is repeated on every kernel restart. The functions here parse a file
+once, store the result as a .npy file in CACHE_DIR and afterwards return it as
+a read-only memory map, which costs almost nothing.
+
+Drop-in replacements, same arguments as the originals:
+    import data_cache
+    data = data_cache.loadtxt(path, skiprows=1)
+    data = data_cache.genfromtxt(path, delimiter=",", skip_header=1)
+    df = data_cache.read_csv(path)
+
+A cache entry is keyed by the absolute path, size and mtime of the file plus the
+parser and its options, so editing or replacing a data file (or changing e.g.
+skiprows) is never served stale. When the cache grows past MAX_CACHE_BYTES the
+least recently used entries are deleted.
+
+The cache folder is outside the data tree (~/.cache/gfet-covid-flu) unless the
+GFET_DATA_CACHE environment variable points somewhere else; GFET_DATA_CACHE=off
+disables caching. Returned arrays are read-only, copy them (np.array(data))
+before editing in place.
+
+Results of deterministic analysis functions are memoized the same way with the
+memoize decorator: the key is a content hash of the arguments (array bytes, not
+file names), of the function's code and of the source of its module, the result is pickled to
+CACHE_DIR/results. GFET_RESULT_CACHE=off disables only this part.
+
+    @data_cache.memoize(ignore=("processes",))
+    def bootstrap(data, n_boot, seed, processes=None): ...
+
+    python data_cache.py --info     size and number of entries
+    python data_cache.py --clear    delete all entries
+'''
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import sys
+
+import numpy as np
+
+
+CACHE_DIR = os.environ.get("GFET_DATA_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "gfet-covid-flu"))
+ENABLED = CACHE_DIR.lower() != "off"
+MAX_CACHE_BYTES = 2 * 1024**3  # LRU eviction above this total size
+RESULTS_DIR = os.path.join(CACHE_DIR, "results")
+RESULTS_ENABLED = ENABLED and os.environ.get("GFET_RESULT_CACHE", "").lower() != "off"
+MAX_RESULT_BYTES = 512 * 1024**2
+
+
+def cache_key(path, parser_name, options):
+    '''Hex key of a parsed file, changes whenever the file or the parse options change'''
+    st = os.stat(path)
+    ident = [os.path.abspath(path), st.st_size, st.st_mtime_ns, parser_name, sorted((k, repr(v)) for k, v in options.items())]
+    return hashlib.sha1(repr(ident).encode()).hexdigest()
+
+
+def cached_array(path, parser, parser_name=None, mmap=True, **options):
+    '''
+    Returns parser(path, **options), from the cache if this file was parsed before with the same options.
+
+    parser: function that reads a file into a numpy array (e.g. np.loadtxt)
+    parser_name: part of the key, defaults to the parser's module and name
+    mmap: return a read-only memory map instead of loading the array into memory
+    '''
+    if not ENABLED:
+        return parser(path, **options)
+    parser_name = parser_name or f"{parser.__module__}.{parser.__qualname__}"
+    npy_path = os.path.join(CACHE_DIR, cache_key(path, parser_name, options) + ".npy")
+
+    if os.path.exists(npy_path):
+        try:
+            data = np.load(npy_path, mmap_mode="r" if mmap else None)
+            os.utime(npy_path)  # mtime of the entry is its last use, for the LRU eviction
+            return data
+        except (OSError, ValueError):
+            remove_entry(npy_path)  # truncated or unreadable entry, parse again
+
+    data = np.asarray(parser(path, **options))
+    if data.dtype == object:
+        return data  # object arrays cannot be memory mapped, not cached
+    try:
+        write_entry(npy_path, data)
+    except OSError as e:
+        print(f"data_cache: could not write {npy_path}: {e}")
+        return data
+    evict()
+    return np.load(npy_path, mmap_mode="r") if mmap else data
+
+
+def loadtxt(path, **options):
+    return cached_array(path, np.loadtxt, "np.loadtxt", **options)
+
+
+def genfromtxt(path, **options):
+    return cached_array(path, np.genfromtxt, "np.genfromtxt", **options)
+
+
+def read_csv(path, **options):
+    '''
+    pd.read_csv with the cache, for files with only numeric columns (like the pcb_smu CSVs).
+    Other files are parsed normally every time.
+    '''
+    import pandas as pd
+
+    if not ENABLED:
+        return pd.read_csv(path, **options)
+    key = cache_key(path, "pd.read_csv", options)
+    npy_path = os.path.join(CACHE_DIR, key + ".npy")
+    columns_path = os.path.join(CACHE_DIR, key + ".json")
+
+    if os.path.exists(npy_path) and os.path.exists(columns_path):
+        try:
+            with open(columns_path) as f:
+                columns = json.load(f)
+            values = np.load(npy_path, mmap_mode="r")
+            os.utime(npy_path)
+            return pd.DataFrame(values, columns=columns, copy=False)
+        except (OSError, ValueError):
+            remove_entry(npy_path)
+
+    df = pd.read_csv(path, **options)
+    if not all(pd.api.types.is_numeric_dtype(dtype) for dtype in df.dtypes):
+        return df
+    try:
+        write_entry(npy_path, df.to_numpy(dtype=float))
+        with open(columns_path, "w") as f:
+            json.dump([str(c) for c in df.columns], f)
+    except OSError as e:
+        print(f"data_cache: could not write {npy_path}: {e}")
+        return df
+    evict()
+    return df
+
+
+def write_entry(npy_path, data):
+    # write to a temporary file first, so a crash never leaves a half written entry behind
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{npy_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, data)
+    os.replace(tmp_path, npy_path)
+
+
+def remove_entry(npy_path):
+    for path in (npy_path, os.path.splitext(npy_path)[0] + ".json"):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def entries(folder=None, suffix=".npy"):
+    '''(last use, size in bytes, path) of every cache entry in folder (CACHE_DIR), oldest first'''
+    folder = folder or CACHE_DIR
+    if not os.path.isdir(folder):
+        return []
+    found = []
+    for name in os.listdir(folder):
+        if name.endswith(suffix):
+            path = os.path.join(folder, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            found.append((st.st_mtime, st.st_size, path))
+    return sorted(found)
+
+
+def evict(max_bytes=None, folder=None, suffix=".npy"):
+    '''Deletes least recently used entries until the folder (CACHE_DIR) holds at most max_bytes (MAX_CACHE_BYTES)'''
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    found = entries(folder, suffix)
+    total = sum(size for _, size, _ in found)
+    for _, size, path in found:
+        if total <= max_bytes:
+            break
+        remove_entry(path)
+        total -= size
+
+
+def clear():
+    evict(0)
+    evict(0, RESULTS_DIR, ".pkl")
+
+
+# -----------------------------
+# Memoized analysis results
+# -----------------------------
+class Unhashable(TypeError):
+    pass
+
+
+def feed_hash(h, obj):
+    '''Adds a content description of obj to the hash h, raises Unhashable for types it does not know'''
+    if hasattr(obj, "cache_token"):
+        h.update(type(obj).__qualname__.encode())
+        feed_hash(h, obj.cache_token())
+    elif isinstance(obj, np.ndarray) or isinstance(obj, np.generic):
+        obj = np.ascontiguousarray(obj)
+        h.update(f"nd{obj.dtype.str}{obj.shape}".encode())
+        if obj.dtype == object:
+            for item in obj.ravel():
+                feed_hash(h, item)
+        else:
+            h.update(obj.tobytes())
+    elif obj is None or isinstance(obj, (bool, int, float, complex, str, bytes)):
+        h.update(f"{type(obj).__name__}:{obj!r};".encode())
+    elif isinstance(obj, (list, tuple, range)):
+        h.update(f"{type(obj).__name__}[{len(obj)}".encode())
+        for item in obj:
+            feed_hash(h, item)
+        h.update(b"]")
+    elif isinstance(obj, dict):
+        h.update(f"dict[{len(obj)}".encode())
+        for key in sorted(obj, key=repr):
+            feed_hash(h, key)
+            feed_hash(h, obj[key])
+        h.update(b"]")
+    elif isinstance(obj, np.random.SeedSequence):
+        feed_hash(h, (obj.entropy, obj.spawn_key, obj.pool_size))
+    else:
+        raise Unhashable(f"cannot hash {type(obj).__name__}")
+
+
+def code_hash(h, code):
+    # bytecode and constants, nested functions included, so editing the function invalidates its results
+    h.update(code.co_code)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            code_hash(h, const)
+        else:
+            h.update(repr(const).encode())
+
+
+MODULE_HASHES = {} # (source path, mtime) -> hash, modules are read once per version
+
+
+def module_source_hash(module_name):
+    '''SHA-1 of a module's source file, None if it has none (functions defined in a notebook, builtins)'''
+    path = getattr(sys.modules.get(module_name), "__file__", None)
+    try:
+        key = (path, os.stat(path).st_mtime_ns)
+        if key not in MODULE_HASHES:
+            with open(path, "rb") as f:
+                MODULE_HASHES[key] = hashlib.sha1(f.read()).hexdigest()
+        return MODULE_HASHES[key]
+    except (OSError, TypeError):
+        return None
+
+
+def memoize(func=None, ignore=(), version=0):
+    '''
+    Decorator that keeps the results of a deterministic function on disk, keyed by a content hash
+
+    The key covers the arguments, the function's code and the source of the module defining it, so editing the
+    function or any helper next to it invalidates its results. Functions without a module source file (defined in
+    a notebook) are keyed by their own code only.
+
+    ignore: argument names left out of the key, for arguments that do not change the result (e.g. processes)
+    version: bump it when code in another module the function relies on changes
+
+    Arguments can be arrays, numbers, strings, lists / tuples / dicts of those and objects with a
+    cache_token() method (e.g. utils.Dataset); other arguments make the call run uncached. Exceptions are
+    not cached. The undecorated function is available as .uncached.
+    '''
+    if func is None:
+        return lambda func: memoize(func, ignore, version)
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not RESULTS_ENABLED:
+            return func(*args, **kwargs)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        h = hashlib.sha1(f"{func.__module__}.{func.__qualname__}:{version}".encode())
+        code_hash(h, func.__code__)
+        h.update(repr(module_source_hash(func.__module__)).encode())
+        try:
+            feed_hash(h, {name: value for name, value in bound.arguments.items() if name not in ignore})
+        except Unhashable:
+            return func(*args, **kwargs)
+        path = os.path.join(RESULTS_DIR, h.hexdigest() + ".pkl")
+
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    result = pickle.load(f)
+                os.utime(path)
+                return result
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+                remove_entry(path)
+
+        result = func(*args, **kwargs)
+        try:
+            os.makedirs(RESULTS_DIR, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            evict(MAX_RESULT_BYTES, RESULTS_DIR, ".pkl")
+        except (OSError, pickle.PicklingError, TypeError) as e:
+            print(f"data_cache: could not store result of {func.__qualname__}: {e}")
+        return result
+
+    wrapper.uncached = func
+    return wrapper
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Parsed-data cache of the measurement files")
+    parser.add_argument("--info", action="store_true", help="print size and number of entries")
+    parser.add_argument("--clear", action="store_true", help="delete all entries")
+    args = parser.parse_args()
+
+    if args.clear:
+        clear()
+    for folder, suffix in ((CACHE_DIR, ".npy"), (RESULTS_DIR, ".pkl")):
+        found = entries(folder, suffix)
+        print(f"{folder}: {len(found)} entries, {sum(size for _, size, _ in found) / 1024**2:.1f} MB")